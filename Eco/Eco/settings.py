@@ -44,11 +44,15 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "core.middleware.MetricsMiddleware",
+    "core.middleware.PrecompressedStaticMiddleware",
+    "core.middleware.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "core.middleware.VisitMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "core.middleware.ProfilingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -75,9 +79,170 @@ TEMPLATES = [
 
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'core' / 'static']
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# collectstatic writes content-hashed names plus .gz/.br siblings
+# (core/staticfiles.py); PrecompressedStaticMiddleware serves them with
+# far-future cache headers when DEBUG is off.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {
+        'BACKEND': ('django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+                    else 'core.staticfiles.CompressedManifestStaticFilesStorage'),
+    },
+}
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploads are hashed while they stream in, for the content-addressed
+# media storage (core/storage.py)
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'core.storage.HashingUploadHandler',
+]
+
+# Chunked PDF uploads (core/uploads.py); `manage.py cleanup_uploads` removes
+# uploads idle for longer than CHUNKED_UPLOAD_EXPIRY seconds
+CHUNKED_UPLOAD_DIR = BASE_DIR / 'tmp' / 'uploads'
+CHUNKED_UPLOAD_MAX_CHUNK = 8 * 1024 * 1024
+CHUNKED_UPLOAD_MAX_SIZE = 512 * 1024 * 1024
+CHUNKED_UPLOAD_EXPIRY = 24 * 60 * 60
+
+# PDF text extraction for paper search (`manage.py extract_paper_text`)
+PAPER_TEXT_WORKERS = 2
+PAPER_TEXT_MAX_CHARS = 2_000_000
+
+# Resized cover images (core/images.py)
+COVER_IMAGE_WIDTHS = (320, 640, 1280)
+IMAGE_VARIANT_WORKERS = 2
+IMAGE_VARIANTS_ASYNC = True  # False: resize inline when the article is saved
+
+# Response compression (core/compression.py): bodies smaller than this are
+# sent as-is; streaming responses are compressed chunk by chunk
+COMPRESSION_MIN_SIZE = 512
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 4
+COMPRESSION_MAX_RANDOM_BYTES = 100  # BREACH padding in each gzip header
+
+# Cache for rendered feeds (core/feeds.py). The local-memory cache is per
+# process; with several workers use a shared backend (Redis, memcached) so
+# publishing invalidates the feeds everywhere.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ecoinsight',
+    }
+}
+FEED_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Article revision history (core/revisions.py): a full snapshot every N
+# revisions bounds rebuild cost; `manage.py prune_revisions` applies the
+# retention policy (newest KEEP per article, and nothing older than MAX_AGE_DAYS)
+ARTICLE_REVISION_SNAPSHOT_INTERVAL = 20
+ARTICLE_REVISIONS_KEEP = 100
+ARTICLE_REVISIONS_MAX_AGE_DAYS = None
+
+# Serve the index, article, search and track-visit pages with the async views
+# in core/async_views.py. Turn on when running under ASGI (uvicorn/daphne
+# Eco.asgi:application); under WSGI the sync views are cheaper.
+ASYNC_VIEWS = os.environ.get('ECO_ASYNC_VIEWS') == '1'
+
+# Metrics (core/metrics.py), scraped from /metrics by Prometheus. With several
+# worker processes point METRICS_DIR at a directory they share (e.g. on
+# tmpfs) so the endpoint reports all of them; None keeps metrics per process.
+METRICS_DIR = None
+METRICS_FLUSH_INTERVAL = 1.0  # seconds between a worker's file writes
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')  # others need a staff login
+
+# Rate limits (core/ratelimit.py): token buckets per client and route group;
+# `rate` is tokens per second, `burst` the bucket size. track_visit is polled
+# once a second by every open page, so its per-session budget sits above that;
+# the per-address bucket stops one client minting sessions to get around it.
+RATELIMIT_ENABLED = True
+RATELIMIT_BACKEND = 'memory'  # 'cache': share buckets between workers via RATELIMIT_CACHE
+RATELIMIT_CACHE = 'default'
+RATELIMIT_TRUSTED_PROXIES = 0  # reverse proxies in front adding X-Forwarded-For
+RATELIMITS = {
+    'track_visit': [
+        {'key': 'session', 'rate': 2, 'burst': 10},
+        {'key': 'ip', 'rate': 20, 'burst': 60},
+    ],
+    'search': [
+        {'key': 'ip', 'rate': 1, 'burst': 20},
+    ],
+    # one request per keystroke (debounced in base.html)
+    'suggest': [
+        {'key': 'ip', 'rate': 10, 'burst': 40},
+    ],
+    # added on top of 'track_visit' while shedding load
+    'track_visit:shedding': [
+        {'key': 'session', 'rate': 0.1, 'burst': 1},
+    ],
+}
+
+# Task queue (core/tasks.py): contact and password-reset mail is queued and
+# sent by `manage.py run_tasks`. Workers take lanes in TASK_LANES order; a
+# failed job is retried with backoff from TASK_RETRY_BASE seconds up to
+# TASK_RETRY_MAX, and after TASK_MAX_ATTEMPTS goes to the dead letters.
+# TASKS_EAGER runs jobs inside the request instead (no worker needed).
+TASKS_EAGER = False
+TASK_LANES = ('high', 'default', 'low')
+TASK_LEASE_SECONDS = 300  # a claimed job is given back if not finished by then
+TASK_MAX_ATTEMPTS = 5
+TASK_RETRY_BASE = 10
+TASK_RETRY_MAX = 3600
+
+# Trending articles (core/trending.py): a view counts half as much after
+# TRENDING_HALF_LIFE seconds. Views are buffered per worker and written every
+# TRENDING_FLUSH_INTERVAL seconds; the top TRENDING_SIZE list is cached for
+# TRENDING_CACHE_TIMEOUT seconds.
+TRENDING_HALF_LIFE = 12 * 3600
+TRENDING_FLUSH_INTERVAL = 10.0
+TRENDING_SIZE = 10
+TRENDING_CACHE_TIMEOUT = 60
+
+# Related reading (core/related.py): neighbours kept per article and terms
+# kept per TF-IDF vector; terms found in more than RELATED_MAX_DOCS articles
+# are too common to tell articles apart and are left out. Kept current by the
+# core.update_related task; run `manage.py build_related` nightly to rebuild
+# from scratch.
+RELATED_ARTICLES = 5
+RELATED_MAX_TERMS = 100
+RELATED_MAX_DOCS = 200
+
+# Search typeahead (core/suggest.py): each worker keeps a prefix index of
+# titles, tags and authors in memory, updated as articles change and rebuilt
+# in a background thread every SUGGEST_MAX_AGE seconds to pick up view counts.
+# Changes reach other workers through the default cache: with the per-process
+# LocMemCache above they only see them at their next rebuild, so with several
+# workers use a shared backend.
+SUGGEST_LIMIT = 8
+SUGGEST_MAX_AGE = 300
+
+# Load shedding (core/loadshed.py): past these thresholds a worker stops
+# counting visits, serves the search filters and visit counters from the last
+# cached values and throttles track_visit harder, until things calm down.
+LOADSHED_ENABLED = True
+LOADSHED_LATENCY_HIGH = 1.0  # p95 seconds over the recent requests
+LOADSHED_LATENCY_LOW = 0.4
+LOADSHED_QUEUE_HIGH = 32  # requests in flight in one worker
+LOADSHED_QUEUE_LOW = 8
+LOADSHED_RECOVERY_SECONDS = 30.0  # calm this long before stopping
+
+# Sampling profiler for live requests (core/profiling.py, staff page at
+# /profiling/). Off by default; when enabled, profiles this fraction of
+# requests plus any staff request sending the PROFILER_HEADER header.
+PROFILER_ENABLED = False
+PROFILER_SAMPLE_RATE = 0.0
+PROFILER_HEADER = 'X-Profile'
+PROFILER_INTERVAL = 0.005  # seconds between stack samples
+
+# Attachment/PDF downloads (core/downloads.py). Set to 'x-sendfile' (Apache,
+# lighttpd) or 'x-accel-redirect' (nginx) to let the front server send files;
+# for nginx map SENDFILE_URL_PREFIX to MEDIA_ROOT as an `internal` location.
+SENDFILE_BACKEND = None
+SENDFILE_URL_PREFIX = '/protected-media/'
+
 # Authentication
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
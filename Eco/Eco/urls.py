@@ -19,10 +19,16 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from django.contrib.auth import views as auth_views
+from core.forms import QueuedPasswordResetForm
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path('', include('core.urls')),
+    # same view as in django.contrib.auth.urls, but the email goes through the task queue
+    path('accounts/password_reset/',
+         auth_views.PasswordResetView.as_view(form_class=QueuedPasswordResetForm),
+         name='password_reset'),
     path('accounts/', include('django.contrib.auth.urls')),  # login/logout/password reset
 ]
 
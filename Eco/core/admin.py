@@ -1,6 +1,205 @@
-from django.contrib import admin
-from .models import User, Article, ResearchPaper
+from datetime import datetime, time, timedelta
+
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import PAGE_VAR
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.http import QueryDict
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+from .models import User, Article, ResearchPaper, Visit, VisitDailyRollup, Task, DeadTask
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from .exports import EXPORTS, export_response
+from .search import ARTICLE_INDEX, PAPER_INDEX, match_expression
+
+# filtered changelists count at most this many rows (or this many pages past
+# the one being viewed, whichever is more)
+COUNT_CAP = 10_000
+COUNT_PAGES_AHEAD = 10
+
+
+def export_action(dataset, fmt):
+    """Admin action streaming the selected rows (respecting the changelist filters) as `fmt`."""
+    def action(modeladmin, request, queryset):
+        return export_response(EXPORTS[dataset], queryset, fmt)
+    action.__name__ = f'export_{dataset}_{fmt}'
+    action.short_description = f'Export selected as {fmt.upper()}'
+    return action
+
+
+def estimated_row_count(model):
+    """Cheap row estimate for a whole table, or None if the database can't give one."""
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+            row = cursor.fetchone()
+            return row[0] if row and row[0] >= 0 else None
+        if connection.vendor == 'sqlite':
+            # ANALYZE statistics if present, else the highest rowid (an index lookup)
+            row = None
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone():
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+                row = cursor.fetchone()
+            if row and row[0]:
+                return int(str(row[0]).split()[0])
+            cursor.execute(f'SELECT MAX(rowid) FROM "{table}"')
+            return cursor.fetchone()[0] or 0
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Changelist paginator without a full COUNT(*): unfiltered lists use the
+    table estimate, filtered ones count at most COUNT_CAP rows, or up to
+    COUNT_PAGES_AHEAD pages past `page` so that paging on keeps working.
+    `capped` tells the changelist to show the count as a lower bound.
+    """
+
+    def __init__(self, *args, page=1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.page_hint = page
+        self.capped = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model)
+            if estimate is not None:
+                return estimate
+        limit = max(COUNT_CAP, (self.page_hint + COUNT_PAGES_AHEAD) * self.per_page)
+        found = queryset.order_by()[:limit + 1].count()
+        self.capped = found > limit
+        return min(found, limit)
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """
+    Changelists for big tables: estimated counts, heavy columns deferred on
+    the list only, and search through a full-text index when one exists.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    list_defer = ()
+    search_index = None
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        try:
+            page = max(int(request.GET.get(PAGE_VAR, 1)), 1)
+        except ValueError:
+            page = 1
+        return self.paginator(queryset, per_page, orphans, allow_empty_first_page, page=page)
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        match = getattr(request, 'resolver_match', None)
+        if self.list_defer and match and match.url_name and match.url_name.endswith('_changelist'):
+            queryset = queryset.defer(*self.list_defer)
+        return queryset
+
+    def get_search_results(self, request, queryset, search_term):
+        index = self.search_index
+        if search_term and index is not None and index.available():
+            match = match_expression(search_term)
+            if match:
+                ids = RawSQL(f"SELECT rowid FROM {index.table} WHERE {index.table} MATCH %s", [match])
+                return queryset.filter(pk__in=ids), False
+        return super().get_search_results(request, queryset, search_term)
+
+
+def _parse_day(value):
+    try:
+        return parse_date(value or '')
+    except ValueError:
+        # well formed but impossible (2024-02-30): ignored like any bad value
+        return None
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def recent_date_filter(field, title='date'):
+    """
+    List filter for recent periods, one day (?<field>_day=YYYY-MM-DD) or a
+    range (?<field>_from=&<field>_to=, both inclusive, either optional) that
+    stays on the date index. The export actions get the filtered rows.
+    """
+
+    class RecentDateFilter(admin.SimpleListFilter):
+        parameter_name = f'{field}_day'
+        range_parameters = (f'{field}_from', f'{field}_to')
+        periods = {'today': 0, '7d': 6, '30d': 29, '365d': 364}
+        template = 'admin/core/date_range_filter.html'
+
+        def __init__(self, request, params, model, model_admin):
+            super().__init__(request, params, model, model_admin)
+            for name in self.range_parameters:
+                if name in params:
+                    self.used_parameters[name] = params.pop(name)[-1]
+
+        def expected_parameters(self):
+            return [self.parameter_name, *self.range_parameters]
+
+        def lookups(self, request, model_admin):
+            return [('today', 'Today'), ('7d', 'Past 7 days'), ('30d', 'Past 30 days'), ('365d', 'Past year')]
+
+        def range_values(self):
+            return [self.used_parameters.get(name, '') for name in self.range_parameters]
+
+        def choices(self, changelist):
+            # the range form keeps the other filters, the search and the ordering
+            others = changelist.get_query_string(remove=self.expected_parameters())
+            self.hidden_parameters = list(QueryDict(others.lstrip('?')).items())
+            ranged = any(self.range_values())
+            lookups = [None] + [lookup for lookup, _ in self.lookup_choices]
+            for lookup, choice in zip(lookups, super().choices(changelist)):
+                # a preset or "All" replaces the range
+                if lookup is None:
+                    choice['query_string'] = changelist.get_query_string(remove=self.expected_parameters())
+                else:
+                    choice['query_string'] = changelist.get_query_string(
+                        {self.parameter_name: lookup}, remove=self.range_parameters)
+                if ranged:
+                    choice['selected'] = False
+                yield choice
+
+        def _range(self, queryset, is_date):
+            start, end = (_parse_day(value) for value in self.range_values())
+            if start:
+                queryset = queryset.filter(**{f'{field}__gte': start if is_date else _day_start(start)})
+            if end:
+                end += timedelta(days=1)
+                queryset = queryset.filter(**{f'{field}__lt': end if is_date else _day_start(end)})
+            return queryset
+
+        def queryset(self, request, queryset):
+            is_date = queryset.model._meta.get_field(field).get_internal_type() == 'DateField'
+            queryset = self._range(queryset, is_date)
+            value = self.value()
+            if not value:
+                return queryset
+            if value in self.periods:
+                start = timezone.now().date() - timedelta(days=self.periods[value])
+                return queryset.filter(**{f'{field}__gte': start if is_date else _day_start(start)})
+            day = _parse_day(value)
+            if day is None:
+                return queryset
+            if is_date:
+                return queryset.filter(**{field: day})
+            return queryset.filter(**{f'{field}__gte': _day_start(day),
+                                      f'{field}__lt': _day_start(day + timedelta(days=1))})
+
+    RecentDateFilter.title = title
+    return RecentDateFilter
+
 
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
@@ -9,12 +208,123 @@ class UserAdmin(BaseUserAdmin):
     )
 
 @admin.register(Article)
-class ArticleAdmin(admin.ModelAdmin):
+class ArticleAdmin(ScalableAdmin):
     list_display = ('title', 'author', 'published', 'publish_date')
+    list_select_related = ('author',)
+    list_defer = ('content', 'summary', 'cover_variants')
     prepopulated_fields = {"slug": ("title",)}
-    search_fields = ('title', 'content', 'summary', 'tags')
+    # fallback when the FTS table is missing (see rebuild_search_index)
+    search_fields = ('title', 'slug')
+    search_index = ARTICLE_INDEX
+    list_filter = ('published', recent_date_filter('publish_date', 'published'))
+    raw_id_fields = ('author',)
+    actions = ['publish_selected', 'unpublish_selected',
+               export_action('articles', 'csv'), export_action('articles', 'ndjson')]
+
+    @admin.action(description='Publish selected articles')
+    def publish_selected(self, request, queryset):
+        self._set_published(request, queryset, True)
+
+    @admin.action(description='Unpublish selected articles')
+    def unpublish_selected(self, request, queryset):
+        self._set_published(request, queryset, False)
+
+    def _set_published(self, request, queryset, published):
+        changing = queryset.exclude(published=published)
+        # what the feeds need to know, collected before the rows change
+        affected = list(changing.order_by().values_list('tags', 'author_id').distinct())
+        changed_ids = list(changing.order_by().values_list('pk', flat=True))
+        updated = changing.update(published=published)
+        if updated:
+            from .related import schedule_updates
+            schedule_updates(changed_ids)
+            from .feeds import invalidate_article_feeds
+            tags = set()
+            for tag_string, _ in affected:
+                tags.update((tag_string or '').split(','))
+            invalidate_article_feeds(tags, {author_id for _, author_id in affected})
+        state = 'published' if published else 'unpublished'
+        self.message_user(request, f'{updated} article(s) {state}.', messages.SUCCESS)
 
 @admin.register(ResearchPaper)
-class ResearchPaperAdmin(admin.ModelAdmin):
+class ResearchPaperAdmin(ScalableAdmin):
     list_display = ('title', 'uploaded_by', 'published', 'created_at')
+    list_select_related = ('uploaded_by',)
+    list_defer = ('content', 'abstract')
     prepopulated_fields = {"slug": ("title",)}
+    search_fields = ('title', 'slug')
+    search_index = PAPER_INDEX
+    list_filter = ('published',)
+    raw_id_fields = ('uploaded_by',)
+    actions = ['publish_selected', 'unpublish_selected']
+
+    @admin.action(description='Publish selected papers')
+    def publish_selected(self, request, queryset):
+        updated = queryset.exclude(published=True).update(published=True)
+        self.message_user(request, f'{updated} paper(s) published.', messages.SUCCESS)
+
+    @admin.action(description='Unpublish selected papers')
+    def unpublish_selected(self, request, queryset):
+        updated = queryset.exclude(published=False).update(published=False)
+        self.message_user(request, f'{updated} paper(s) unpublished.', messages.SUCCESS)
+
+@admin.register(Visit)
+class VisitAdmin(ScalableAdmin):
+    """Raw per-visitor rows; browse by day through the rollups below."""
+    list_display = ('date', 'user', 'session_key', 'count', 'last_seen')
+    list_select_related = ('user',)
+    list_filter = (recent_date_filter('date'),)
+    raw_id_fields = ('user',)
+    actions = [export_action('visits', 'csv'), export_action('visits', 'ndjson')]
+
+@admin.register(VisitDailyRollup)
+class VisitDailyRollupAdmin(admin.ModelAdmin):
+    """Per-day totals (`manage.py rollup_visits`); cheap to drill through by date."""
+    list_display = ('date', 'visits', 'visitors', 'users', 'visit_rows', 'updated_at')
+    date_hierarchy = 'date'
+    actions = ['recompute']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='Rows')
+    def visit_rows(self, obj):
+        url = reverse('admin:core_visit_changelist') + f'?date_day={obj.date.isoformat()}'
+        return format_html('<a href="{}">view visits</a>', url)
+
+    @admin.action(description='Recompute selected days from Visit')
+    def recompute(self, request, queryset):
+        from .rollups import rollup_visits
+        dates = list(queryset.values_list('date', flat=True))
+        if dates:
+            rollup_visits(min(dates), max(dates))
+        self.message_user(request, f'Recomputed {len(dates)} day(s).', messages.SUCCESS)
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    """Jobs waiting for `manage.py run_tasks` (core/tasks.py)."""
+    list_display = ('name', 'lane', 'status', 'run_at', 'attempts', 'max_attempts', 'claimed_by')
+    list_filter = ('lane', 'status')
+    readonly_fields = ('claimed_by', 'locked_until', 'last_error', 'created_at')
+
+
+@admin.register(DeadTask)
+class DeadTaskAdmin(admin.ModelAdmin):
+    """Jobs that used up their attempts; fix the cause, then requeue them."""
+    list_display = ('name', 'lane', 'attempts', 'failed_at')
+    list_filter = ('lane', 'name')
+    readonly_fields = ('name', 'payload', 'lane', 'attempts', 'last_error', 'created_at', 'failed_at')
+    actions = ['requeue']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Requeue selected jobs')
+    def requeue(self, request, queryset):
+        from .tasks import requeue
+        count = requeue(queryset)
+        self.message_user(request, f'Requeued {count} job(s).', messages.SUCCESS)
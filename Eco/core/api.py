@@ -0,0 +1,338 @@
+# core/api.py
+"""
+Read-only JSON API.
+
+  GET /api/articles/              published articles, newest first
+  GET /api/articles/<slug>/       one article (includes `content`)
+  GET /api/papers/                published research papers, newest first
+  GET /api/search/?q=...          merged article + paper search (core/search.py)
+  GET /api/trending/              most viewed articles lately (core/trending.py)
+
+Common query parameters:
+  fields=title,slug,...   sparse fieldset; columns not asked for are not
+                          selected (list endpoints leave out `content`
+                          unless requested)
+  ids=3,5,8               batch fetch by id (list endpoints, max MAX_LIMIT)
+  limit=N                 page size (default DEFAULT_LIMIT, max MAX_LIMIT)
+  cursor=...              opaque token from the previous page's `next`
+
+Lists use keyset pagination on (date, id), so deep pages cost the same as
+the first one. Rows are serialized straight from values() dicts. Every
+response carries an ETag and answers If-None-Match with 304.
+"""
+import base64
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.urls import reverse
+from django.utils.dateparse import parse_datetime
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_GET
+
+from .models import Article, ResearchPaper
+from .ratelimit import ratelimit
+from .search import unified_search
+from . import trending
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+class ApiError(Exception):
+    pass
+
+
+# ---------------------------------------------------------------------------
+# Cursors
+# ---------------------------------------------------------------------------
+
+def encode_cursor(values):
+    raw = json.dumps(values, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ApiError('invalid cursor')
+    if not isinstance(values, list):
+        raise ApiError('invalid cursor')
+    return values
+
+
+# ---------------------------------------------------------------------------
+# Resources
+# ---------------------------------------------------------------------------
+
+def _split_tags(value):
+    return [t.strip() for t in (value or '').split(',') if t.strip()]
+
+
+class Resource:
+    """
+    Field map for one model: API field -> values() column, plus optional
+    per-field transforms applied to the column value.
+    """
+
+    def __init__(self, model, date_field, fields, default_fields, detail_url, transforms=None):
+        self.model = model
+        self.date_field = date_field
+        self.fields = fields
+        self.default_fields = default_fields
+        self.detail_url = detail_url
+        self.transforms = transforms or {}
+
+    def queryset(self):
+        return self.model.objects.filter(published=True).order_by()
+
+    def parse_fields(self, param, default=None):
+        if not param:
+            return list(default or self.default_fields)
+        requested = [f.strip() for f in param.split(',') if f.strip()]
+        unknown = [f for f in requested if f not in self.fields]
+        if unknown:
+            raise ApiError('unknown field(s): %s (available: %s)' % (
+                ', '.join(unknown), ', '.join(self.fields)))
+        return requested
+
+    def columns(self, fields):
+        # id and date always come along: they are the cursor
+        columns = {'id', self.date_field}
+        columns.update(self.fields[f] for f in fields)
+        return sorted(columns)
+
+    def serializer(self, fields):
+        """Returns a function turning a values() row into the API dict."""
+        url_template = reverse(self.detail_url, args=['__slug__']) if 'url' in fields else None
+        plan = []
+        for field in fields:
+            column = self.fields[field]
+            if field == 'url':
+                plan.append((field, column, lambda slug: url_template.replace('__slug__', slug)))
+            else:
+                plan.append((field, column, self.transforms.get(field)))
+
+        def serialize(row):
+            out = {}
+            for field, column, transform in plan:
+                value = row[column]
+                out[field] = transform(value) if transform and value is not None else value
+            return out
+        return serialize
+
+
+def _file_url(field_name, model):
+    storage = model._meta.get_field(field_name).storage
+    return lambda name: storage.url(name) if name else None
+
+
+ARTICLES = Resource(
+    Article, 'publish_date',
+    fields={
+        'id': 'id', 'slug': 'slug', 'title': 'title', 'summary': 'summary', 'content': 'content',
+        'author': 'author__username', 'tags': 'tags', 'publish_date': 'publish_date',
+        'updated_at': 'updated_at', 'cover_image': 'cover_image', 'url': 'slug',
+    },
+    default_fields=('id', 'slug', 'title', 'summary', 'author', 'tags', 'publish_date', 'url'),
+    detail_url='article_detail',
+    transforms={'tags': _split_tags, 'cover_image': _file_url('cover_image', Article)},
+)
+
+PAPERS = Resource(
+    ResearchPaper, 'created_at',
+    fields={
+        'id': 'id', 'slug': 'slug', 'title': 'title', 'abstract': 'abstract', 'content': 'content',
+        'authors': 'authors', 'uploaded_by': 'uploaded_by__username', 'created_at': 'created_at',
+        'pdf': 'pdf', 'url': 'slug',
+    },
+    default_fields=('id', 'slug', 'title', 'abstract', 'authors', 'created_at', 'pdf', 'url'),
+    detail_url='paper_detail',
+    transforms={'pdf': _file_url('pdf', ResearchPaper)},
+)
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError('limit must be an integer')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def _ids(request):
+    try:
+        ids = [int(v) for v in request.GET['ids'].split(',') if v.strip()]
+    except ValueError:
+        raise ApiError('ids must be comma-separated integers')
+    if len(ids) > MAX_LIMIT:
+        raise ApiError('at most %d ids per request' % MAX_LIMIT)
+    return ids
+
+
+def _next_url(request, cursor):
+    if cursor is None:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return request.build_absolute_uri(request.path + '?' + params.urlencode())
+
+
+def api_response(request, data, status=200):
+    """JSON response with an ETag over the body; If-None-Match -> 304."""
+    body = json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+    etag = '"%s"' % hashlib.md5(body).hexdigest()
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if status == 200 and if_none_match and etag in parse_etags(if_none_match):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, status=status, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=0, must-revalidate'
+    return response
+
+
+def _error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+def list_resource(request, resource, queryset):
+    """Keyset page (or ids batch) of `queryset` serialized with the requested fields."""
+    fields = resource.parse_fields(request.GET.get('fields'))
+    serialize = resource.serializer(fields)
+    columns = resource.columns(fields)
+
+    if 'ids' in request.GET:
+        ids = _ids(request)
+        rows = {row['id']: row for row in queryset.filter(pk__in=ids).values(*columns)}
+        # requested order; unknown or unpublished ids are left out
+        return {'results': [serialize(rows[pk]) for pk in ids if pk in rows], 'next': None}
+
+    limit = _limit(request)
+    date_field = resource.date_field
+    qs = queryset.order_by('-' + date_field, '-pk')
+    if request.GET.get('cursor'):
+        values = decode_cursor(request.GET['cursor'])
+        try:
+            date = parse_datetime(values[0]) if len(values) == 2 and isinstance(values[0], str) else None
+        except ValueError:
+            # well formed but not a real date, e.g. month 13
+            date = None
+        if date is None or not isinstance(values[1], int):
+            raise ApiError('invalid cursor')
+        qs = qs.filter(Q(**{date_field + '__lt': date}) | Q(**{date_field: date, 'pk__lt': values[1]}))
+
+    # one extra row tells whether there is a next page
+    rows = list(qs.values(*columns)[:limit + 1])
+    cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        # isoformat keeps microseconds (DjangoJSONEncoder would cut them to ms)
+        cursor = encode_cursor([rows[-1][date_field].isoformat(), rows[-1]['id']])
+    return {'results': [serialize(row) for row in rows], 'next': _next_url(request, cursor)}
+
+
+# ---------------------------------------------------------------------------
+# Views
+# ---------------------------------------------------------------------------
+
+@require_GET
+def article_list(request):
+    queryset = ARTICLES.queryset()
+    if request.GET.get('author'):
+        queryset = queryset.filter(author__username__iexact=request.GET['author'])
+    if request.GET.get('tag'):
+        queryset = queryset.filter(tags__icontains=request.GET['tag'])
+    try:
+        return api_response(request, list_resource(request, ARTICLES, queryset))
+    except ApiError as exc:
+        return _error(str(exc))
+
+
+@require_GET
+def article_detail(request, slug):
+    try:
+        fields = ARTICLES.parse_fields(request.GET.get('fields'), default=list(ARTICLES.default_fields) + ['content'])
+    except ApiError as exc:
+        return _error(str(exc))
+    row = ARTICLES.queryset().filter(slug=slug).values(*ARTICLES.columns(fields)).first()
+    if row is None:
+        return _error('not found', status=404)
+    return api_response(request, ARTICLES.serializer(fields)(row))
+
+
+@require_GET
+def paper_list(request):
+    try:
+        return api_response(request, list_resource(request, PAPERS, PAPERS.queryset()))
+    except ApiError as exc:
+        return _error(str(exc))
+
+
+SEARCH_FIELDS = {
+    'article': ('id', 'slug', 'title', 'summary', 'url'),
+    'paper': ('id', 'slug', 'title', 'abstract', 'url'),
+}
+
+
+@require_GET
+@ratelimit('search', json=True)
+def search(request):
+    """
+    Merged ranked search. The cursor is an opaque offset into the merged
+    stream; the merge only reads as far as the end of the requested page.
+    """
+    try:
+        limit = _limit(request)
+        offset = 0
+        if request.GET.get('cursor'):
+            values = decode_cursor(request.GET['cursor'])
+            if len(values) != 1 or not isinstance(values[0], int) or values[0] < 0:
+                raise ApiError('invalid cursor')
+            offset = values[0]
+    except ApiError as exc:
+        return _error(str(exc))
+
+    kinds = tuple(k for k in request.GET.get('kind', 'article,paper').split(',') if k in SEARCH_FIELDS)
+    results = unified_search(
+        query=request.GET.get('q', '').strip(),
+        author=request.GET.get('author', '').strip() or None,
+        tag=request.GET.get('tag', '').strip(),
+        kinds=kinds or tuple(SEARCH_FIELDS),
+    )
+    hits = results.hits(offset, offset + limit + 1)
+    cursor = encode_cursor([offset + limit]) if len(hits) > limit else None
+    hits = hits[:limit]
+
+    # one values() query per kind for the rows on this page
+    resources = {'article': ARTICLES, 'paper': PAPERS}
+    rows = {}
+    for kind, fields in SEARCH_FIELDS.items():
+        ids = [hit.pk for hit in hits if hit.kind == kind]
+        if ids:
+            resource = resources[kind]
+            serialize = resource.serializer(fields)
+            for row in resource.model.objects.filter(pk__in=ids).values(*resource.columns(fields)):
+                rows[kind, row['id']] = serialize(row)
+
+    items = []
+    for hit in hits:
+        row = rows.get((hit.kind, hit.pk))
+        if row is not None:
+            items.append(dict(row, kind=hit.kind, score=round(hit.score, 4), date=hit.date))
+    return api_response(request, {'results': items, 'next': _next_url(request, cursor)})
+
+
+@require_GET
+def trending_articles(request):
+    """The precomputed trending list, best first; `score` is the decayed view count."""
+    results = [dict(row, url=reverse('article_detail', args=[row['slug']])) for row in trending.top()]
+    return api_response(request, {'results': results})
@@ -0,0 +1,168 @@
+# core/async_views.py
+"""
+Async versions of the busiest pages, used instead of the ones in
+core/views.py when ASYNC_VIEWS is on (serving through Eco/asgi.py).
+
+They await the async ORM (aget, acount, aaggregate, async for) and the async
+session/user API, so a request waiting on the database does not hold a
+worker thread. Before rendering they call context_processors.aprepare() so
+the sync context processors have nothing left to query.
+
+search_view is the exception: the full-text search in core/search.py runs
+raw SQL, which has no async API, so its page is fetched in a thread.
+"""
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage, Paginator
+from django.db.models import F, Sum
+from django.http import Http404, JsonResponse
+from django.shortcuts import aget_object_or_404, render
+from django.utils import timezone
+from django.views import View
+from django.views.decorators.http import require_GET
+
+from . import loadshed, metrics, related, trending
+from .context_processors import aprepare
+from .models import Article, Visit
+from .ratelimit import ratelimit
+from .views import search_page
+
+MAX_RECENT = 10
+
+
+async def _today_visits(**filters):
+    return (await Visit.objects.filter(**filters).aaggregate(total=Sum('count')))['total'] or 0
+
+
+async def _today_total(today):
+    # see views.today_total
+    return await loadshed.astale(f'visits_today:{today}', lambda: _today_visits(date=today), 'visit_counters')
+
+
+class IndexView(View):
+    template_name = 'core/index.html'
+    paginate_by = 6
+
+    def get_queryset(self):
+        # author is shown on every card; load it here, lazy loads can't run in the event loop
+        return Article.objects.filter(published=True).select_related('author').order_by('-publish_date')
+
+    async def get(self, request, *args, **kwargs):
+        request.user = await request.auser()
+        queryset = self.get_queryset()
+
+        paginator = Paginator(queryset, self.paginate_by)
+        paginator.count = await queryset.acount()
+        page = request.GET.get('page') or 1
+        try:
+            number = paginator.num_pages if page == 'last' else int(page)
+            page_obj = paginator.page(number)
+        except (ValueError, InvalidPage):
+            raise Http404('Invalid page')
+        page_obj.object_list = [article async for article in page_obj.object_list]
+
+        today = timezone.now().date()
+        user_visits = 0
+        if loadshed.skip('visit_counters'):
+            user_visits = None
+        elif request.user.is_authenticated:
+            user_visits = await _today_visits(user=request.user, date=today)
+        context = {
+            'view': self,
+            'paginator': paginator,
+            'page_obj': page_obj,
+            'is_paginated': paginator.num_pages > 1,
+            'object_list': page_obj.object_list,
+            'articles': page_obj.object_list,
+            'total_visits_today': await _today_total(today),
+            'user_visits_today': user_visits,
+            'trending': await trending.atop(),
+        }
+        await aprepare(request)
+        return render(request, self.template_name, context)
+
+
+class ArticleDetailView(View):
+    template_name = 'core/article_detail.html'
+
+    async def get(self, request, slug, *args, **kwargs):
+        request.user = await request.auser()
+        article = await aget_object_or_404(Article.objects.select_related('author'), slug=slug)
+
+        # Safely update session-based recently viewed list
+        try:
+            recent = []
+            for item in await request.session.aget('recent_articles', []):
+                try:
+                    recent.append(int(item))
+                except Exception:
+                    continue
+            if article.pk in recent:
+                recent.remove(article.pk)
+            recent.insert(0, article.pk)
+            await request.session.aset('recent_articles', recent[:MAX_RECENT])
+        except Exception:
+            # never break the page for analytics bugs
+            pass
+
+        try:
+            await trending.arecord_view(article.pk)
+        except Exception:
+            pass
+
+        try:
+            related_articles = [a async for a in related.for_article(article)]
+        except Exception:
+            related_articles = []
+
+        await aprepare(request)
+        return render(request, self.template_name, {'view': self, 'object': article, 'article': article,
+                                                    'related_articles': related_articles})
+
+
+@ratelimit('search')
+async def search_view(request):
+    q = request.GET.get('q', '').strip()
+    selected_author = request.GET.get('author', '').strip()
+    selected_tag = request.GET.get('tag', '').strip()
+    selected_category = request.GET.get('category', '').strip()
+
+    request.user = await request.auser()
+    page_obj = await sync_to_async(search_page)(
+        q, selected_author, selected_tag, selected_category, request.GET.get('page'))
+    await aprepare(request)
+    return render(request, 'core/search_results.html', {
+        'query': q,
+        'page_obj': page_obj,
+        'selected_author': selected_author,
+        'selected_tag': selected_tag,
+        'selected_category': selected_category,
+    })
+
+
+@require_GET
+@ratelimit('track_visit', json=True)
+async def track_visit(request):
+    """Async twin of core.views.track_visit: same JSON, same counting."""
+    now = timezone.now()
+    today = now.date()
+
+    user = await request.auser()
+    if user.is_authenticated:
+        lookup = {'user': user}
+    else:
+        # ensure session key exists for anonymous users
+        if not request.session.session_key:
+            await request.session.asave()
+        if not request.session.session_key:
+            return JsonResponse({"error": "no session"}, status=400)
+        lookup = {'session_key': request.session.session_key}
+
+    metrics.VISIT_WRITES.inc(source="track_visit")
+    visit_obj, created = await Visit.objects.aget_or_create(date=today, defaults={"count": 0}, **lookup)
+    await Visit.objects.filter(pk=visit_obj.pk).aupdate(count=F("count") + 1)
+    user_count = await Visit.objects.filter(pk=visit_obj.pk).values_list("count", flat=True).aget()
+
+    return JsonResponse({
+        "total_today": await _today_total(today),
+        "user_today": int(user_count),
+    })
@@ -0,0 +1,384 @@
+# core/bench.py
+"""
+Load-testing helpers: a bulk data seeder (`manage.py seed_bench_data`) and
+an HTTP benchmark runner (`manage.py run_benchmark`).
+
+Seeded rows are recognisable (usernames `bench_user_N`, slugs `bench-N`,
+session keys `bench-N`) so they can be removed with --clear.
+
+The runner drives the main pages with concurrent clients (threads, each
+with its own cookie jar) against a running server, or one it starts itself
+with --serve, and reports per-scenario throughput and latency percentiles
+as JSON. --compare-servers runs the same load against the threaded WSGI
+dev server and against uvicorn with the async views (ASYNC_VIEWS), each in
+its own process.
+"""
+import http.cookiejar
+import importlib.util
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Article, ResearchPaper, Visit
+
+WORDS = ('solar wind ocean carbon forest river climate energy policy grid storage soil water city '
+         'transport emissions biodiversity recycling farming heat drought coral battery hydrogen '
+         'wetland insulation compost transit plastic ice glacier methane').split()
+TAGS = ('solar', 'wind', 'ocean', 'forest', 'policy', 'cities', 'water', 'energy', 'food', 'climate')
+BATCH = 5_000
+
+
+# ---------------------------------------------------------------------------
+# Seeding
+# ---------------------------------------------------------------------------
+
+def _sentence(rng, low, high):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def clear_bench_data():
+    Visit.objects.filter(session_key__startswith='bench-').delete()
+    Visit.objects.filter(user__username__startswith='bench_user_').delete()
+    Article.objects.filter(slug__startswith='bench-').delete()
+    ResearchPaper.objects.filter(slug__startswith='bench-').delete()
+    get_user_model().objects.filter(username__startswith='bench_user_').delete()
+
+
+def seed_authors(count, rng):
+    User = get_user_model()
+    start = User.objects.filter(username__startswith='bench_user_').count()
+    for first in range(start, count, BATCH):
+        User.objects.bulk_create([
+            # '!' prefix: unusable password, so no hashing cost
+            User(username=f'bench_user_{i}', password='!bench', role='editor' if i % 10 == 0 else 'user')
+            for i in range(first, min(first + BATCH, count))
+        ])
+    return list(User.objects.filter(username__startswith='bench_user_')
+                .order_by('pk').values_list('pk', flat=True)[:count])
+
+
+def seed_articles(count, author_ids, rng, days=365, published_share=0.9):
+    now = timezone.now()
+    start = Article.objects.filter(slug__startswith='bench-').count()
+    for first in range(start, count, BATCH):
+        with transaction.atomic():
+            Article.objects.bulk_create([
+                Article(
+                    title=_sentence(rng, 4, 10).capitalize(),
+                    slug=f'bench-{i}',
+                    summary=_sentence(rng, 15, 30),
+                    content='\n\n'.join(_sentence(rng, 40, 90) for _ in range(rng.randint(3, 8))),
+                    author_id=rng.choice(author_ids) if author_ids else None,
+                    published=rng.random() < published_share,
+                    publish_date=now - timedelta(seconds=rng.randint(0, days * 86400)),
+                    tags=', '.join(rng.sample(TAGS, rng.randint(1, 3))),
+                )
+                for i in range(first, min(first + BATCH, count))
+            ])
+
+
+def seed_papers(count, author_ids, rng):
+    start = ResearchPaper.objects.filter(slug__startswith='bench-').count()
+    for first in range(start, count, BATCH):
+        ResearchPaper.objects.bulk_create([
+            ResearchPaper(
+                title=_sentence(rng, 5, 12).capitalize(), slug=f'bench-{i}',
+                abstract=_sentence(rng, 40, 80), content=_sentence(rng, 100, 200),
+                authors=_sentence(rng, 2, 4).title(),
+                uploaded_by_id=rng.choice(author_ids) if author_ids else None,
+                published=True,
+            )
+            for i in range(first, min(first + BATCH, count))
+        ])
+
+
+def seed_visits(count, author_ids, rng, days=365):
+    """
+    `count` Visit rows over the last `days` days: a fifth from bench users
+    (one row per user per day), the rest from anonymous sessions. On SQLite
+    the rows are generated inside the database with one INSERT ... SELECT.
+    """
+    today = timezone.now().date()
+    user_rows = min(count // 5, len(author_ids) * days)
+    if connection.vendor == 'sqlite':
+        n_users = max(1, len(author_ids))
+        # user ids go in as one JSON array, picked by position
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i + 1 < %s) "
+                "INSERT OR IGNORE INTO core_visit (user_id, session_key, date, count, last_seen) "
+                "SELECT CASE WHEN i < %s THEN json_extract(%s, '$[' || (i %% %s) || ']') END, "
+                "       CASE WHEN i < %s THEN NULL ELSE 'bench-' || i END, "
+                "       date(%s, '-' || (CASE WHEN i < %s THEN i / %s ELSE abs(random()) %% %s END) || ' days'), "
+                "       1 + abs(random()) %% 20, datetime('now') "
+                "FROM n",
+                [count, user_rows, json.dumps(list(author_ids)), n_users, user_rows, today.isoformat(),
+                 user_rows, n_users, days],
+            )
+        return
+    for first in range(0, count, BATCH):
+        rows = []
+        for i in range(first, min(first + BATCH, count)):
+            if i < user_rows:
+                rows.append(Visit(user_id=author_ids[i % len(author_ids)],
+                                  date=today - timedelta(days=i // len(author_ids)), count=rng.randint(1, 20)))
+            else:
+                rows.append(Visit(session_key=f'bench-{i}', date=today - timedelta(days=rng.randrange(days)),
+                                  count=rng.randint(1, 20)))
+        Visit.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+# ---------------------------------------------------------------------------
+# Benchmark runner
+# ---------------------------------------------------------------------------
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, errors, elapsed):
+    values = sorted(latencies)
+    ms = lambda v: round(v * 1000, 2) if v is not None else None  # noqa: E731
+    return {
+        'requests': len(values) + errors,
+        'errors': errors,
+        'throughput_rps': round(len(values) / elapsed, 2) if elapsed else 0,
+        'mean_ms': ms(sum(values) / len(values)) if values else None,
+        'p50_ms': ms(percentile(values, 50)),
+        'p95_ms': ms(percentile(values, 95)),
+        'p99_ms': ms(percentile(values, 99)),
+        'max_ms': ms(values[-1]) if values else None,
+    }
+
+
+def login_cookie(user):
+    """A session for `user` created server-side (no password round trip)."""
+    from django.contrib.sessions.backends.db import SessionStore
+    session = SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.create()
+    return session.session_key
+
+
+class Scenario:
+    def __init__(self, name, make_path, logged_in=False, weight=1):
+        self.name = name
+        self.make_path = make_path
+        self.logged_in = logged_in
+        self.weight = weight
+
+
+def default_scenarios(rng_seed=0, sample=1000):
+    """Index, article detail, search, track_visit and dashboard, with paths sampled from the database."""
+    slugs = list(Article.objects.filter(published=True).order_by('-publish_date')
+                 .values_list('slug', flat=True)[:sample])
+    pages = max(1, Article.objects.filter(published=True).count() // 6)
+    return [
+        Scenario('index', lambda rng: '/' if rng.random() < 0.7 else f'/?page={rng.randint(1, min(pages, 50))}',
+                 weight=3),
+        Scenario('article_detail', lambda rng: f'/article/{rng.choice(slugs)}/' if slugs else '/', weight=4),
+        Scenario('search', lambda rng: '/search/?q=' + '+'.join(rng.sample(WORDS, rng.randint(1, 2))), weight=2),
+        Scenario('track_visit', lambda rng: '/track-visit/', weight=3),
+        Scenario('dashboard', lambda rng: '/dashboard/', logged_in=True, weight=1),
+    ]
+
+
+class BenchmarkRunner:
+    def __init__(self, base_url, scenarios, concurrency=8, duration=30.0, requests=None,
+                 session_cookie=None, timeout=30.0, seed=0, warmup=2.0):
+        self.base_url = base_url.rstrip('/')
+        self.scenarios = scenarios
+        self.concurrency = concurrency
+        self.duration = duration
+        self.max_requests = requests
+        self.session_cookie = session_cookie
+        self.timeout = timeout
+        self.seed = seed
+        self.warmup = warmup
+        self._lock = threading.Lock()
+        self._issued = 0
+
+    def _take_ticket(self):
+        with self._lock:
+            if self.max_requests is not None and self._issued >= self.max_requests:
+                return False
+            self._issued += 1
+            return True
+
+    def _opener(self, logged_in):
+        jar = http.cookiejar.CookieJar()
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+        if logged_in and self.session_cookie:
+            opener.addheaders = [('Cookie', f'sessionid={self.session_cookie}')]
+        return opener
+
+    def _client(self, worker, results, deadline):
+        rng = random.Random(self.seed * 1000 + worker)
+        anonymous = self._opener(False)
+        logged_in = self._opener(True)
+        weights = [s.weight for s in self.scenarios]
+        while time.monotonic() < deadline and self._take_ticket():
+            scenario = rng.choices(self.scenarios, weights)[0]
+            if scenario.logged_in and not self.session_cookie:
+                continue
+            opener = logged_in if scenario.logged_in else anonymous
+            url = self.base_url + scenario.make_path(rng)
+            started = time.perf_counter()
+            ok = True
+            try:
+                with opener.open(url, timeout=self.timeout) as response:
+                    response.read()
+                    ok = response.status < 400
+            except (urllib.error.URLError, OSError):
+                ok = False
+            elapsed = time.perf_counter() - started
+            latencies, errors = results[scenario.name]
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors.append(1)
+
+    def _run_phase(self, seconds):
+        results = {s.name: ([], []) for s in self.scenarios}
+        deadline = time.monotonic() + seconds
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for future in [pool.submit(self._client, w, results, deadline) for w in range(self.concurrency)]:
+                future.result()
+        return results, time.perf_counter() - started
+
+    def run(self):
+        if self.warmup:
+            saved, self.max_requests = self.max_requests, None
+            self._run_phase(self.warmup)
+            self.max_requests = saved
+        self._issued = 0
+        results, elapsed = self._run_phase(self.duration)
+
+        report = {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'base_url': self.base_url,
+                'concurrency': self.concurrency,
+                'duration_s': round(elapsed, 3),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'scenarios': {},
+        }
+        all_latencies, all_errors = [], 0
+        for name, (latencies, errors) in results.items():
+            report['scenarios'][name] = summarize(latencies, len(errors), elapsed)
+            all_latencies += latencies
+            all_errors += len(errors)
+        report['total'] = summarize(all_latencies, all_errors, elapsed)
+        return report
+
+
+def compare(report, baseline, max_regression=10.0):
+    """
+    Regressions of `report` against `baseline`: scenarios whose p95 grew or
+    throughput fell by more than max_regression percent.
+    """
+    problems = []
+    for name, current in report['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before or not current['p95_ms'] or not before.get('p95_ms'):
+            continue
+        p95_change = (current['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+        if p95_change > max_regression:
+            problems.append(f'{name}: p95 {before["p95_ms"]} -> {current["p95_ms"]} ms (+{p95_change:.1f}%)')
+        if before.get('throughput_rps'):
+            rps_change = (before['throughput_rps'] - current['throughput_rps']) / before['throughput_rps'] * 100
+            if rps_change > max_regression:
+                problems.append(f'{name}: throughput {before["throughput_rps"]} -> '
+                                f'{current["throughput_rps"]} rps (-{rps_change:.1f}%)')
+    return problems
+
+
+def load_report(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+# ---------------------------------------------------------------------------
+# WSGI vs ASGI
+# ---------------------------------------------------------------------------
+
+def server_command(kind, port, workers=1):
+    """Command line and extra environment for a benchmark server process."""
+    manage = os.path.join(settings.BASE_DIR, 'manage.py')
+    if kind == 'wsgi':
+        return [sys.executable, manage, 'runserver', f'127.0.0.1:{port}', '--noreload'], {}
+    if importlib.util.find_spec('uvicorn') is None:
+        raise RuntimeError('the ASGI benchmark needs uvicorn (pip install uvicorn)')
+    return ([sys.executable, '-m', 'uvicorn', 'Eco.asgi:application', '--host', '127.0.0.1',
+             '--port', str(port), '--workers', str(workers), '--log-level', 'warning', '--no-access-log'],
+            {'ECO_ASYNC_VIEWS': '1'})
+
+
+def start_server(kind, port, workers=1, timeout=30.0):
+    command, extra_env = server_command(kind, port, workers)
+    env = dict(os.environ, **extra_env)
+    process = subprocess.Popen(command, env=env, cwd=settings.BASE_DIR,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{kind} server exited with status {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'{kind} server did not start on port {port}')
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def compare_servers(reports):
+    """ASGI relative to WSGI per scenario: throughput ratio (>1 is better) and p95 ratio (<1 is better)."""
+    wsgi, asgi = reports['wsgi'], reports['asgi']
+    ratios = {}
+    for name, after in asgi['scenarios'].items():
+        before = wsgi['scenarios'].get(name)
+        if not before:
+            continue
+        ratios[name] = {
+            'throughput_ratio': round(after['throughput_rps'] / before['throughput_rps'], 3)
+            if before['throughput_rps'] else None,
+            'p95_ratio': round(after['p95_ms'] / before['p95_ms'], 3)
+            if after['p95_ms'] and before['p95_ms'] else None,
+        }
+    return ratios
@@ -0,0 +1,163 @@
+# core/compression.py
+"""
+On-the-fly response compression (used by CompressionMiddleware in
+core/middleware.py) and per-route compression statistics, kept as
+counters in core/metrics.py.
+
+Streaming responses are compressed chunk by chunk with a sync flush after
+each chunk, so the client starts receiving data while the view is still
+producing it and the body is never buffered. Brotli needs the optional
+`brotli` package; without it only gzip is offered.
+
+BREACH: like Django's GZipMiddleware, every gzip body carries a random
+number (up to COMPRESSION_MAX_RANDOM_BYTES) of padding bytes in the header's
+file name field, so its length no longer tells an attacker whether a guess
+at a secret on the page compressed well. Brotli has no such field, so pages
+that include a CSRF token are sent as padded gzip instead (see
+CompressionMiddleware).
+"""
+import secrets
+import struct
+import time
+import zlib
+
+from django.conf import settings
+
+from . import metrics
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    'text/',
+    'application/json',
+    'application/x-ndjson',
+    'application/javascript',
+    'application/xml',
+    'application/rss+xml',
+    'application/atom+xml',
+    'image/svg+xml',
+)
+
+
+def min_size():
+    return getattr(settings, 'COMPRESSION_MIN_SIZE', 512)
+
+
+def is_compressible_type(content_type):
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def supported_encodings():
+    # preference order
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def gzip_header():
+    """gzip header with a random-length file name (BREACH length padding)."""
+    padding = secrets.randbelow(getattr(settings, 'COMPRESSION_MAX_RANDOM_BYTES', 100) + 1)
+    # magic, deflate, FNAME flag, no mtime, no extra flags, unknown OS
+    return b'\x1f\x8b\x08\x08\x00\x00\x00\x00\x00\xff' + b'a' * padding + b'\x00'
+
+
+class Compressor:
+    """Incremental compressor for one response body."""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._obj = brotli.Compressor(quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 4))
+        else:
+            # raw deflate: the gzip header and trailer are written here
+            self._obj = zlib.compressobj(getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6), zlib.DEFLATED, -15)
+            self._header = gzip_header()
+            self._crc = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu = 0.0
+
+    def _timed(self, fn, *args):
+        start = time.thread_time()
+        out = fn(*args)
+        self.cpu += time.thread_time() - start
+        self.bytes_out += len(out)
+        return out
+
+    def _with_header(self, out):
+        if self._header:
+            out, self._header = self._header + out, b''
+        return out
+
+    def _process(self, data, flush):
+        if self.encoding == 'br':
+            out = self._obj.process(data)
+            return out + self._obj.flush() if flush else out
+        self._crc = zlib.crc32(data, self._crc)
+        out = self._obj.compress(data)
+        return self._with_header(out + self._obj.flush(zlib.Z_SYNC_FLUSH) if flush else out)
+
+    def _finish(self):
+        if self.encoding == 'br':
+            return self._obj.finish()
+        trailer = struct.pack('<II', self._crc & 0xFFFFFFFF, self.bytes_in & 0xFFFFFFFF)
+        return self._with_header(self._obj.flush() + trailer)
+
+    def compress(self, data, flush=True):
+        """Compress a chunk; with flush=True it is complete and can be sent right away."""
+        self.bytes_in += len(data)
+        return self._timed(self._process, data, flush)
+
+    def finish(self):
+        return self._timed(self._finish)
+
+
+def compress_bytes(data, encoding):
+    """One-shot compression of a complete body. Returns (compressed, compressor)."""
+    compressor = Compressor(encoding)
+    out = compressor.compress(data, flush=False)
+    return out + compressor.finish(), compressor
+
+
+# ---------------------------------------------------------------------------
+# Statistics
+# ---------------------------------------------------------------------------
+
+def record(route, compressor):
+    labels = {'route': route, 'encoding': compressor.encoding}
+    metrics.COMPRESSION_RESPONSES.inc(**labels)
+    metrics.COMPRESSION_BYTES_IN.inc(compressor.bytes_in, **labels)
+    metrics.COMPRESSION_BYTES_OUT.inc(compressor.bytes_out, **labels)
+    metrics.COMPRESSION_CPU.inc(compressor.cpu, **labels)
+
+
+def compression_stats():
+    """Per-route, per-encoding totals (core/metrics.py), with the overall ratio (out / in)."""
+    values = metrics.collect()
+    responses = values.get(metrics.COMPRESSION_RESPONSES.name, {})
+    bytes_in = values.get(metrics.COMPRESSION_BYTES_IN.name, {})
+    bytes_out = values.get(metrics.COMPRESSION_BYTES_OUT.name, {})
+    cpu = values.get(metrics.COMPRESSION_CPU.name, {})
+    rows = []
+    for key in sorted(responses):
+        route, encoding = key
+        entry = {
+            'responses': responses[key],
+            'bytes_in': bytes_in.get(key, 0),
+            'bytes_out': bytes_out.get(key, 0),
+            'cpu_seconds': round(cpu.get(key, 0.0), 6),
+            'route': route,
+            'encoding': encoding,
+        }
+        entry['ratio'] = round(entry['bytes_out'] / entry['bytes_in'], 4) if entry['bytes_in'] else None
+        rows.append(entry)
+    return rows
+
+
+def reset_stats():
+    """Clear this process's compression counters."""
+    for metric in (metrics.COMPRESSION_RESPONSES, metrics.COMPRESSION_BYTES_IN,
+                   metrics.COMPRESSION_BYTES_OUT, metrics.COMPRESSION_CPU):
+        metric.reset()
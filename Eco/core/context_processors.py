@@ -4,33 +4,74 @@ from django.utils import timezone
 from django.db.models import Sum
 from django.contrib.auth import get_user_model
 from .models import Article
+from . import loadshed
 from django.db.models import Value
 from django.db.models.functions import Lower
 
 User = get_user_model()
 
+# async views store the processors' results here (see aprepare)
+PREPARED_ATTR = '_core_context'
+
+
+def prepared(request, *keys):
+    """Values computed ahead of rendering by aprepare(), or None if it didn't run."""
+    data = getattr(request, PREPARED_ATTR, None)
+    if data is None:
+        return None
+    return {key: data[key] for key in keys if key in data}
+
+
+def _normalize_ids(raw_ids):
+    # normalize to ints and preserve order & uniqueness
+    recent_ids = []
+    for x in raw_ids or []:
+        try:
+            ix = int(x)
+        except Exception:
+            continue
+        if ix not in recent_ids:
+            recent_ids.append(ix)
+    return recent_ids
+
+
+def _split_tags(tag_strings):
+    tags_set = set()
+    for a in tag_strings:
+        for t in str(a).split(','):
+            t = t.strip()
+            if t:
+                tags_set.add(t)
+    return sorted(tags_set, key=lambda s: s.lower())
+
+
+def _tag_strings():
+    # order_by(): tags are sorted afterwards, so skip the default -publish_date sort
+    return Article.objects.exclude(tags__isnull=True).exclude(tags__exact='').order_by().values_list('tags', flat=True)
+
+
+def _author_queryset():
+    # safer: derive author ids directly from Article table (works regardless of related_name)
+    author_ids = Article.objects.values_list('author_id', flat=True).distinct()
+    return User.objects.filter(pk__in=author_ids)
+
 
 def recent_articles_context(request):
     """
     Adds a small site context:
       - recent_articles_session: Article queryset for article IDs stored in session (if any)
-      - visit_total & visit_last_seen for authenticated users (if Visit model exists)
+      - visit_total & visit_last_seen for authenticated users (if Visit model exists;
+        left at the defaults while shedding load)
     Defensive: failures won't break page rendering.
     """
+    ctx = prepared(request, 'recent_articles_session', 'visit_total', 'visit_last_seen')
+    if ctx is not None:
+        return ctx
     ctx = {}
 
     try:
         # recent articles from session (store article PKs in session['recent_articles'])
-        raw_ids = request.session.get("recent_articles", []) or []
-        # normalize to ints and preserve order & uniqueness
-        recent_ids = []
-        for x in raw_ids:
-            try:
-                ix = int(x)
-            except Exception:
-                continue
-            if ix not in recent_ids:
-                recent_ids.append(ix)
+        recent_ids = _normalize_ids(request.session.get("recent_articles", []))
 
         if recent_ids:
             recent = Article.objects.filter(pk__in=recent_ids).order_by('-publish_date')[:6]
@@ -46,7 +87,7 @@ def recent_articles_context(request):
     # optional visit stats if Visit model exists
     try:
         from .models import Visit  # local import for safety
-        if request.user.is_authenticated:
+        if request.user.is_authenticated and not loadshed.skip('visit_counters'):
             total = Visit.objects.filter(user=request.user).aggregate(total=Sum('count'))['total'] or 0
             last_visit = Visit.objects.filter(user=request.user).order_by('-last_seen').first()
             ctx['visit_total'] = total
@@ -69,27 +110,27 @@ def search_filters(request):
       - tags: list of unique tag strings (split on comma)
       - categories: list of unique category values if Article has category attribute
     This builds authors from the Article table to avoid depending on a specific related_name.
+    While shedding load the last lists built are reused (empty if there are none).
     """
+    ctx = prepared(request, 'filter_authors', 'filter_tags', 'filter_categories')
+    if ctx is not None:
+        return ctx
+    return loadshed.stale('search_filters', _search_filters, 'search_filters') or {
+        'filter_authors': [], 'filter_tags': [], 'filter_categories': []}
+
+
+def _search_filters():
     authors = []
     try:
-        # safer: derive author ids directly from Article table (works regardless of related_name)
-        author_ids = Article.objects.values_list('author_id', flat=True).distinct()
-        authors_qs = User.objects.filter(pk__in=author_ids)
-        authors = [(u.pk, getattr(u, 'username', str(u))) for u in authors_qs]
+        authors = [(u.pk, getattr(u, 'username', str(u))) for u in _author_queryset()]
     except Exception:
         authors = []
 
     # TAGS: read Article.tags (assumes a comma-separated string)
-    tags_set = set()
     try:
-        for a in Article.objects.exclude(tags__isnull=True).exclude(tags__exact='').values_list('tags', flat=True):
-            for t in str(a).split(','):
-                t = t.strip()
-                if t:
-                    tags_set.add(t)
+        tags = _split_tags(_tag_strings())
     except Exception:
-        tags_set = set()
-    tags = sorted(tags_set, key=lambda s: s.lower())
+        tags = []
 
     # CATEGORIES (optional): only if Article has attribute 'category' (string or FK handled simply)
     categories = []
@@ -107,3 +148,55 @@ def search_filters(request):
         'filter_tags': tags,
         'filter_categories': categories,
     }
+
+
+async def aprepare(request):
+    """
+    Run the queries of the processors above with the async ORM, for async
+    views (core/async_views.py): the template engine only calls sync
+    processors, and those must not touch the database inside the event loop.
+    The processors then return these values instead of querying.
+    """
+    data = {'recent_articles_session': [], 'visit_total': 0, 'visit_last_seen': None,
+            'filter_authors': [], 'filter_tags': [], 'filter_categories': []}
+    try:
+        recent_ids = _normalize_ids(await request.session.aget('recent_articles', []))
+        if recent_ids:
+            recent = Article.objects.filter(pk__in=recent_ids).order_by('-publish_date')[:6]
+            articles_map = {a.pk: a async for a in recent}
+            data['recent_articles_session'] = [articles_map[pk] for pk in recent_ids if pk in articles_map]
+    except Exception:
+        pass
+
+    try:
+        from .models import Visit
+        user = await request.auser()
+        if user.is_authenticated and not loadshed.skip('visit_counters'):
+            visits = Visit.objects.filter(user=user)
+            data['visit_total'] = (await visits.aaggregate(total=Sum('count')))['total'] or 0
+            last_visit = await visits.order_by('-last_seen').afirst()
+            data['visit_last_seen'] = getattr(last_visit, 'last_seen', None)
+    except Exception:
+        pass
+
+    filters = await loadshed.astale('search_filters', _asearch_filters, 'search_filters')
+    if filters:
+        data.update(filters)
+
+    setattr(request, PREPARED_ATTR, data)
+    return data
+
+
+async def _asearch_filters():
+    # same result as _search_filters(), so both share the stale copy
+    filters = {'filter_authors': [], 'filter_tags': [], 'filter_categories': []}
+    try:
+        filters['filter_authors'] = [(u.pk, u.username) async for u in _author_queryset()]
+    except Exception:
+        pass
+    try:
+        filters['filter_tags'] = _split_tags([t async for t in _tag_strings()])
+    except Exception:
+        pass
+    # Article has no category field (see _search_filters)
+    return filters
@@ -0,0 +1,180 @@
+# core/downloads.py
+"""
+Serving uploaded files (Article.attachment, ResearchPaper.pdf) through Django.
+
+serve_file() handles:
+  - per-file ETag / Last-Modified and conditional GET (304),
+  - single byte ranges (206 / 416) with If-Range, so PDF viewers can resume
+    and fetch pages on demand,
+  - handing the transfer to the front server (X-Sendfile / X-Accel-Redirect)
+    when settings.SENDFILE_BACKEND is set, so no Python worker copies bytes.
+
+Full responses wrap the real file object, so WSGI servers with a
+wsgi.file_wrapper (gunicorn, uWSGI) can use sendfile().
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe, parse_etags
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class FileRange:
+    """Read-only file-like view of bytes [start, end] (inclusive) of an open file."""
+
+    def __init__(self, fileobj, start, end):
+        self.fileobj = fileobj
+        self.remaining = end - start + 1
+        fileobj.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.fileobj.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.fileobj.close()
+
+
+def file_etag(stat):
+    # cheap per-file validator: changes whenever the file is replaced or rewritten
+    return '"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+
+
+def parse_range(header, size):
+    """
+    Parse a Range header for a file of `size` bytes.
+    Returns (start, end) inclusive, or None to send the whole file
+    (missing/unsupported header, multiple ranges).
+    Raises RangeNotSatisfiable for ranges outside the file.
+    """
+    if not header:
+        return None
+    m = RANGE_RE.match(header.strip())
+    if not m:
+        # multi-range or malformed: RFC 9110 allows ignoring it
+        return None
+    first, last = m.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # suffix range: last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            # nothing to take the last bytes of
+            raise RangeNotSatisfiable
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable
+    return start, min(end, size - 1)
+
+
+def _if_range_matches(request, etag, mtime):
+    """If-Range holds either an ETag or an HTTP date; the range only applies if it still matches."""
+    value = request.headers.get('If-Range')
+    if not value:
+        return True
+    value = value.strip()
+    if value.startswith('"') or value.startswith('W/'):
+        # weak ETags never match for ranges
+        return value == etag
+    since = parse_http_date_safe(value)
+    return since is not None and int(mtime) <= since
+
+
+def _not_modified(request, etag, mtime):
+    inm = request.headers.get('If-None-Match')
+    if inm:
+        return etag in parse_etags(inm) or inm.strip() == '*'
+    ims = parse_http_date_safe(request.headers.get('If-Modified-Since') or '')
+    return ims is not None and int(mtime) <= ims
+
+
+def _sendfile_response(fieldfile, path, content_type):
+    backend = getattr(settings, 'SENDFILE_BACKEND', None)
+    response = HttpResponse(content_type=content_type)
+    if backend == 'x-accel-redirect':
+        # nginx: internal location mapped onto MEDIA_ROOT
+        prefix = getattr(settings, 'SENDFILE_URL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(fieldfile.name)
+    else:
+        # Apache mod_xsendfile / lighttpd
+        response['X-Sendfile'] = path
+    return response
+
+
+def serve_file(request, fieldfile, as_attachment=False, public=True, filename=None):
+    """
+    Return a (possibly partial) response for a FieldFile stored on the local filesystem.
+    `filename` is the name offered to the browser (stored names may be content hashes).
+    """
+    path = fieldfile.path
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = file_etag(stat)
+    filename = filename or os.path.basename(fieldfile.name)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': ('public' if public else 'private') + ', max-age=3600',
+    }
+    if public and getattr(fieldfile.storage, 'is_content_addressed', lambda name: False)(fieldfile.name):
+        # content-addressed blobs never change under the same name
+        headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+
+    if _not_modified(request, etag, stat.st_mtime):
+        response = HttpResponseNotModified()
+        for key, value in headers.items():
+            response[key] = value
+        return response
+
+    if getattr(settings, 'SENDFILE_BACKEND', None):
+        # the front server does ranges and the byte copy itself
+        response = _sendfile_response(fieldfile, path, content_type)
+        disposition = 'attachment' if as_attachment else 'inline'
+        response['Content-Disposition'] = f"{disposition}; filename*=utf-8''{quote(filename)}"
+    else:
+        try:
+            byte_range = None
+            if _if_range_matches(request, etag, stat.st_mtime):
+                byte_range = parse_range(request.headers.get('Range'), size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            response['Accept-Ranges'] = 'bytes'
+            return response
+
+        fileobj = open(path, 'rb')
+        if byte_range is None:
+            response = FileResponse(fileobj, as_attachment=as_attachment, filename=filename,
+                                    content_type=content_type)
+        else:
+            start, end = byte_range
+            response = FileResponse(FileRange(fileobj, start, end), as_attachment=as_attachment,
+                                    filename=filename, content_type=content_type, status=206)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(end - start + 1)
+        response.block_size = CHUNK_SIZE
+
+    for key, value in headers.items():
+        response[key] = value
+    return response
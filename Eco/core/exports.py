@@ -0,0 +1,133 @@
+# core/exports.py
+"""
+Streaming CSV / NDJSON exports of Visit analytics and article metadata.
+
+Rows are read with values_list().iterator(chunk_size=...) and written out in
+batches of WRITE_ROWS lines, so an export of any size uses the same small
+amount of memory. Used by the admin actions (core/admin.py) and by
+`manage.py export_data`.
+"""
+import csv
+import datetime
+import io
+import json
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import Article, Visit
+
+CHUNK_SIZE = 2_000
+WRITE_ROWS = 1_000
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class Export:
+    """A named dataset: model, the date column used for ranges, and (header, values() column) pairs."""
+
+    def __init__(self, model, date_field, columns, ordering):
+        self.model = model
+        self.date_field = date_field
+        self.columns = columns
+        self.ordering = ordering
+
+    @property
+    def header(self):
+        return [name for name, _ in self.columns]
+
+    def queryset(self):
+        return self.model.objects.all()
+
+    def rows(self, queryset, chunk_size=CHUNK_SIZE):
+        return (queryset.order_by(*self.ordering)
+                .values_list(*[column for _, column in self.columns])
+                .iterator(chunk_size=chunk_size))
+
+
+EXPORTS = {
+    'visits': Export(
+        Visit, 'date',
+        columns=[('date', 'date'), ('user', 'user__username'), ('session_key', 'session_key'),
+                 ('count', 'count'), ('last_seen', 'last_seen')],
+        ordering=('date', 'pk'),
+    ),
+    'articles': Export(
+        Article, 'publish_date',
+        columns=[('id', 'id'), ('slug', 'slug'), ('title', 'title'), ('author', 'author__username'),
+                 ('published', 'published'), ('publish_date', 'publish_date'),
+                 ('updated_at', 'updated_at'), ('tags', 'tags')],
+        ordering=('pk',),
+    ),
+}
+
+
+def filter_dates(export, queryset, since=None, until=None):
+    """Keep rows whose date column falls in [since, until] (both dates, inclusive)."""
+    field = export.model._meta.get_field(export.date_field)
+    if field.get_internal_type() == 'DateTimeField':
+        # compare against datetimes so the column's index can be used
+        def start_of(day):
+            return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+        if since:
+            queryset = queryset.filter(**{export.date_field + '__gte': start_of(since)})
+        if until:
+            queryset = queryset.filter(**{export.date_field + '__lt': start_of(until + datetime.timedelta(days=1))})
+    else:
+        if since:
+            queryset = queryset.filter(**{export.date_field + '__gte': since})
+        if until:
+            queryset = queryset.filter(**{export.date_field + '__lte': until})
+    return queryset
+
+
+def _plain(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def stream_csv(header, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    pending = 0
+    for row in rows:
+        writer.writerow([_plain(v) for v in row])
+        pending += 1
+        if pending >= WRITE_ROWS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+
+def stream_ndjson(header, rows):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(header, map(_plain, row))), separators=(',', ':')))
+        if len(lines) >= WRITE_ROWS:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def stream_export(export, queryset, fmt='csv', chunk_size=CHUNK_SIZE):
+    """Generator of text chunks for `queryset` in the given format."""
+    if fmt not in FORMATS:
+        raise ValueError(f'unknown export format {fmt!r}')
+    rows = export.rows(queryset, chunk_size=chunk_size)
+    if fmt == 'csv':
+        return stream_csv(export.header, rows)
+    return stream_ndjson(export.header, rows)
+
+
+def export_response(export, queryset, fmt='csv', filename=None):
+    filename = filename or f'{export.model._meta.model_name}s-{timezone.now():%Y%m%d}.{fmt}'
+    response = StreamingHttpResponse(stream_export(export, queryset, fmt), content_type=FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,199 @@
+# core/feeds.py
+"""
+RSS and Atom feeds of published articles: latest, per tag and per author.
+
+Rendered feeds are cached. Each feed scope ('latest', 'tag:<tag>',
+'author:<username>') has a version number in the cache; saving or deleting a
+published article bumps only the scopes it belongs to (see
+invalidate_article_feeds, called from core/signals.py), so the next request
+rebuilds just those feeds and every other feed keeps being served from cache.
+"""
+import hashlib
+import re
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+
+from . import metrics
+from .models import Article
+
+FEED_SIZE = 30
+
+
+def feed_timeout():
+    return getattr(settings, 'FEED_CACHE_TIMEOUT', 24 * 60 * 60)
+
+
+def _scope_key(scope):
+    # tags and usernames are user input: hash them into a safe cache key
+    return 'feed-version:' + hashlib.md5(scope.encode()).hexdigest()
+
+
+def scope_arg(value):
+    """A tag or username as feed scopes, URLs and lookups all use it."""
+    return value.strip().lower()
+
+
+def feed_scopes(tags=(), usernames=()):
+    scopes = {'latest'}
+    scopes.update('tag:' + scope_arg(tag) for tag in tags if tag and scope_arg(tag))
+    scopes.update('author:' + scope_arg(name) for name in usernames if name)
+    return scopes
+
+
+def invalidate_feeds(scopes):
+    for scope in scopes:
+        key = _scope_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # not cached yet: nothing to invalidate
+            pass
+
+
+def invalidate_article_feeds(tags, author_ids):
+    """Drop the cached feeds an article with these tags/authors appears in."""
+    User = get_user_model()
+    usernames = User.objects.filter(pk__in=[a for a in author_ids if a]).values_list('username', flat=True)
+    invalidate_feeds(feed_scopes(tags, usernames))
+
+
+def cached_feed(feed, scope_prefix):
+    """Wrap a Feed instance in a view that serves the cached rendering of its scope."""
+
+    def view(request, arg=None):
+        scope = scope_prefix + (':' + scope_arg(arg) if arg is not None else '')
+        version_key = _scope_key(scope)
+        version = cache.get(version_key)
+        if version is None:
+            # a fresh value, never one an evicted version key had before
+            version = time.time_ns()
+            cache.set(version_key, version, None)
+        key = 'feed:%s:%s:%s' % (
+            version, type(feed).__name__,
+            hashlib.md5(f'{request.scheme}://{request.get_host()}|{scope}'.encode()).hexdigest(),
+        )
+        cached = cache.get(key)
+        metrics.CACHE_REQUESTS.inc(cache='feeds', result='miss' if cached is None else 'hit')
+        if cached is None:
+            response = feed(request, arg) if arg is not None else feed(request)
+            cached = (response.content, response['Content-Type'])
+            cache.set(key, cached, feed_timeout())
+        content, content_type = cached
+        return HttpResponse(content, content_type=content_type)
+
+    return view
+
+
+class LatestArticlesFeed(Feed):
+    title = 'EcoInsight — latest articles'
+    description = 'Newly published articles on sustainability.'
+
+    def link(self, obj=None):
+        return reverse('index')
+
+    def get_queryset(self, obj):
+        # summaries only: the feed never needs the article body
+        return (Article.objects.filter(published=True).select_related('author')
+                .only('title', 'slug', 'summary', 'tags', 'publish_date', 'updated_at', 'author__username'))
+
+    def items(self, obj=None):
+        return self.get_queryset(obj).order_by('-publish_date', '-pk')[:FEED_SIZE]
+
+    def item_title(self, item):
+        return item.title
+
+    def item_description(self, item):
+        return item.summary
+
+    def item_link(self, item):
+        return reverse('article_detail', args=[item.slug])
+
+    def item_pubdate(self, item):
+        return item.publish_date
+
+    def item_updateddate(self, item):
+        return item.updated_at
+
+    def item_author_name(self, item):
+        return item.author.username if item.author else None
+
+    def item_categories(self, item):
+        return item.tag_list
+
+
+class TagFeed(LatestArticlesFeed):
+    def get_object(self, request, tag):
+        # the cached rendering is shared by every spelling of the tag
+        tag = scope_arg(tag)
+        if not tag:
+            raise Http404
+        return tag
+
+    def title(self, obj):
+        return f'EcoInsight — articles tagged "{obj}"'
+
+    def description(self, obj):
+        return f'Newly published articles tagged "{obj}".'
+
+    def link(self, obj=None):
+        return reverse('search') + '?' + urlencode({'tag': obj})
+
+    def get_queryset(self, obj):
+        # whole tags only, so the feed matches the scopes invalidated on publish
+        # LIKE narrows the rows first, so the regex (a Python function on
+        # SQLite) only runs on articles that mention the tag at all
+        pattern = r'(^|,)\s*' + re.escape(obj) + r'\s*(,|$)'
+        return super().get_queryset(obj).filter(tags__icontains=obj).filter(tags__iregex=pattern)
+
+
+class AuthorFeed(LatestArticlesFeed):
+    def get_object(self, request, username):
+        return get_object_or_404(get_user_model(), username__iexact=scope_arg(username))
+
+    def title(self, obj):
+        return f'EcoInsight — articles by {obj.username}'
+
+    def description(self, obj):
+        return f'Newly published articles by {obj.username}.'
+
+    def link(self, obj=None):
+        return reverse('search') + '?' + urlencode({'author': obj.pk})
+
+    def get_queryset(self, obj):
+        return super().get_queryset(obj).filter(author=obj)
+
+
+class AtomLatestArticlesFeed(LatestArticlesFeed):
+    feed_type = Atom1Feed
+    subtitle = LatestArticlesFeed.description
+
+
+class AtomTagFeed(TagFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, obj):
+        return self.description(obj)
+
+
+class AtomAuthorFeed(AuthorFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, obj):
+        return self.description(obj)
+
+
+latest_rss = cached_feed(LatestArticlesFeed(), 'latest')
+latest_atom = cached_feed(AtomLatestArticlesFeed(), 'latest')
+tag_rss = cached_feed(TagFeed(), 'tag')
+tag_atom = cached_feed(AtomTagFeed(), 'tag')
+author_rss = cached_feed(AuthorFeed(), 'author')
+author_atom = cached_feed(AtomAuthorFeed(), 'author')
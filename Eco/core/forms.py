@@ -1,6 +1,8 @@
 from django import forms
-from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth.forms import PasswordResetForm, UserCreationForm
+from django.template import loader
 from .models import User, Article, ResearchPaper
+from .tasks import send_email
 from django.utils.text import slugify
 
 class SignUpForm(UserCreationForm):
@@ -29,8 +31,26 @@ class ResearchPaperForm(forms.ModelForm):
         from django.utils.text import slugify
         return slugify(self.cleaned_data['slug'])
 
+class ChunkedPaperForm(ResearchPaperForm):
+    # finalize step of a chunked upload: the pdf arrives separately
+    class Meta(ResearchPaperForm.Meta):
+        fields = ['title', 'slug', 'abstract', 'content', 'authors', 'published']
+
 class ContactForm(forms.Form):
     name = forms.CharField(max_length=120, required=True, widget=forms.TextInput(attrs={'placeholder': 'Your name'}))
     email = forms.EmailField(required=True, widget=forms.EmailInput(attrs={'placeholder': 'you@example.com'}))
     subject = forms.CharField(max_length=200, required=True, widget=forms.TextInput(attrs={'placeholder': 'Subject'}))
-    message = forms.CharField(required=True, widget=forms.Textarea(attrs={'placeholder': 'Write your message here', 'rows':6}))
\ No newline at end of file
+    message = forms.CharField(required=True, widget=forms.Textarea(attrs={'placeholder': 'Write your message here', 'rows':6}))
+
+
+class QueuedPasswordResetForm(PasswordResetForm):
+    """PasswordResetForm that renders the email and leaves sending it to the task queue."""
+
+    def send_mail(self, subject_template_name, email_template_name, context, from_email, to_email,
+                  html_email_template_name=None):
+        subject = ''.join(loader.render_to_string(subject_template_name, context).splitlines())
+        body = loader.render_to_string(email_template_name, context)
+        html_body = None
+        if html_email_template_name is not None:
+            html_body = loader.render_to_string(html_email_template_name, context)
+        send_email.delay(subject=subject, body=body, to=[to_email], from_email=from_email, html_body=html_body)
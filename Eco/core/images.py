@@ -0,0 +1,143 @@
+# core/images.py
+"""
+Resized variants ("derivatives") of Article.cover_image.
+
+For every width in settings.COVER_IMAGE_WIDTHS we write a WebP file plus a
+JPEG fallback (PNG when the source has transparency) next to the original:
+    articles/images/variants/<name>-<ext>-<width>.webp
+    articles/images/variants/<name>-<ext>-<width>.jpg
+(<ext> is the original's extension, so x.jpeg and x.png don't share names.)
+
+The resizing runs in a process pool so saving an Article never waits for
+Pillow. The result is stored on Article.cover_variants as:
+    {"source": "articles/images/x.jpg",
+     "widths": {"320": {"webp": "...", "fallback": "..."}, ...}}
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WIDTHS = (320, 640, 1280)
+VARIANTS_DIR = 'variants'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def cover_widths():
+    return tuple(getattr(settings, 'COVER_IMAGE_WIDTHS', DEFAULT_WIDTHS))
+
+
+def variant_prefix(source_name):
+    """(folder, file name prefix) of the variants of `source_name`."""
+    folder, filename = os.path.split(source_name)
+    stem, ext = os.path.splitext(filename)
+    return os.path.join(folder, VARIANTS_DIR), f'{stem}-{ext.lstrip(".").lower() or "img"}-'
+
+
+def build_variants(media_root, source_name, widths):
+    """
+    Create the resized files for one image. Runs inside a worker process,
+    so it only uses plain paths and Pillow (no ORM, no storage objects).
+    Returns the cover_variants dict (paths relative to media_root).
+    """
+    from PIL import Image, ImageOps
+
+    source_path = os.path.join(media_root, source_name)
+    out_folder, prefix = variant_prefix(source_name)
+    os.makedirs(os.path.join(media_root, out_folder), exist_ok=True)
+
+    result = {'source': source_name, 'widths': {}}
+    with Image.open(source_path) as img:
+        img = ImageOps.exif_transpose(img)
+        has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+        img = img.convert('RGBA' if has_alpha else 'RGB')
+        fallback_ext, fallback_format = ('png', 'PNG') if has_alpha else ('jpg', 'JPEG')
+
+        for width in sorted(set(widths)):
+            # never upscale: small originals get a single variant at their own width
+            target = min(width, img.width)
+            if str(target) in result['widths']:
+                continue
+            height = max(1, round(img.height * target / img.width))
+            resized = img if target == img.width else img.resize((target, height), Image.LANCZOS)
+
+            names = {
+                'webp': os.path.join(out_folder, f'{prefix}{target}.webp'),
+                'fallback': os.path.join(out_folder, f'{prefix}{target}.{fallback_ext}'),
+            }
+            resized.save(os.path.join(media_root, names['webp']), 'WEBP', quality=80, method=4)
+            fallback_opts = {'optimize': True} if has_alpha else {'quality': 82, 'optimize': True, 'progressive': True}
+            resized.save(os.path.join(media_root, names['fallback']), fallback_format, **fallback_opts)
+            result['widths'][str(target)] = {k: v.replace(os.sep, '/') for k, v in names.items()}
+    return result
+
+
+def get_executor():
+    """Process pool shared by the web process (created on first use)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = getattr(settings, 'IMAGE_VARIANT_WORKERS', 2)
+            _executor = ProcessPoolExecutor(max_workers=workers)
+        return _executor
+
+
+def needs_variants(article):
+    if not article.cover_image:
+        return False
+    variants = article.cover_variants or {}
+    return variants.get('source') != article.cover_image.name or not variants.get('widths')
+
+
+def save_variants(article_pk, variants):
+    """Store the result, unless the cover image changed while we were working."""
+    from .models import Article
+    Article.objects.filter(pk=article_pk, cover_image=variants['source']).update(cover_variants=variants)
+
+
+def _on_done(article_pk, future):
+    # runs in the executor's management thread of the web process
+    try:
+        save_variants(article_pk, future.result())
+    except Exception:
+        logger.exception('Could not build cover variants for article %s', article_pk)
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(article):
+    """
+    Queue the resize of article.cover_image in the process pool.
+    With IMAGE_VARIANTS_ASYNC = False the work happens inline (tests, scripts).
+    """
+    if not needs_variants(article):
+        return None
+    args = (str(settings.MEDIA_ROOT), article.cover_image.name, cover_widths())
+    if not getattr(settings, 'IMAGE_VARIANTS_ASYNC', True):
+        variants = build_variants(*args)
+        save_variants(article.pk, variants)
+        return variants
+    future = get_executor().submit(build_variants, *args)
+    pk = article.pk
+    future.add_done_callback(lambda f: _on_done(pk, f))
+    return future
+
+
+def srcset(variants, kind, storage=None):
+    """'url 320w, url 640w' for kind 'webp' or 'fallback'."""
+    if storage is None:
+        from django.core.files.storage import default_storage as storage
+    widths = (variants or {}).get('widths') or {}
+    parts = []
+    for width in sorted(widths, key=int):
+        name = widths[width].get(kind)
+        if name:
+            parts.append(f'{storage.url(name)} {width}w')
+    return ', '.join(parts)
@@ -0,0 +1,169 @@
+# core/imports.py
+"""
+Bulk article import (`manage.py import_articles`).
+
+Records are streamed from JSONL or CSV and handled in batches:
+  - slug collisions for the whole batch are resolved with one query,
+  - authors are looked up by username with one query,
+  - the batch is written with bulk_create inside one transaction,
+  - the feeds the batch touches are invalidated once (core/feeds.py).
+The article search index (core/search.py) is kept in sync by its SQLite
+triggers as part of the batch INSERT.
+
+Record fields: title (required), slug, summary, content, author (username),
+published, publish_date (ISO 8601), tags (comma-separated string or list).
+"""
+import csv
+import datetime
+import itertools
+import json
+import re
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.text import slugify
+
+from .models import Article
+
+SLUG_MAX = Article._meta.get_field('slug').max_length
+# room for a "-<n>" suffix
+SLUG_BASE_MAX = SLUG_MAX - 10
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'on'}
+
+
+class RecordError(ValueError):
+    pass
+
+
+def read_records(stream, fmt):
+    """Yield dicts from a JSONL or CSV text stream, one at a time."""
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line_no, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            record = {'_error': f'line {line_no}: {exc}'}
+        yield record
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value or '').strip().lower() in TRUE_VALUES
+
+
+def _datetime(value):
+    if not value:
+        return timezone.now()
+    try:
+        parsed = parse_datetime(str(value))
+        day = parse_date(str(value)) if parsed is None else None
+    except ValueError:
+        # well formed but impossible, e.g. 2024-02-30
+        parsed = day = None
+    if parsed is None:
+        if day is None:
+            raise RecordError(f'invalid publish_date {value!r}')
+        parsed = datetime.datetime.combine(day, datetime.time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _tags(value):
+    if isinstance(value, (list, tuple)):
+        value = ', '.join(str(t).strip() for t in value if str(t).strip())
+    return str(value or '').strip()[:Article._meta.get_field('tags').max_length]
+
+
+def clean_record(record):
+    """Validated field dict for one input record (author still a username)."""
+    if record.get('_error'):
+        raise RecordError(record['_error'])
+    title = str(record.get('title') or '').strip()
+    if not title:
+        raise RecordError('title is required')
+    base = slugify(record.get('slug') or title)[:SLUG_BASE_MAX].strip('-') or 'article'
+    return {
+        'title': title[:Article._meta.get_field('title').max_length],
+        'slug': base,
+        'summary': str(record.get('summary') or ''),
+        'content': str(record.get('content') or ''),
+        'author': str(record.get('author') or '').strip(),
+        'published': _bool(record.get('published')),
+        'publish_date': _datetime(record.get('publish_date')),
+        'tags': _tags(record.get('tags')),
+    }
+
+
+def assign_slugs(bases):
+    """
+    Unique slugs for a batch of base slugs, using a single query for the
+    existing `base` and `base-<n>` slugs of the whole batch. The lookups are
+    equality and ranges ('base-' <= slug < 'base.'), so they use the slug index.
+    """
+    unique_bases = sorted(set(bases))
+    condition = Q(slug__in=unique_bases)
+    for base in unique_bases:
+        # '.' sorts right after '-'
+        condition |= Q(slug__gte=base + '-', slug__lt=base + '.')
+    suffixed = re.compile('^(%s)(-[0-9]+)?$' % '|'.join(re.escape(b) for b in unique_bases))
+    taken = {slug for slug in Article.objects.filter(condition).values_list('slug', flat=True)
+             if suffixed.match(slug)}
+    next_suffix = {}
+    slugs = []
+    for base in bases:
+        slug = base
+        if slug in taken:
+            n = next_suffix.get(base, 2)
+            while f'{base}-{n}' in taken:
+                n += 1
+            next_suffix[base] = n + 1
+            slug = f'{base}-{n}'
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
+def import_batch(cleaned, default_author=None):
+    """Insert one batch of cleaned records in a single transaction. Returns the created count."""
+    User = get_user_model()
+    usernames = {c['author'] for c in cleaned if c['author']}
+    authors = {u.username: u for u in User.objects.filter(username__in=usernames)} if usernames else {}
+
+    with transaction.atomic():
+        slugs = assign_slugs([c['slug'] for c in cleaned])
+        articles = []
+        for record, slug in zip(cleaned, slugs):
+            fields = dict(record, slug=slug)
+            fields['author'] = authors.get(record['author'], default_author)
+            articles.append(Article(**fields))
+        Article.objects.bulk_create(articles)
+
+    published = [a for a in articles if a.published]
+    if published:
+        from .related import schedule_updates
+        schedule_updates([a.pk for a in published if a.pk])
+        from .feeds import invalidate_article_feeds
+        tags = set()
+        for article in published:
+            tags.update(article.tags.split(','))
+        invalidate_article_feeds(tags, {a.author_id for a in published})
+    return len(articles)
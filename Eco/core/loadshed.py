@@ -0,0 +1,188 @@
+# core/loadshed.py
+"""
+Adaptive load shedding: when the site is struggling, stop doing the work
+readers won't miss so articles keep loading.
+
+MetricsMiddleware reports each request's start and latency here. At most
+every LOADSHED_CHECK_INTERVAL seconds the controller looks at the p95 of
+the last LOADSHED_WINDOW latencies (none older than LOADSHED_WINDOW_SECONDS)
+and at the most requests seen in flight since the last look:
+  - above LOADSHED_LATENCY_HIGH or LOADSHED_QUEUE_HIGH it starts shedding,
+  - it stops once both stayed under the *_LOW thresholds for
+    LOADSHED_RECOVERY_SECONDS (the gap between the two avoids flapping).
+
+While shedding:
+  - VisitMiddleware doesn't count visits,
+  - search_filters and the visit counters are served from the value
+    cached by stale()/astale() (rewritten at most every tenth of
+    LOADSHED_STALE_TIMEOUT), or left out if there is none,
+  - track_visit also takes the buckets of RATELIMITS['track_visit:shedding'].
+
+Changes of state are logged (logger 'core.loadshed') and counted in the
+loadshed_* metrics. The controller is per process: each worker sheds on its
+own load. LOADSHED_FORCE = True/False pins the state.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'LOADSHED_ENABLED': True,
+    'LOADSHED_WINDOW': 200,
+    'LOADSHED_WINDOW_SECONDS': 60.0,
+    'LOADSHED_CHECK_INTERVAL': 1.0,
+    'LOADSHED_LATENCY_HIGH': 1.0,
+    'LOADSHED_LATENCY_LOW': 0.4,
+    'LOADSHED_QUEUE_HIGH': 32,
+    'LOADSHED_QUEUE_LOW': 8,
+    'LOADSHED_RECOVERY_SECONDS': 30.0,
+    'LOADSHED_STALE_TIMEOUT': 3600,
+}
+# fewer latencies than this say nothing about p95
+MIN_SAMPLES = 20
+
+
+def _setting(name):
+    return getattr(settings, name, DEFAULTS[name])
+
+
+class Controller:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = deque(maxlen=_setting('LOADSHED_WINDOW'))
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.shedding = False
+        self.calm_since = None
+        self.next_check = 0.0
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def finished(self, elapsed, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.in_flight -= 1
+            self.latencies.append((now, elapsed))
+            if now < self.next_check or not _setting('LOADSHED_ENABLED'):
+                return
+            self.next_check = now + _setting('LOADSHED_CHECK_INTERVAL')
+            self._evaluate(now)
+
+    def p95(self):
+        if len(self.latencies) < MIN_SAMPLES:
+            return 0.0
+        ordered = sorted(elapsed for _, elapsed in self.latencies)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    def _evaluate(self, now):
+        # a quiet spell must not leave the last rush's latencies in the window
+        horizon = now - _setting('LOADSHED_WINDOW_SECONDS')
+        while self.latencies and self.latencies[0][0] < horizon:
+            self.latencies.popleft()
+        p95 = self.p95()
+        # the busiest moment since the last check, not only this one
+        queue = self.peak_in_flight
+        self.peak_in_flight = self.in_flight
+        if not self.shedding:
+            if p95 > _setting('LOADSHED_LATENCY_HIGH') or queue > _setting('LOADSHED_QUEUE_HIGH'):
+                self._switch(True, p95, queue)
+        elif p95 < _setting('LOADSHED_LATENCY_LOW') and queue < _setting('LOADSHED_QUEUE_LOW'):
+            if self.calm_since is None:
+                self.calm_since = now
+            if now - self.calm_since >= _setting('LOADSHED_RECOVERY_SECONDS'):
+                self._switch(False, p95, queue)
+        else:
+            self.calm_since = None
+
+    def _switch(self, shedding, p95, queue):
+        self.shedding = shedding
+        self.calm_since = None
+        metrics.LOADSHED_ACTIVE.set(1 if shedding else 0)
+        metrics.LOADSHED_TRANSITIONS.inc(state='shedding' if shedding else 'normal')
+        log = logger.warning if shedding else logger.info
+        log('load shedding %s: p95 latency %.3fs over %d requests, up to %d in flight',
+            'started' if shedding else 'stopped', p95, len(self.latencies), queue)
+
+
+controller = Controller()
+
+
+def shedding():
+    """True while non-essential work should be skipped."""
+    forced = getattr(settings, 'LOADSHED_FORCE', None)
+    if forced is not None:
+        return bool(forced)
+    return controller.shedding
+
+
+def skip(feature):
+    """shedding(), counting a skip of `feature` when it is True."""
+    if shedding():
+        metrics.LOADSHED_SKIPPED.inc(feature=feature)
+        return True
+    return False
+
+
+# a remembered value is rewritten once it is older than this part of
+# LOADSHED_STALE_TIMEOUT, not on every request
+STALE_REFRESH_FRACTION = 0.1
+
+
+def _stale_key(key):
+    # holds (stored at, value)
+    return 'loadshed-stale:' + key
+
+
+def _served(entry):
+    # entry: (stored at, value) or None
+    metrics.CACHE_REQUESTS.inc(cache='loadshed', result='miss' if entry is None else 'hit')
+    return None if entry is None else entry[1]
+
+
+def _needs_refresh(entry, now):
+    return entry is None or now - entry[0] > _setting('LOADSHED_STALE_TIMEOUT') * STALE_REFRESH_FRACTION
+
+
+def stale(key, compute, feature):
+    """
+    compute(), remembered under `key`; while shedding the remembered value
+    is returned instead (None if there is none) and compute isn't called.
+    """
+    entry = cache.get(_stale_key(key))
+    if skip(feature):
+        return _served(entry)
+    value = compute()
+    now = time.time()
+    if _needs_refresh(entry, now):
+        cache.set(_stale_key(key), (now, value), _setting('LOADSHED_STALE_TIMEOUT'))
+    return value
+
+
+async def astale(key, acompute, feature):
+    """stale() for async callers; `acompute` is a coroutine function."""
+    entry = await cache.aget(_stale_key(key))
+    if skip(feature):
+        return _served(entry)
+    value = await acompute()
+    now = time.time()
+    if _needs_refresh(entry, now):
+        await cache.aset(_stale_key(key), (now, value), _setting('LOADSHED_STALE_TIMEOUT'))
+    return value
+
+
+def reset():
+    global controller
+    controller = Controller()
+    metrics.LOADSHED_ACTIVE.set(0)
@@ -0,0 +1,80 @@
+# core/management/commands/bench_revisions.py
+import json
+import random
+import time
+import zlib
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Article, ArticleRevision
+from core.revisions import rebuild
+
+WORDS = ('solar wind ocean carbon forest river climate energy policy grid storage soil '
+         'water city transport emissions biodiversity recycling farming heat').split()
+
+
+def paragraph(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(30, 80))) + '\n'
+
+
+class Command(BaseCommand):
+    help = ("Benchmark delta revision storage against storing a full copy per revision. "
+            "Runs inside a transaction that is rolled back; prints JSON.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--revisions', type=int, default=200)
+        parser.add_argument('--paragraphs', type=int, default=60)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        lines = [paragraph(rng) for _ in range(options['paragraphs'])]
+        full_raw = full_compressed = 0
+
+        with transaction.atomic():
+            article = Article.objects.create(title='Revision benchmark', slug=f'bench-revisions-{time.time_ns()}',
+                                             content=''.join(lines))
+            started = time.perf_counter()
+            for _ in range(options['revisions'] - 1):
+                # a typical edit: rewrite, insert or delete a paragraph or two
+                for _ in range(rng.randint(1, 2)):
+                    action = rng.random()
+                    i = rng.randrange(len(lines))
+                    if action < 0.6:
+                        lines[i] = paragraph(rng)
+                    elif action < 0.85 or len(lines) < 5:
+                        lines.insert(i, paragraph(rng))
+                    else:
+                        del lines[i]
+                article.content = ''.join(lines)
+                article.save()
+            save_seconds = time.perf_counter() - started
+
+            revisions = list(ArticleRevision.objects.filter(article=article).values_list('number', 'data'))
+            delta_bytes = sum(len(bytes(data)) for _, data in revisions)
+
+            started = time.perf_counter()
+            worst = 0.0
+            for number, _ in revisions:
+                t = time.perf_counter()
+                text = rebuild(article.pk, number)
+                worst = max(worst, time.perf_counter() - t)
+                full_raw += len(text.encode('utf-8'))
+                full_compressed += len(zlib.compress(text.encode('utf-8'), 9))
+            rebuild_seconds = time.perf_counter() - started
+            transaction.set_rollback(True)
+
+        report = {
+            'revisions': len(revisions),
+            'final_content_bytes': len(''.join(lines).encode('utf-8')),
+            'full_copy_bytes': full_raw,
+            'full_copy_compressed_bytes': full_compressed,
+            'delta_bytes': delta_bytes,
+            'delta_vs_full_copy': round(delta_bytes / full_raw, 4),
+            'delta_vs_compressed_full_copy': round(delta_bytes / full_compressed, 4),
+            'save_ms_avg': round(save_seconds * 1000 / max(1, len(revisions) - 1), 3),
+            'rebuild_ms_avg': round(rebuild_seconds * 1000 / len(revisions), 3),
+            'rebuild_ms_worst': round(worst * 1000, 3),
+        }
+        self.stdout.write(json.dumps(report, indent=2))
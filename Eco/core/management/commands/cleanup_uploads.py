@@ -0,0 +1,20 @@
+# core/management/commands/cleanup_uploads.py
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from core.uploads import collect_garbage
+
+
+class Command(BaseCommand):
+    help = "Delete abandoned chunked uploads and their temp files (run from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=int, default=None,
+                            help='seconds without new data before an upload is dropped '
+                                 '(default: settings.CHUNKED_UPLOAD_EXPIRY)')
+
+    def handle(self, *args, **options):
+        max_age = timedelta(seconds=options['max_age']) if options['max_age'] is not None else None
+        removed = collect_garbage(max_age=max_age)
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} abandoned upload(s).'))
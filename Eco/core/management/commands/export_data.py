@@ -0,0 +1,38 @@
+# core/management/commands/export_data.py
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from core.exports import CHUNK_SIZE, EXPORTS, FORMATS, filter_dates, stream_export
+
+
+def _date(value):
+    day = parse_date(value)
+    if day is None:
+        raise CommandError(f'invalid date {value!r} (expected YYYY-MM-DD)')
+    return day
+
+
+class Command(BaseCommand):
+    help = "Stream visit analytics or article metadata to CSV / NDJSON with constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(EXPORTS))
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--since', type=_date, help='first day to include (YYYY-MM-DD)')
+        parser.add_argument('--until', type=_date, help='last day to include (YYYY-MM-DD)')
+        parser.add_argument('--output', '-o', help='file to write (default: stdout)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        export = EXPORTS[options['dataset']]
+        queryset = filter_dates(export, export.queryset(), options['since'], options['until'])
+        chunks = stream_export(export, queryset, options['format'], chunk_size=options['chunk_size'])
+
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as out:
+                for chunk in chunks:
+                    out.write(chunk)
+            self.stderr.write(self.style.SUCCESS(f"Wrote {options['output']}."))
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
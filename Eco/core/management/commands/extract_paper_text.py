@@ -0,0 +1,81 @@
+# core/management/commands/extract_paper_text.py
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+
+from core.models import PaperText, ResearchPaper
+from core.pdftext import extract_worker
+from core.search import reindex_paper_metadata, store_paper_text
+from core.storage import BLOB_PREFIX
+
+
+def known_digest(name):
+    """Content-addressed blobs carry their SHA-256 in the name (core/storage.py)."""
+    if name and name.startswith(BLOB_PREFIX + '/'):
+        return os.path.splitext(os.path.basename(name))[0]
+    return None
+
+
+class Command(BaseCommand):
+    help = ("Extract text from research-paper PDFs in a process pool and index it for search. "
+            "Only papers whose PDF hash changed are processed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'PAPER_TEXT_WORKERS', 2))
+        parser.add_argument('--force', action='store_true', help='re-extract every PDF')
+        parser.add_argument('--watch', type=int, default=0, metavar='SECONDS',
+                            help='keep running, polling for new PDFs every SECONDS')
+
+    def handle(self, *args, **options):
+        with ProcessPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            while True:
+                self.run_once(pool, options['force'])
+                if not options['watch']:
+                    break
+                time.sleep(options['watch'])
+
+    def run_once(self, pool, force=False):
+        stored = dict(PaperText.objects.values_list('paper_id', 'file_hash'))
+        max_chars = getattr(settings, 'PAPER_TEXT_MAX_CHARS', 2_000_000)
+
+        futures = {}
+        skipped = 0
+        for paper in ResearchPaper.objects.exclude(pdf='').exclude(pdf__isnull=True).only('pk', 'pdf').iterator():
+            previous = None if force else stored.get(paper.pk)
+            if previous and previous == known_digest(paper.pdf.name):
+                skipped += 1
+                continue
+            # the worker hashes non-blob files and skips them when unchanged
+            future = pool.submit(extract_worker, paper.pdf.path, previous, max_chars)
+            futures[future] = paper.pk
+
+        extracted = failed = 0
+        for future in as_completed(futures):
+            digest, text, error = future.result()
+            paper = ResearchPaper.objects.get(pk=futures[future])
+            if error:
+                failed += 1
+                self.stderr.write(f'{paper.slug}: {error}')
+                store_paper_text(paper, digest, '', error=error)
+            elif text is None:
+                skipped += 1
+            else:
+                extracted += 1
+                store_paper_text(paper, digest, text)
+
+        # title/abstract edits only need the index row rewritten, not a new extraction
+        stale = PaperText.objects.filter(indexed=True).filter(
+            ~Q(indexed_title=F('paper__title')) | ~Q(indexed_abstract=F('paper__abstract'))
+        ).select_related('paper')
+        reindexed = 0
+        for paper_text in stale.iterator():
+            reindex_paper_metadata(paper_text)
+            reindexed += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Extracted {extracted}, unchanged {skipped}, failed {failed}, re-indexed {reindexed}.'
+        ))
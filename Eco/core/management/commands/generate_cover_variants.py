@@ -0,0 +1,40 @@
+# core/management/commands/generate_cover_variants.py
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.images import build_variants, cover_widths, needs_variants, save_variants
+from core.models import Article
+
+
+class Command(BaseCommand):
+    help = "Build resized cover image variants for existing articles (backfill)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'IMAGE_VARIANT_WORKERS', 2))
+        parser.add_argument('--force', action='store_true', help='rebuild variants that already exist')
+
+    def handle(self, *args, **options):
+        articles = (Article.objects.exclude(cover_image='').exclude(cover_image__isnull=True)
+                    .only('pk', 'cover_image', 'cover_variants').order_by('pk'))
+        todo = [a for a in articles.iterator() if options['force'] or needs_variants(a)]
+        if not todo:
+            self.stdout.write('All cover images already have variants.')
+            return
+
+        media_root = str(settings.MEDIA_ROOT)
+        widths = cover_widths()
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            futures = {pool.submit(build_variants, media_root, a.cover_image.name, widths): a for a in todo}
+            for future in as_completed(futures):
+                article = futures[future]
+                try:
+                    save_variants(article.pk, future.result())
+                    done += 1
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f'{article.cover_image.name}: {exc}')
+
+        self.stdout.write(self.style.SUCCESS(f'Built variants for {done} article(s), {failed} failed.'))
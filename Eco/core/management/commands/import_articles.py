@@ -0,0 +1,104 @@
+# core/management/commands/import_articles.py
+import json
+import os
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.imports import RecordError, batched, clean_record, import_batch, read_records
+
+
+class Command(BaseCommand):
+    help = ("Bulk-import articles from JSONL or CSV in transactional batches. "
+            "Progress is checkpointed after every committed batch; rerun with --resume "
+            "to continue after a failure.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="input file, or '-' for stdin")
+        parser.add_argument('--format', choices=['jsonl', 'csv'],
+                            help='input format (default: from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--default-author', help='username for records without a known author')
+        parser.add_argument('--state', help='checkpoint file (default: <path>.import-state)')
+        parser.add_argument('--resume', action='store_true', help='skip records already imported')
+        parser.add_argument('--rejects', help='write records that could not be imported here (JSONL)')
+        parser.add_argument('--keep-going', action='store_true',
+                            help='write a failed batch to --rejects and continue instead of stopping')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+        state_path = options['state'] or (None if path == '-' else path + '.import-state')
+        if options['resume'] and not state_path:
+            raise CommandError('--resume needs --state when reading stdin')
+
+        default_author = None
+        if options['default_author']:
+            default_author = get_user_model().objects.filter(username=options['default_author']).first()
+            if default_author is None:
+                raise CommandError(f"unknown user {options['default_author']!r}")
+
+        done = 0
+        if options['resume'] and state_path and os.path.exists(state_path):
+            with open(state_path) as f:
+                done = json.load(f).get('records', 0)
+
+        rejects = open(options['rejects'], 'a', encoding='utf-8') if options['rejects'] else None
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        created = rejected = 0
+        position = 0
+        try:
+            for batch in batched(read_records(stream, fmt), max(1, options['batch_size'])):
+                if position + len(batch) <= done:
+                    position += len(batch)
+                    continue
+                # a resumed run may start in the middle of a batch
+                batch = batch[max(0, done - position):]
+                start = max(position, done)
+                position = start + len(batch)
+
+                cleaned = []  # (raw record, cleaned record)
+                for offset, record in enumerate(batch):
+                    try:
+                        cleaned.append((record, clean_record(record)))
+                    except RecordError as exc:
+                        rejected += 1
+                        self._reject(rejects, record, f'record {start + offset + 1}: {exc}')
+
+                if cleaned:
+                    try:
+                        created += import_batch([item for _, item in cleaned], default_author=default_author)
+                    except Exception as exc:
+                        message = f'batch starting at record {start + 1} failed: {exc}'
+                        if not options['keep_going']:
+                            raise CommandError(message + ' (fix the input and rerun with --resume)')
+                        self.stderr.write(message)
+                        # records clean_record turned down are already counted
+                        rejected += len(cleaned)
+                        for record, _ in cleaned:
+                            self._reject(rejects, record, message)
+
+                self._checkpoint(state_path, position)
+                self.stdout.write(f'{position} records read, {created} imported')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            if rejects:
+                rejects.close()
+
+        self.stdout.write(self.style.SUCCESS(f'Imported {created} article(s), rejected {rejected}.'))
+
+    def _checkpoint(self, state_path, records):
+        if not state_path:
+            return
+        tmp = state_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'records': records}, f)
+        os.replace(tmp, state_path)
+
+    def _reject(self, rejects, record, reason):
+        if rejects is None:
+            self.stderr.write(reason)
+            return
+        rejects.write(json.dumps({'error': reason, 'record': record}, default=str) + '\n')
@@ -0,0 +1,32 @@
+# core/management/commands/prune_revisions.py
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import ArticleRevision
+from core.revisions import prune
+
+
+class Command(BaseCommand):
+    help = "Apply the article revision retention policy (run from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', type=int, default=getattr(settings, 'ARTICLE_REVISIONS_KEEP', 100),
+                            help='revisions to keep per article (0: no count limit)')
+        parser.add_argument('--max-age-days', type=int,
+                            default=getattr(settings, 'ARTICLE_REVISIONS_MAX_AGE_DAYS', None),
+                            help='drop revisions older than this (the newest one is always kept)')
+
+    def handle(self, *args, **options):
+        keep = options['keep'] or None
+        before = None
+        if options['max_age_days']:
+            before = timezone.now() - timedelta(days=options['max_age_days'])
+
+        article_ids = ArticleRevision.objects.order_by().values_list('article_id', flat=True).distinct()
+        deleted = 0
+        for article_id in article_ids.iterator():
+            deleted += prune(article_id, keep=keep, before=before)
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} revision(s).'))
@@ -0,0 +1,18 @@
+# core/management/commands/rebuild_search_index.py
+from django.core.management.base import BaseCommand
+
+from core.models import ResearchPaper
+from core.search import create_article_index, index_paper_metadata
+
+
+class Command(BaseCommand):
+    help = ("Recreate the article full-text index and its triggers (e.g. after a migration rebuilt "
+            "core_article) and index papers that are missing from the paper index.")
+
+    def handle(self, *args, **options):
+        create_article_index()
+        papers = 0
+        for paper in ResearchPaper.objects.filter(text__isnull=True).iterator():
+            index_paper_metadata(paper)
+            papers += 1
+        self.stdout.write(self.style.SUCCESS(f'Article index rebuilt; {papers} paper(s) added to the paper index.'))
@@ -0,0 +1,12 @@
+# core/management/commands/recount_blobs.py
+from django.core.management.base import BaseCommand
+
+from core.storage import recount
+
+
+class Command(BaseCommand):
+    help = "Correct StoredBlob reference counts from the file fields (after update() or bulk_create() of file names)."
+
+    def handle(self, *args, **options):
+        fixed = recount()
+        self.stdout.write(self.style.SUCCESS(f'Corrected {fixed} reference count(s).'))
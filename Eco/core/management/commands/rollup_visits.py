@@ -0,0 +1,21 @@
+# core/management/commands/rollup_visits.py
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from core.rollups import rollup_recent, rollup_visits
+
+
+class Command(BaseCommand):
+    help = "Refresh the per-day Visit rollups used by the admin (run from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=2, help='recompute the last N days (default 2)')
+        parser.add_argument('--all', action='store_true', help='recompute every day')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            written = rollup_visits(datetime.date.min, datetime.date.max)
+        else:
+            written = rollup_recent(max(1, options['days']))
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {written} day(s).'))
@@ -0,0 +1,116 @@
+# core/management/commands/run_benchmark.py
+import json
+import sys
+import threading
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core import bench
+
+
+class Command(BaseCommand):
+    help = ("Load-test the index, article detail, search, track_visit and dashboard pages with "
+            "concurrent clients and print throughput and p50/p95/p99 latencies as JSON. "
+            "Compare against an earlier run with --baseline, or WSGI against ASGI with "
+            "--compare-servers.")
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group()
+        target.add_argument('--url', default='http://127.0.0.1:8000', help='base URL of a running server')
+        target.add_argument('--serve', action='store_true',
+                            help='start a threaded WSGI server in this process and benchmark it')
+        target.add_argument('--compare-servers', action='store_true',
+                            help='run the load against the WSGI dev server, then against uvicorn with '
+                                 'the async views, each in its own process (needs uvicorn)')
+        parser.add_argument('--port', type=int, default=8765, help='port for --serve/--compare-servers')
+        parser.add_argument('--workers', type=int, default=1, help='uvicorn worker processes')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=30.0, help='seconds to run')
+        parser.add_argument('--requests', type=int, help='stop after this many requests')
+        parser.add_argument('--warmup', type=float, default=2.0, help='seconds of unmeasured warm-up')
+        parser.add_argument('--scenario', action='append',
+                            help='only run these scenarios (index, article_detail, search, track_visit, dashboard)')
+        parser.add_argument('--user', help='username for the dashboard scenario (default: first bench user)')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='also write the report to this file')
+        parser.add_argument('--baseline', help='report from an earlier run to compare against')
+        parser.add_argument('--max-regression', type=float, default=10.0,
+                            help='percent p95/throughput change tolerated against --baseline')
+
+    def handle(self, *args, **options):
+        scenarios = bench.default_scenarios(options['seed'])
+        if options['scenario']:
+            unknown = set(options['scenario']) - {s.name for s in scenarios}
+            if unknown:
+                raise CommandError(f'unknown scenario(s): {", ".join(sorted(unknown))}')
+            scenarios = [s for s in scenarios if s.name in options['scenario']]
+
+        User = get_user_model()
+        users = User.objects.filter(username=options['user']) if options['user'] else \
+            User.objects.filter(username__startswith='bench_user_').order_by('pk')
+        user = users.first()
+        session_cookie = bench.login_cookie(user) if user else None
+        if user is None and any(s.logged_in for s in scenarios):
+            self.stderr.write('No user for the dashboard scenario; skipping it (see --user).')
+
+        runner_options = dict(
+            concurrency=options['concurrency'], duration=options['duration'], requests=options['requests'],
+            session_cookie=session_cookie, seed=options['seed'], warmup=options['warmup'],
+        )
+        if options['compare_servers']:
+            try:
+                bench.server_command('asgi', options['port'])
+            except RuntimeError as exc:
+                raise CommandError(str(exc))
+            report = {}
+            for kind in ('wsgi', 'asgi'):
+                try:
+                    process = bench.start_server(kind, options['port'], options['workers'])
+                except RuntimeError as exc:
+                    raise CommandError(str(exc))
+                try:
+                    report[kind] = bench.BenchmarkRunner(
+                        f"http://127.0.0.1:{options['port']}", scenarios, **runner_options).run()
+                finally:
+                    bench.stop_server(process)
+            report['asgi_vs_wsgi'] = bench.compare_servers(report)
+        else:
+            base_url = options['url']
+            server = None
+            if options['serve']:
+                server, base_url = self._serve(options['port'])
+            try:
+                report = bench.BenchmarkRunner(base_url, scenarios, **runner_options).run()
+            finally:
+                if server is not None:
+                    server.shutdown()
+                    server.server_close()
+
+        text = json.dumps(report, indent=2)
+        self.stdout.write(text)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(text + '\n')
+        if options['baseline'] and 'scenarios' in report:
+            problems = bench.compare(report, bench.load_report(options['baseline']), options['max_regression'])
+            for problem in problems:
+                self.stderr.write(f'REGRESSION {problem}')
+            if problems:
+                sys.exit(1)
+
+    def _serve(self, port):
+        from django.core.servers.basehttp import WSGIRequestHandler, WSGIServer, get_internal_wsgi_application
+        import socketserver
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_message(self, *args):
+                pass
+
+        class ThreadedServer(socketserver.ThreadingMixIn, WSGIServer):
+            daemon_threads = True
+
+        server = ThreadedServer(('127.0.0.1', port), QuietHandler)
+        server.set_app(get_internal_wsgi_application())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server, f'http://127.0.0.1:{port}'
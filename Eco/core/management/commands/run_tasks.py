@@ -0,0 +1,50 @@
+# core/management/commands/run_tasks.py
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils.module_loading import autodiscover_modules
+
+from core import tasks
+
+
+class Command(BaseCommand):
+    help = "Run jobs from the database task queue (core/tasks.py). Start one or more per host."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lanes', default='',
+                            help='comma-separated lanes to serve, in priority order (default: all)')
+        parser.add_argument('--batch', type=int, default=10, help='jobs claimed at a time (default 10)')
+        parser.add_argument('--sleep', type=float, default=1.0,
+                            help='seconds to wait when the queue is empty (default 1)')
+        parser.add_argument('--once', action='store_true', help='exit once no job is due')
+        parser.add_argument('--worker', default='', help='worker name recorded on claimed jobs')
+
+    def handle(self, *args, **options):
+        # tasks are registered when their module is imported
+        autodiscover_modules('tasks')
+        lane_names = [lane.strip() for lane in options['lanes'].split(',') if lane.strip()] or None
+        unknown = set(lane_names or ()) - set(tasks.lanes())
+        if unknown:
+            raise CommandError(f"Unknown lane(s) {', '.join(sorted(unknown))}; TASK_LANES is {tasks.lanes()}.")
+        worker = options['worker'] or f'{socket.gethostname()}:{os.getpid()}'
+        batch = max(1, options['batch'])
+
+        total_done = total_failed = 0
+        try:
+            while True:
+                close_old_connections()
+                done, failed = tasks.run_batch(worker, lane_names, batch)
+                total_done += done
+                total_failed += failed
+                if done or failed:
+                    self.stdout.write(f'{done} done, {failed} failed')
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Worker {worker}: {total_done} done, {total_failed} failed.'))
@@ -0,0 +1,43 @@
+# core/management/commands/seed_bench_data.py
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import bench
+
+
+class Command(BaseCommand):
+    help = ("Bulk-generate benchmark data: bench users, articles, research papers and Visit rows. "
+            "Rerunning tops the data up to the requested volumes; --clear removes it.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articles', type=int, default=100_000)
+        parser.add_argument('--authors', type=int, default=10_000)
+        parser.add_argument('--papers', type=int, default=5_000)
+        parser.add_argument('--visits', type=int, default=10_000_000)
+        parser.add_argument('--days', type=int, default=365, help='spread dates over this many days')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--clear', action='store_true', help='delete existing bench data first')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        started = time.monotonic()
+
+        def step(label, func, *args):
+            t0 = time.monotonic()
+            result = func(*args)
+            self.stdout.write(f'{label}: {time.monotonic() - t0:.1f}s')
+            return result
+
+        if options['clear']:
+            step('cleared bench data', bench.clear_bench_data)
+        author_ids = step(f"{options['authors']} authors", bench.seed_authors, options['authors'], rng)
+        step(f"{options['articles']} articles", bench.seed_articles,
+             options['articles'], author_ids, rng, options['days'])
+        step(f"{options['papers']} papers", bench.seed_papers, options['papers'], author_ids, rng)
+        if options['visits']:
+            step(f"{options['visits']} visits", bench.seed_visits,
+                 options['visits'], author_ids, rng, options['days'])
+        self.stdout.write(self.style.SUCCESS(f'Seeded in {time.monotonic() - started:.1f}s. '
+                                             f'Run `manage.py rollup_visits` to refresh the daily totals.'))
@@ -0,0 +1,330 @@
+# core/metrics.py
+"""
+In-process metrics: counters, gauges and fixed-bucket histograms, exposed
+in the Prometheus text format at /metrics.
+
+    from core import metrics
+    metrics.VISIT_WRITES.inc(source='track_visit')
+    metrics.SEARCH_LATENCY.observe(0.012)
+
+Updates are a dict operation under a lock. With several worker processes
+set METRICS_DIR: each process then writes its values to its own file in
+that directory (at most every METRICS_FLUSH_INTERVAL seconds, and at exit),
+and /metrics adds up the files of all processes. Counters and histograms of
+processes that have exited are folded into an archive file so they keep
+counting; their gauges are dropped.
+"""
+import atexit
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, compaction is skipped
+    fcntl = None
+
+# seconds; good for page latencies and query times
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+REGISTRY = {}
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labels)
+        self._values = {}
+        REGISTRY[name] = self
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def value(self, **labels):
+        with _lock:
+            return self._values.get(self._key(labels))
+
+    def samples(self):
+        with _lock:
+            return [(key, list(v) if isinstance(v, list) else v) for key, v in self._values.items()]
+
+    def reset(self):
+        with _lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        _maybe_flush()
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = value
+        _maybe_flush()
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        _maybe_flush()
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Per label set: [count in bucket 0, ..., count above the last bucket, sum]."""
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * (len(self.buckets) + 2)
+            entry[slot] += 1
+            entry[-1] += value
+        _maybe_flush()
+
+
+# ---------------------------------------------------------------------------
+# The site's metrics
+# ---------------------------------------------------------------------------
+
+REQUESTS = Counter('http_requests_total', 'Requests by route, method and status.', ('route', 'method', 'status'))
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Time to produce the response.', ('route',))
+REQUEST_DB_TIME = Histogram('http_request_db_seconds', 'Database time per request.', ('route',))
+DB_QUERIES = Counter('db_queries_total', 'SQL queries executed while handling requests.', ('route',))
+IN_FLIGHT = Gauge('http_requests_in_progress', 'Requests being handled right now.')
+SESSION_WRITES = Counter('session_writes_total', 'Requests that saved their session.')
+VISIT_WRITES = Counter('visit_writes_total', 'Visit row increments.', ('source',))
+SEARCH_QUERIES = Counter('search_queries_total', 'Site searches by outcome.', ('result',))
+SEARCH_LATENCY = Histogram('search_query_duration_seconds', 'Time to fetch a page of search results.')
+RATELIMIT_CHECKED = Counter('ratelimit_checked_total', 'Requests checked by the rate limiter.', ('rule',))
+RATELIMIT_DENIED = Counter('ratelimit_denied_total', 'Requests refused with 429 by the rate limiter.', ('rule',))
+CACHE_REQUESTS = Counter('cache_requests_total', 'Cache lookups by cache and result.', ('cache', 'result'))
+COMPRESSION_RESPONSES = Counter('compression_responses_total', 'Compressed responses.', ('route', 'encoding'))
+COMPRESSION_BYTES_IN = Counter('compression_bytes_in_total', 'Bytes before compression.', ('route', 'encoding'))
+COMPRESSION_BYTES_OUT = Counter('compression_bytes_out_total', 'Bytes after compression.', ('route', 'encoding'))
+COMPRESSION_CPU = Counter('compression_cpu_seconds_total', 'CPU time spent compressing.', ('route', 'encoding'))
+TASKS_ENQUEUED = Counter('tasks_enqueued_total', 'Jobs added to the task queue.', ('lane',))
+TASKS_RUN = Counter('tasks_run_total', 'Task queue job runs by outcome (done, retry, dead).', ('task', 'result'))
+LOADSHED_ACTIVE = Gauge('loadshed_active', '1 while this process is shedding non-essential work.')
+LOADSHED_TRANSITIONS = Counter('loadshed_transitions_total', 'Load-shedding state changes.', ('state',))
+LOADSHED_SKIPPED = Counter('loadshed_skipped_total', 'Non-essential work skipped while shedding.', ('feature',))
+
+
+# ---------------------------------------------------------------------------
+# Multi-process store
+# ---------------------------------------------------------------------------
+
+_flush_state = {'pid': os.getpid(), 'token': uuid.uuid4().hex[:8], 'last': 0.0}
+ARCHIVE = 'metrics-archive.json'
+
+
+def metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None)
+
+
+def _own_file(directory):
+    return os.path.join(directory, f'metrics-{_flush_state["pid"]}-{_flush_state["token"]}.json')
+
+
+def _snapshot():
+    data = {}
+    for name, metric in list(REGISTRY.items()):
+        samples = metric.samples()
+        if samples:
+            data[name] = [[list(key), value] for key, value in samples]
+    return data
+
+
+def _write_json(path, data):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(tmp, path)
+
+
+def _after_fork():
+    """A forked worker starts from the parent's values: forget them, they are the parent's to report."""
+    global _lock
+    # another thread may have held the lock at fork time
+    _lock = threading.Lock()
+    for metric in REGISTRY.values():
+        metric._values.clear()
+    _flush_state.update(pid=os.getpid(), token=uuid.uuid4().hex[:8], last=0.0)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def flush():
+    directory = metrics_dir()
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    _write_json(_own_file(directory), _snapshot())
+    _flush_state['last'] = time.monotonic()
+
+
+def _maybe_flush():
+    if metrics_dir() is None:
+        return
+    if time.monotonic() - _flush_state['last'] >= getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0):
+        try:
+            flush()
+        except OSError:
+            # metrics must never break a request
+            pass
+
+
+def _flush_at_exit():
+    if metrics_dir():
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+atexit.register(_flush_at_exit)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _merge(total, data, include_gauges=True):
+    for name, samples in data.items():
+        metric = REGISTRY.get(name)
+        if metric is None or (metric.kind == 'gauge' and not include_gauges):
+            continue
+        values = total.setdefault(name, {})
+        for key, value in samples:
+            key = tuple(key)
+            if isinstance(value, list):
+                current = values.get(key)
+                values[key] = [a + b for a, b in zip(current, value)] if current else list(value)
+            else:
+                values[key] = values.get(key, 0) + value
+    return total
+
+
+def _compact(directory):
+    """Fold the files of exited processes into the archive (counters and histograms only)."""
+    if fcntl is None:
+        return
+    with open(os.path.join(directory, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        dead = []
+        for path in glob.glob(os.path.join(directory, 'metrics-*-*.json')):
+            pid = int(os.path.basename(path).split('-')[1])
+            if not _pid_alive(pid):
+                dead.append(path)
+        if not dead:
+            return
+        archive_path = os.path.join(directory, ARCHIVE)
+        archive = {}
+        _merge(archive, _read_json(archive_path), include_gauges=False)
+        for path in dead:
+            _merge(archive, _read_json(path), include_gauges=False)
+        _write_json(archive_path, {name: [[list(k), v] for k, v in values.items()]
+                                   for name, values in archive.items()})
+        for path in dead:
+            os.remove(path)
+
+
+def collect():
+    """{metric name: {label tuple: value}} for this process, or for all processes when METRICS_DIR is set."""
+    directory = metrics_dir()
+    if not directory:
+        return {name: dict(metric.samples()) for name, metric in REGISTRY.items()}
+    flush()
+    _compact(directory)
+    total = _merge({}, _read_json(os.path.join(directory, ARCHIVE)))
+    for path in glob.glob(os.path.join(directory, 'metrics-*-*.json')):
+        _merge(total, _read_json(path))
+    return total
+
+
+# ---------------------------------------------------------------------------
+# Exposition
+# ---------------------------------------------------------------------------
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+    return str(value)
+
+
+def render_text():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    values = collect()
+    for name, metric in sorted(REGISTRY.items()):
+        lines.append(f'# HELP {name} {metric.help}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        for key, value in sorted(values.get(name, {}).items()):
+            if metric.kind != 'histogram':
+                lines.append(f'{name}{_labels(metric.labelnames, key)} {_number(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets, value):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(metric.labelnames, key, [("le", bound)])} {cumulative}')
+            count = cumulative + value[-2]
+            lines.append(f'{name}_bucket{_labels(metric.labelnames, key, [("le", "+Inf")])} {count}')
+            lines.append(f'{name}_sum{_labels(metric.labelnames, key)} {_number(value[-1])}')
+            lines.append(f'{name}_count{_labels(metric.labelnames, key)} {count}')
+    return '\n'.join(lines) + '\n'
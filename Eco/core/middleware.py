@@ -1,8 +1,24 @@
 # core/middleware.py
 import datetime
+import mimetypes
+import os
+import random
+import re
+import sys
+import time
+from urllib.parse import unquote
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.utils import timezone
 from django.conf import settings
-from django.db import models
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.db import connection, models
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags
+from . import compression, loadshed, metrics, profiling
+from .downloads import file_etag
 from .models import Visit
 
 # throttle: how often to count the same session/user (seconds)
@@ -10,21 +26,40 @@ THROTTLE_SECONDS = 0  # default: once per hour
 
 # Paths we should skip counting (the heartbeat endpoint will be added separately)
 THROTTLE_SECONDS = 0
-SKIP_PATHS = ["/track-visit/"]
+SKIP_PATHS = ["/track-visit/", "/metrics"]
 
 
-class VisitMiddleware:
+class HybridMiddleware:
     """
-    Middleware to track visits per day.
-      - uses session key or user to identify the visitor,
-      - increases today's Visit.count at most once per THROTTLE_SECONDS,
-      - stores `last_visit_time` in session for throttle.
+    Base for middleware that runs natively under both WSGI and ASGI:
+    subclasses implement call() and acall(); in an async chain acall() is
+    used, so requests don't hop to a thread at this layer.
     """
+    sync_capable = True
+    async_capable = True
 
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if self.async_mode:
+            return self.acall(request)
+        return self.call(request)
+
+
+class VisitMiddleware(HybridMiddleware):
+    """
+    Middleware to track visits per day.
+      - uses session key or user to identify the visitor,
+      - increases today's Visit.count at most once per THROTTLE_SECONDS,
+      - stores `last_visit_time` in session for throttle,
+      - counts nothing while the site is shedding load (core/loadshed.py).
+    """
+
+    def call(self, request):
         # call view
         response = self.get_response(request)
 
@@ -37,28 +72,36 @@ class VisitMiddleware:
 
         return response
 
-    def process_visit(self, request):
+    async def acall(self, request):
+        response = await self.get_response(request)
+        try:
+            await self.aprocess_visit(request)
+        except Exception:
+            pass
+        return response
+
+    @staticmethod
+    def counts(request):
         # Only count safe HTTP methods; avoid counting AJAX non-GET resources
         if request.method != "GET":
-            return
+            return False
 
         path = (request.path or "").lower()
 
         # skip static/media/admin and the tracking endpoint
         if settings.STATIC_URL and path.startswith(settings.STATIC_URL):
-            return
+            return False
         if settings.MEDIA_URL and path.startswith(settings.MEDIA_URL):
-            return
+            return False
         if path.startswith("/admin/"):
-            return
+            return False
         if path in SKIP_PATHS:
-            return
-
-        session = request.session
-        now = timezone.now()
+            return False
+        return True
 
+    @staticmethod
+    def throttled(last_ts, now):
         # read last visit time (isoformat stored)
-        last_ts = session.get("last_visit_time")
         if last_ts:
             try:
                 # parse isoformat; handle naive/tz-aware robustly
@@ -71,7 +114,15 @@ class VisitMiddleware:
             last_time = now - datetime.timedelta(seconds=THROTTLE_SECONDS + 1)
 
         # Throttle - only count if enough time elapsed since last count
-        if (now - last_time).total_seconds() < THROTTLE_SECONDS:
+        return (now - last_time).total_seconds() < THROTTLE_SECONDS
+
+    def process_visit(self, request):
+        if not self.counts(request) or loadshed.skip("visit_tracking"):
+            return
+
+        session = request.session
+        now = timezone.now()
+        if self.throttled(session.get("last_visit_time"), now):
             return
 
         # Save the time we last counted so we won't count again until throttle window passes
@@ -97,8 +148,376 @@ class VisitMiddleware:
 
         # atomic increment (use F to avoid race conditions)
         Visit.objects.filter(pk=visit_obj.pk).update(count=models.F("count") + 1, last_seen=now)
+        metrics.VISIT_WRITES.inc(source="middleware")
         # refresh from db to keep object consistent if needed
         try:
             visit_obj.refresh_from_db()
         except Exception:
             pass
+
+    async def aprocess_visit(self, request):
+        """process_visit() with the async session, user and ORM APIs."""
+        if not self.counts(request) or loadshed.skip("visit_tracking"):
+            return
+
+        session = request.session
+        now = timezone.now()
+        if self.throttled(await session.aget("last_visit_time"), now):
+            return
+        await session.aset("last_visit_time", now.isoformat())
+
+        user = await request.auser()
+        if user.is_authenticated:
+            lookup = {"user": user}
+        else:
+            if not session.session_key:
+                await session.asave()
+            if not session.session_key:
+                return
+            lookup = {"session_key": session.session_key}
+
+        visit_obj, created = await Visit.objects.aget_or_create(date=now.date(), defaults={"count": 0}, **lookup)
+        await Visit.objects.filter(pk=visit_obj.pk).aupdate(count=models.F("count") + 1, last_seen=now)
+        metrics.VISIT_WRITES.inc(source="middleware")
+
+
+# ---------------------------------------------------------------------------
+# Static files
+# ---------------------------------------------------------------------------
+
+# collectstatic fingerprints (core/staticfiles.py): style.3f1a9c0b2d4e.css
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+# (Content-Encoding, file suffix), in order of preference
+STATIC_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def accepted_encodings(header):
+    """Encodings from an Accept-Encoding header that the client accepts (q > 0)."""
+    accepted = set()
+    for part in (header or '').split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        q = 1.0
+        params = params.replace(' ', '')
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if token and q > 0:
+            accepted.add(token)
+    return accepted
+
+
+class PrecompressedStaticMiddleware(HybridMiddleware):
+    """
+    Serve STATIC_ROOT (the collectstatic output) directly, preferring the
+    .br/.gz siblings written by CompressedManifestStaticFilesStorage when the
+    client accepts them.
+      - fingerprinted names get `Cache-Control: public, max-age=31536000, immutable`,
+      - responses wrap the open file, so wsgi.file_wrapper can sendfile() it,
+      - ETag per encoded variant, If-None-Match -> 304.
+    On by default when DEBUG is off (runserver serves static files in DEBUG);
+    override with SERVE_PRECOMPRESSED_STATIC.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        enabled = getattr(settings, 'SERVE_PRECOMPRESSED_STATIC', not settings.DEBUG)
+        if not enabled or not settings.STATIC_ROOT or not settings.STATIC_URL:
+            raise MiddlewareNotUsed
+        self.root = str(settings.STATIC_ROOT)
+        self.prefix = settings.STATIC_URL if settings.STATIC_URL.startswith('/') else '/' + settings.STATIC_URL
+        self.max_age = getattr(settings, 'STATIC_MAX_AGE', 60)
+
+    def call(self, request):
+        if request.method in ('GET', 'HEAD') and request.path.startswith(self.prefix):
+            response = self.serve(request, request.path[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    async def acall(self, request):
+        # serve() only stats and opens a local file; the body is streamed later
+        if request.method in ('GET', 'HEAD') and request.path.startswith(self.prefix):
+            response = self.serve(request, request.path[len(self.prefix):])
+            if response is not None:
+                return response
+        return await self.get_response(request)
+
+    def serve(self, request, name):
+        try:
+            path = safe_join(self.root, unquote(name))
+        except (SuspiciousFileOperation, ValueError):
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING'))
+        encoding = None
+        chosen = path
+        for candidate, suffix in STATIC_ENCODINGS:
+            if candidate in accepted and os.path.isfile(path + suffix):
+                encoding, chosen = candidate, path + suffix
+                break
+
+        stat = os.stat(chosen)
+        etag = file_etag(stat)
+        if HASHED_NAME_RE.search(name):
+            cache_control = 'public, max-age=31536000, immutable'
+        else:
+            cache_control = f'public, max-age={self.max_age}'
+
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match)):
+            response = HttpResponseNotModified()
+        else:
+            content_type, _ = mimetypes.guess_type(path)
+            response = FileResponse(open(chosen, 'rb'), content_type=content_type or 'application/octet-stream')
+            response['Content-Length'] = str(stat.st_size)
+            response['Last-Modified'] = http_date(stat.st_mtime)
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        response['Cache-Control'] = cache_control
+        response['Vary'] = 'Accept-Encoding'
+        return response
+
+
+# ---------------------------------------------------------------------------
+# Response compression
+# ---------------------------------------------------------------------------
+
+# W/"abc-gzip" -> "abc": the suffix marks the compressed variant's ETag, which
+# is weak because the gzip padding makes its bytes differ between responses
+ETAG_ENCODING_RE = re.compile(r'(?:W/)?"([^"]*)-(br|gzip)"')
+
+
+def _route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return (match.view_name or match.route) if match else 'unresolved'
+
+
+def _compress_stream(content, compressor, route):
+    try:
+        for chunk in content:
+            if chunk:
+                data = compressor.compress(chunk)
+                if data:
+                    yield data
+        yield compressor.finish()
+    finally:
+        compression.record(route, compressor)
+
+
+async def _acompress_stream(content, compressor, route):
+    try:
+        async for chunk in content:
+            if chunk:
+                data = compressor.compress(chunk)
+                if data:
+                    yield data
+        yield compressor.finish()
+    finally:
+        compression.record(route, compressor)
+
+
+class CompressionMiddleware(HybridMiddleware):
+    """
+    gzip/brotli compression of text responses (core/compression.py).
+      - StreamingHttpResponse bodies are compressed chunk by chunk, never buffered,
+      - skips bodies under COMPRESSION_MIN_SIZE, non-text types, responses that
+        are already encoded (precompressed static files), partial/range
+        responses and `Cache-Control: no-transform`,
+      - a compressed variant gets its own ETag ("<etag>-gzip"); incoming
+        If-None-Match values are mapped back so views' conditional checks
+        still match,
+      - ratio and CPU time are recorded per route (see compression_stats),
+      - gzip bodies get random length padding against BREACH; pages with a
+        CSRF token are never sent as brotli, which can't be padded.
+    """
+
+    def call(self, request):
+        stripped = self._strip_if_none_match(request)
+        return self.finish(request, self.get_response(request), stripped)
+
+    async def acall(self, request):
+        stripped = self._strip_if_none_match(request)
+        return self.finish(request, await self.get_response(request), stripped)
+
+    @staticmethod
+    def _strip_if_none_match(request):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and ETAG_ENCODING_RE.search(if_none_match):
+            request.META['HTTP_IF_NONE_MATCH'] = ETAG_ENCODING_RE.sub(r'"\1"', if_none_match)
+            return ETAG_ENCODING_RE.search(if_none_match).group(2)
+        return None
+
+    def finish(self, request, response, stripped):
+        if response.status_code == 304:
+            if stripped and response.has_header('ETag'):
+                response['ETag'] = self._variant_etag(response['ETag'], stripped)
+            return response
+        return self.compress(request, response)
+
+    @staticmethod
+    def _variant_etag(etag, encoding):
+        # weak, like GZipMiddleware's: same content, not the same bytes
+        if not etag.endswith('"'):
+            return etag
+        return 'W/' + etag.removeprefix('W/')[:-1] + f'-{encoding}"'
+
+    def compress(self, request, response):
+        if (response.status_code != 200
+                or response.has_header('Content-Encoding')
+                or response.has_header('Accept-Ranges')
+                or not compression.is_compressible_type(response.get('Content-Type'))
+                or 'no-transform' in response.get('Cache-Control', '')):
+            return response
+
+        # the body depends on Accept-Encoding even when this one stays plain
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING'))
+        encodings = compression.supported_encodings()
+        if request.META.get('CSRF_COOKIE_USED'):
+            # a secret is on the page: only gzip, which gets BREACH padding
+            encodings = tuple(e for e in encodings if e != 'br')
+        encoding = next((e for e in encodings if e in accepted), None)
+        if encoding is None:
+            return response
+
+        route = _route_name(request)
+        if response.streaming:
+            length = response.get('Content-Length')
+            if length and length.isdigit() and int(length) < compression.min_size():
+                return response
+            compressor = compression.Compressor(encoding)
+            if response.is_async:
+                response.streaming_content = _acompress_stream(response.streaming_content, compressor, route)
+            else:
+                response.streaming_content = _compress_stream(response.streaming_content, compressor, route)
+            if response.has_header('Content-Length'):
+                del response['Content-Length']
+        else:
+            if len(response.content) < compression.min_size():
+                return response
+            compressed, compressor = compression.compress_bytes(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+            compression.record(route, compressor)
+
+        if response.has_header('ETag'):
+            response['ETag'] = self._variant_etag(response['ETag'], encoding)
+        response['Content-Encoding'] = encoding
+        return response
+
+
+# ---------------------------------------------------------------------------
+# Metrics
+# ---------------------------------------------------------------------------
+
+class MetricsMiddleware(HybridMiddleware):
+    """
+    Request metrics (core/metrics.py): count and latency per route, database
+    time and query count per request, requests in flight and session writes.
+    Also feeds latency and in-flight counts to the load shedder (core/loadshed.py).
+    Sits outside SessionMiddleware so it sees whether the session was saved.
+    Under ASGI the async ORM runs queries in other threads, out of reach of
+    a per-request execute_wrapper, so DB time is only measured under WSGI.
+    """
+
+    def call(self, request):
+        db = {'queries': 0, 'seconds': 0.0}
+
+        def time_query(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                db['queries'] += 1
+                db['seconds'] += time.perf_counter() - started
+
+        metrics.IN_FLIGHT.inc()
+        loadshed.controller.started()
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(time_query):
+                response = self.get_response(request)
+        finally:
+            metrics.IN_FLIGHT.dec()
+            elapsed = time.perf_counter() - started
+            loadshed.controller.finished(elapsed)
+        self.record(request, response, elapsed, db)
+        return response
+
+    async def acall(self, request):
+        metrics.IN_FLIGHT.inc()
+        loadshed.controller.started()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.IN_FLIGHT.dec()
+            elapsed = time.perf_counter() - started
+            loadshed.controller.finished(elapsed)
+        self.record(request, response, elapsed)
+        return response
+
+    @staticmethod
+    def record(request, response, elapsed, db=None):
+        route = _route_name(request)
+        metrics.REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+        metrics.REQUEST_LATENCY.observe(elapsed, route=route)
+        if db and db['queries']:
+            metrics.DB_QUERIES.inc(db['queries'], route=route)
+            metrics.REQUEST_DB_TIME.observe(db['seconds'], route=route)
+        session = getattr(request, 'session', None)
+        if session is not None and (session.modified or settings.SESSION_SAVE_EVERY_REQUEST) \
+                and not session.is_empty():
+            metrics.SESSION_WRITES.inc()
+
+
+# ---------------------------------------------------------------------------
+# Profiling
+# ---------------------------------------------------------------------------
+
+class ProfilingMiddleware:
+    """
+    Sampling profiler for live requests (core/profiling.py).
+      - profiles PROFILER_SAMPLE_RATE of requests, plus any request from a
+        staff user that sends the PROFILER_HEADER header,
+      - stacks are aggregated per view and downloaded from /profiling/,
+      - profiled responses carry `X-Profile-Samples`.
+    Sits after AuthenticationMiddleware, so the samples cover the view and
+    the middleware below it. Not loaded at all unless PROFILER_ENABLED.
+    Sync only: thread sampling can't attribute coroutine stacks, and under
+    ASGI Django runs the chain below this in a thread while it is enabled.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILER_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = float(getattr(settings, 'PROFILER_SAMPLE_RATE', 0.0))
+        header = getattr(settings, 'PROFILER_HEADER', 'X-Profile')
+        self.meta_key = 'HTTP_' + header.upper().replace('-', '_')
+
+    def wants_profile(self, request):
+        if self.meta_key in request.META:
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated and (user.is_staff or user.is_admin):
+                return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if not self.wants_profile(request):
+            return self.get_response(request)
+        profiling.start(sys._getframe())
+        try:
+            response = self.get_response(request)
+        finally:
+            samples = profiling.stop(_route_name(request))
+        response['X-Profile-Samples'] = str(samples)
+        return response
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0004_visit"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="article",
+            index=models.Index(
+                condition=models.Q(("published", True)),
+                fields=["publish_date"],
+                name="article_pub_date_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="article",
+            index=models.Index(
+                condition=models.Q(("published", True)),
+                fields=["author", "publish_date"],
+                name="article_author_pub_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="article",
+            index=models.Index(fields=["tags"], name="article_tags_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="visit",
+            index=models.Index(
+                fields=["user", "last_seen"], name="visit_user_last_seen_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:21
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0006_article_cover_variants"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StoredBlob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255, unique=True)),
+                ("size", models.PositiveBigIntegerField(default=0)),
+                ("refs", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name="article",
+            name="attachment",
+            field=models.FileField(
+                blank=True,
+                null=True,
+                storage=core.storage.media_storage,
+                upload_to="articles/files/",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="article",
+            name="cover_image",
+            field=models.ImageField(
+                blank=True,
+                null=True,
+                storage=core.storage.media_storage,
+                upload_to="articles/images/",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="researchpaper",
+            name="pdf",
+            field=models.FileField(
+                blank=True,
+                null=True,
+                storage=core.storage.media_storage,
+                upload_to="papers/",
+            ),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_paper_fts(apps, schema_editor):
+    # SQLite only; other backends search with icontains (core/search.py)
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS core_paper_fts USING fts5("
+            "title, abstract, body, content='', tokenize='porter unicode61')"
+        )
+
+
+def drop_paper_fts(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS core_paper_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0008_chunkedupload"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PaperText",
+            fields=[
+                (
+                    "paper",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="text",
+                        serialize=False,
+                        to="core.researchpaper",
+                    ),
+                ),
+                ("file_hash", models.CharField(blank=True, max_length=64)),
+                ("compressed", models.BinaryField(default=b"")),
+                ("text_length", models.PositiveIntegerField(default=0)),
+                ("indexed", models.BooleanField(default=False)),
+                ("indexed_title", models.CharField(blank=True, max_length=300)),
+                ("indexed_abstract", models.TextField(blank=True)),
+                ("extracted_at", models.DateTimeField(blank=True, null=True)),
+                ("error", models.TextField(blank=True)),
+            ],
+        ),
+        migrations.RunPython(create_paper_fts, drop_paper_fts),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:40
+
+from django.db import migrations
+
+
+def create_article_fts(apps, schema_editor):
+    # SQLite only; other backends search with icontains (core/search.py)
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    from core.search import create_article_index
+
+    create_article_index(schema_editor)
+
+
+def drop_article_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for suffix in ("ai", "ad", "au"):
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS core_article_fts_{suffix}")
+    schema_editor.execute("DROP TABLE IF EXISTS core_article_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0009_papertext"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_article_fts, drop_article_fts),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0010_article_search_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="researchpaper",
+            index=models.Index(
+                condition=models.Q(("published", True)),
+                fields=["created_at"],
+                name="paper_pub_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="researchpaper",
+            index=models.Index(
+                condition=models.Q(("published", True)),
+                fields=["uploaded_by", "created_at"],
+                name="paper_uploader_pub_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0012_articlerevision"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VisitDailyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(unique=True)),
+                ("visits", models.PositiveBigIntegerField(default=0)),
+                ("visitors", models.PositiveIntegerField(default=0)),
+                ("users", models.PositiveIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "ordering": ["-date"],
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0014_task_queue"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArticleStats",
+            fields=[
+                (
+                    "article",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to="core.article",
+                    ),
+                ),
+                ("views", models.PositiveBigIntegerField(default=0)),
+                ("score", models.FloatField(default=0.0)),
+                ("decayed_at", models.FloatField(default=0.0)),
+                ("rank", models.FloatField(db_index=True, default=0.0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="TrendingArticle",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("position", models.PositiveSmallIntegerField(unique=True)),
+                ("rank", models.FloatField()),
+                (
+                    "article",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="core.article",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["position"],
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def index_existing_vectors(apps, schema_editor):
+    ArticleVector = apps.get_model("core", "ArticleVector")
+    ArticleTerm = apps.get_model("core", "ArticleTerm")
+    ArticleTerm.objects.bulk_create(
+        (
+            ArticleTerm(vector_id=pk, term=term, weight=weight)
+            for pk, vector in ArticleVector.objects.values_list("pk", "vector").iterator()
+            for term, weight in vector.items()
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0016_related_articles"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArticleTerm",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("term", models.CharField(max_length=64)),
+                ("weight", models.FloatField()),
+                (
+                    "vector",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="terms",
+                        to="core.articlevector",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("term", "vector"), name="article_term_uniq"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(index_existing_vectors, migrations.RunPython.noop),
+    ]
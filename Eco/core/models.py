@@ -1,8 +1,12 @@
 # core/models.py
-from django.db import models
+import uuid
+import zlib
+
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
 from django.utils import timezone
+from .storage import media_storage
 
 class User(AbstractUser):
     phone = models.CharField(max_length=20, blank=True)
@@ -36,8 +40,10 @@ class Article(models.Model):
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='articles')
     published = models.BooleanField(default=False)
     publish_date = models.DateTimeField(default=timezone.now)
-    cover_image = models.ImageField(upload_to='articles/images/', blank=True, null=True)
-    attachment = models.FileField(upload_to='articles/files/', blank=True, null=True)
+    cover_image = models.ImageField(upload_to='articles/images/', storage=media_storage, blank=True, null=True)
+    # resized copies of cover_image, filled in by core/images.py
+    cover_variants = models.JSONField(default=dict, blank=True, editable=False)
+    attachment = models.FileField(upload_to='articles/files/', storage=media_storage, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)
     tags = models.CharField(max_length=300, blank=True)  # simple comma-separated tags
@@ -50,10 +56,26 @@ class Article(models.Model):
 
     class Meta:
         ordering = ['-publish_date']
+        indexes = [
+            # IndexView / search: published=True ORDER BY -publish_date.
+            # Partial indexes: Django emits a bare `WHERE "published"` that SQLite
+            # only matches against an index with the same condition.
+            models.Index(fields=['publish_date'], condition=models.Q(published=True), name='article_pub_date_idx'),
+            # search author filter: author=X, published=True ORDER BY -publish_date
+            models.Index(fields=['author', 'publish_date'], condition=models.Q(published=True),
+                         name='article_author_pub_idx'),
+            # search_filters tag dropdown reads only this column
+            models.Index(fields=['tags'], name='article_tags_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # the revision written by the save signals (core/signals.py) commits or rolls back with the row
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 
 class ResearchPaper(models.Model):
     title = models.CharField(max_length=300)
@@ -63,12 +85,18 @@ class ResearchPaper(models.Model):
     authors = models.CharField(max_length=500, blank=True)
     uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True,
                                     related_name='papers')
-    pdf = models.FileField(upload_to='papers/', blank=True, null=True)
+    pdf = models.FileField(upload_to='papers/', storage=media_storage, blank=True, null=True)
     published = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # paper index / search: published=True ORDER BY -created_at
+            models.Index(fields=['created_at'], condition=models.Q(published=True), name='paper_pub_created_idx'),
+            models.Index(fields=['uploaded_by', 'created_at'], condition=models.Q(published=True),
+                         name='paper_uploader_pub_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -108,9 +136,260 @@ class Visit(models.Model):
         indexes = [
             models.Index(fields=["date"]),
             models.Index(fields=["session_key"]),
+            # "last seen" lookups: user=X ORDER BY -last_seen
+            models.Index(fields=["user", "last_seen"], name="visit_user_last_seen_idx"),
         ]
 
     def __str__(self):
         if self.user:
             return f"Visits for {self.user.username} on {self.date}: {self.count}"
-        return f"Visits for session {self.session_key} on {self.date}: {self.count}"
\ No newline at end of file
+        return f"Visits for session {self.session_key} on {self.date}: {self.count}"
+
+
+
+class VisitDailyRollup(models.Model):
+    """
+    Per-day totals of Visit, refreshed by `manage.py rollup_visits`
+    (core/rollups.py). The admin browses these instead of grouping the raw
+    Visit table.
+    """
+    date = models.DateField(unique=True)
+    visits = models.PositiveBigIntegerField(default=0)    # sum of Visit.count
+    visitors = models.PositiveIntegerField(default=0)     # Visit rows (users + sessions)
+    users = models.PositiveIntegerField(default=0)        # rows for logged-in users
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"{self.date}: {self.visits} visits"
+
+class StoredBlob(models.Model):
+    """
+    Reference count for a file in the content-addressed media storage
+    (core/storage.py). One row per unique blob; refs = number of
+    FileField values pointing at it.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(default=0)
+    refs = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refs} refs)"
+
+
+class ChunkedUpload(models.Model):
+    """
+    An in-progress chunked PDF upload (core/uploads.py). The bytes live in
+    CHUNKED_UPLOAD_DIR/<id>.part until finalize attaches them to a
+    ResearchPaper; the row is deleted then, or by cleanup_uploads if abandoned.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='chunked_uploads')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    offset = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size} bytes)"
+
+
+class PaperText(models.Model):
+    """
+    Text extracted from ResearchPaper.pdf, zlib-compressed, plus what was put
+    into the paper full-text index (core/search.py) so the row can be removed
+    again. Filled by `manage.py extract_paper_text`; file_hash is the SHA-256
+    of the PDF it came from, so unchanged files are skipped.
+    """
+    paper = models.OneToOneField(ResearchPaper, on_delete=models.CASCADE, primary_key=True, related_name='text')
+    file_hash = models.CharField(max_length=64, blank=True)
+    compressed = models.BinaryField(default=b'')
+    text_length = models.PositiveIntegerField(default=0)
+    indexed = models.BooleanField(default=False)
+    indexed_title = models.CharField(max_length=300, blank=True)
+    indexed_abstract = models.TextField(blank=True)
+    extracted_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    @property
+    def text(self):
+        if not self.compressed:
+            return ''
+        return zlib.decompress(bytes(self.compressed)).decode('utf-8')
+
+    def __str__(self):
+        return f"Text of {self.paper_id} ({self.text_length} chars)"
+
+
+class ArticleRevision(models.Model):
+    """
+    One saved version of an article (core/revisions.py). `data` is
+    zlib-compressed: the full content for snapshots, otherwise a line delta
+    against the previous revision. A snapshot is written every
+    ARTICLE_REVISION_SNAPSHOT_INTERVAL revisions, so rebuilding any version
+    applies a bounded number of deltas.
+    """
+    article = models.ForeignKey(Article, on_delete=models.CASCADE, related_name='revisions')
+    number = models.PositiveIntegerField()
+    is_snapshot = models.BooleanField(default=False)
+    data = models.BinaryField()
+    title = models.CharField(max_length=300)
+    content_length = models.PositiveIntegerField(default=0)
+    editor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                               related_name='article_revisions')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-number']
+        constraints = [
+            models.UniqueConstraint(fields=['article', 'number'], name='article_revision_number_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.article_id} r{self.number}{' (snapshot)' if self.is_snapshot else ''}"
+
+
+class Task(models.Model):
+    """
+    A job waiting in the database task queue (core/tasks.py). Workers
+    (`manage.py run_tasks`) claim due rows in lane order, set `claimed_by`
+    and a lease in `locked_until`, and delete the row once it ran. Failures
+    are retried later with backoff; after `max_attempts` the job moves to
+    DeadTask.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running')]
+
+    name = models.CharField(max_length=200)
+    payload = models.JSONField(default=dict)
+    lane = models.CharField(max_length=20, default='default')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    claimed_by = models.CharField(max_length=64, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # the claim query: due jobs of one lane, oldest first
+            models.Index(fields=['lane', 'status', 'run_at'], name='task_claim_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} [{self.lane}] {self.status}"
+
+
+class DeadTask(models.Model):
+    """A Task that failed max_attempts times, kept for inspection and requeueing from the admin."""
+    name = models.CharField(max_length=200)
+    payload = models.JSONField(default=dict)
+    lane = models.CharField(max_length=20, default='default')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+    failed_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['-failed_at']
+
+    def __str__(self):
+        return f"{self.name} (failed {self.attempts}x)"
+
+
+class ArticleStats(models.Model):
+    """
+    Per-article view counters (core/trending.py). `score` is the decayed view
+    count as of `decayed_at` (unix time); `rank` = ln(score) + decay * decayed_at
+    orders articles by their current score without re-decaying every row.
+    """
+    article = models.OneToOneField(Article, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    views = models.PositiveBigIntegerField(default=0)
+    score = models.FloatField(default=0.0)
+    decayed_at = models.FloatField(default=0.0)
+    rank = models.FloatField(default=0.0, db_index=True)
+
+    def __str__(self):
+        return f"{self.article_id}: {self.views} views"
+
+
+class TrendingArticle(models.Model):
+    """The current top TRENDING_SIZE articles by ArticleStats.rank, rewritten after each flush."""
+    position = models.PositiveSmallIntegerField(unique=True)
+    article = models.ForeignKey(Article, on_delete=models.CASCADE, related_name='+')
+    rank = models.FloatField()
+
+    class Meta:
+        ordering = ['position']
+
+    def __str__(self):
+        return f"#{self.position}: {self.article_id}"
+
+
+class ArticleVector(models.Model):
+    """
+    An article's terms for related-article matching (core/related.py):
+    `counts` are the weighted term counts (used to keep TermDocFreq right
+    when the article changes), `vector` its L2-normalised TF-IDF weights.
+    """
+    article = models.OneToOneField(Article, on_delete=models.CASCADE, primary_key=True, related_name='vector')
+    counts = models.JSONField(default=dict)
+    vector = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Vector of {self.article_id} ({len(self.vector)} terms)"
+
+
+class ArticleTerm(models.Model):
+    """
+    One weight of an ArticleVector, indexed by term: finds the articles that
+    share a term with a changed one without reading every vector.
+    """
+    vector = models.ForeignKey(ArticleVector, on_delete=models.CASCADE, related_name='terms')
+    term = models.CharField(max_length=64)
+    weight = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # term first: the lookup index
+            models.UniqueConstraint(fields=['term', 'vector'], name='article_term_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} in {self.vector_id} ({self.weight:.3f})"
+
+
+class TermDocFreq(models.Model):
+    """How many vectorised (published) articles contain `term`."""
+    term = models.CharField(max_length=64, primary_key=True)
+    docs = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.term}: {self.docs}"
+
+
+class RelatedArticle(models.Model):
+    """One of an article's top RELATED_ARTICLES neighbours by TF-IDF cosine similarity."""
+    article = models.ForeignKey(Article, on_delete=models.CASCADE, related_name='related_links')
+    related = models.ForeignKey(Article, on_delete=models.CASCADE, related_name='related_from')
+    position = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['article', 'position']
+        constraints = [
+            # also the index the article page reads its related items through
+            models.UniqueConstraint(fields=['article', 'position'], name='related_article_position_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.article_id} -> {self.related_id} ({self.score:.3f})"
@@ -0,0 +1,131 @@
+# core/pdftext.py
+"""
+Plain-text extraction from uploaded PDFs (runs in worker processes, see
+core/management/commands/extract_paper_text.py).
+
+Uses pypdf when it is installed. Without it, a small built-in reader pulls
+the text-showing operators (Tj, TJ, ', ") out of the page content streams,
+which is enough for search on most text-based PDFs.
+"""
+import hashlib
+import re
+import zlib
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # optional dependency
+    PdfReader = None
+
+READ_SIZE = 1024 * 1024
+
+_STREAM_RE = re.compile(rb'<<(?P<dict>.*?)>>\s*stream\r?\n(?P<data>.*?)\r?\n?endstream', re.S)
+_LENGTH_RE = re.compile(rb'/Length\s+(\d+)(?!\s+\d+\s+R)')
+_TEXT_OP_RE = re.compile(
+    rb'(?P<str>\((?:\\.|[^\\)])*\))\s*(?:Tj|\'|")'
+    rb'|\[(?P<arr>(?:\((?:\\.|[^\\)])*\)|<[0-9A-Fa-f\s]*>|[^\]])*)\]\s*TJ'
+    rb'|(?P<br>T\*|\bT[dD]\b|\bET\b)',
+    re.S,
+)
+_ARRAY_ITEM_RE = re.compile(rb'\((?:\\.|[^\\)])*\)|-?\d+(?:\.\d+)?')
+# TJ kerning below this (thousandths of an em) is treated as a word gap
+WORD_GAP = -200
+_ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f',
+            b'(': b'(', b')': b')', b'\\': b'\\'}
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _unescape(literal):
+    """Decode a PDF literal string body (without the parentheses)."""
+    out = bytearray()
+    i = 0
+    while i < len(literal):
+        c = literal[i:i + 1]
+        if c != b'\\':
+            out += c
+            i += 1
+            continue
+        nxt = literal[i + 1:i + 2]
+        if nxt in _ESCAPES:
+            out += _ESCAPES[nxt]
+            i += 2
+        elif nxt.isdigit():
+            m = re.match(rb'[0-7]{1,3}', literal[i + 1:i + 4])
+            out.append(int(m.group(), 8) & 0xFF)
+            i += 1 + len(m.group())
+        else:
+            # line continuation or unknown escape: drop the backslash
+            i += 1
+    return out.decode('latin-1')
+
+
+def _content_streams(data):
+    for m in _STREAM_RE.finditer(data):
+        raw = m.group('data')
+        length = _LENGTH_RE.search(m.group('dict'))
+        if length and int(length.group(1)) <= len(data) - m.start('data'):
+            # direct /Length is exact; the regex may have eaten a trailing \r of binary data
+            raw = data[m.start('data'):m.start('data') + int(length.group(1))]
+        if b'/FlateDecode' in m.group('dict'):
+            try:
+                raw = zlib.decompress(raw)
+            except zlib.error:
+                continue
+        elif b'/Filter' in m.group('dict'):
+            # images and other encodings carry no text we can read
+            continue
+        yield raw
+
+
+def _fallback_extract(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    parts = []
+    for stream in _content_streams(data):
+        if b'BT' not in stream:
+            continue
+        for m in _TEXT_OP_RE.finditer(stream):
+            if m.group('str'):
+                parts.append(_unescape(m.group('str')[1:-1]))
+            elif m.group('arr') is not None:
+                for item in _ARRAY_ITEM_RE.findall(m.group('arr')):
+                    if item.startswith(b'('):
+                        parts.append(_unescape(item[1:-1]))
+                    elif float(item) <= WORD_GAP:
+                        parts.append(' ')
+            else:
+                parts.append('\n')
+    text = ''.join(parts)
+    return re.sub(r'\n\s*\n+', '\n', text).strip()
+
+
+def extract_text(path, max_chars=None):
+    if PdfReader is not None:
+        reader = PdfReader(path)
+        text = '\n'.join((page.extract_text() or '') for page in reader.pages)
+    else:
+        text = _fallback_extract(path)
+    if max_chars:
+        text = text[:max_chars]
+    return text
+
+
+def extract_worker(path, known_hash=None, max_chars=None):
+    """
+    Worker-process entry point. Hashes the file and extracts its text unless
+    the hash equals `known_hash` (already processed).
+    Returns (file_hash, text or None, error or '').
+    """
+    try:
+        digest = file_sha256(path)
+        if digest == known_hash:
+            return digest, None, ''
+        return digest, extract_text(path, max_chars=max_chars), ''
+    except Exception as exc:
+        return None, None, f'{type(exc).__name__}: {exc}'
@@ -0,0 +1,174 @@
+# core/profiling.py
+"""
+Sampling profiler for live requests (core.middleware.ProfilingMiddleware).
+
+A profiled request registers its thread here for the duration of the view.
+One background thread wakes every PROFILER_INTERVAL seconds, reads the
+current stack of each registered thread with sys._current_frames() and
+counts it. When the request finishes its stacks are merged into a per-view
+aggregate, which the staff page (/profiling/) downloads as collapsed stacks
+(flamegraph.pl, speedscope, inferno) or as a speedscope JSON file.
+
+The sampler only runs while a profiled request is in flight, and the
+middleware is removed entirely when PROFILER_ENABLED is False.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+# distinct stacks kept per view; the rest are counted under TRUNCATED
+MAX_STACKS = 5_000
+TRUNCATED = '[other stacks]'
+
+_lock = threading.Lock()
+_active = {}        # thread id -> (entry frame, Counter of stacks)
+_profiles = {}      # view name -> {'requests', 'samples', 'stacks'}
+_wakeup = threading.Event()
+_sampler = None
+
+
+def interval():
+    return max(0.001, float(getattr(settings, 'PROFILER_INTERVAL', 0.005)))
+
+
+def _short_path(path):
+    base = str(settings.BASE_DIR)
+    if path.startswith(base):
+        return os.path.relpath(path, base)
+    marker = 'site-packages' + os.sep
+    if marker in path:
+        return path.split(marker, 1)[1]
+    return os.path.basename(path)
+
+
+def _frame_name(code):
+    return f'{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})'
+
+
+def _stack(frame, stop):
+    """Stack from just below `stop` (the middleware) down to `frame`, root first."""
+    names = []
+    while frame is not None and frame is not stop:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    names.reverse()
+    return tuple(names)
+
+
+def _take_sample():
+    frames = sys._current_frames()
+    with _lock:
+        if not _active:
+            # nothing in flight: sleep until the next profiled request
+            _wakeup.clear()
+            return
+        for thread_id, (entry, stacks) in _active.items():
+            frame = frames.get(thread_id)
+            if frame is not None:
+                stacks[_stack(frame, entry)] += 1
+
+
+def _sample_forever():
+    while True:
+        _wakeup.wait()
+        time.sleep(interval())
+        _take_sample()
+
+
+def _ensure_sampler():
+    global _sampler
+    if _sampler is None or not _sampler.is_alive():
+        _sampler = threading.Thread(target=_sample_forever, name='request-profiler', daemon=True)
+        _sampler.start()
+
+
+def start(entry_frame):
+    """Begin sampling the calling thread; `entry_frame` bounds the recorded stacks."""
+    with _lock:
+        _ensure_sampler()
+        _active[threading.get_ident()] = (entry_frame, Counter())
+        _wakeup.set()
+
+
+def stop(view_name):
+    """Stop sampling the calling thread and add its stacks to `view_name`. Returns the sample count."""
+    with _lock:
+        _, stacks = _active.pop(threading.get_ident(), (None, Counter()))
+        profile = _profiles.setdefault(view_name, {'requests': 0, 'samples': 0, 'stacks': Counter()})
+        profile['requests'] += 1
+        total = sum(stacks.values())
+        profile['samples'] += total
+        merged = profile['stacks']
+        for stack, count in stacks.items():
+            if stack in merged or len(merged) < MAX_STACKS:
+                merged[stack] += count
+            else:
+                merged[(TRUNCATED,)] += count
+    return total
+
+
+def profile_summary():
+    """[{view, requests, samples, seconds}] for every profiled view, busiest first."""
+    step = interval()
+    with _lock:
+        rows = [{'view': name, 'requests': p['requests'], 'samples': p['samples'],
+                 'seconds': round(p['samples'] * step, 3)} for name, p in _profiles.items()]
+    return sorted(rows, key=lambda r: r['samples'], reverse=True)
+
+
+def _stacks(view_name=None):
+    with _lock:
+        if view_name is not None:
+            profile = _profiles.get(view_name)
+            return Counter(profile['stacks']) if profile else Counter()
+        combined = Counter()
+        for name, profile in _profiles.items():
+            for stack, count in profile['stacks'].items():
+                combined[(name,) + stack] += count
+        return combined
+
+
+def collapsed(view_name=None):
+    """Brendan Gregg's collapsed format: 'frame;frame;frame count' per line."""
+    stacks = _stacks(view_name)
+    lines = [';'.join(stack).replace(' ', '_') + f' {count}'
+             for stack, count in sorted(stacks.items()) if stack]
+    return '\n'.join(lines) + '\n'
+
+
+def speedscope(view_name=None):
+    """speedscope 'sampled' profile; each distinct stack is one weighted sample (milliseconds)."""
+    stacks = _stacks(view_name)
+    frames, index = [], {}
+    samples, weights = [], []
+    step_ms = interval() * 1000
+    for stack, count in sorted(stacks.items()):
+        ids = []
+        for name in stack:
+            if name not in index:
+                index[name] = len(frames)
+                frames.append({'name': name})
+            ids.append(index[name])
+        samples.append(ids)
+        weights.append(round(count * step_ms, 3))
+    total = round(sum(weights), 3)
+    return json.dumps({
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled', 'name': view_name or 'all views', 'unit': 'milliseconds',
+            'startValue': 0, 'endValue': total, 'samples': samples, 'weights': weights,
+        }],
+        'name': f'EcoInsight {view_name or "all views"}',
+        'exporter': 'core.profiling',
+    })
+
+
+def reset():
+    with _lock:
+        _profiles.clear()
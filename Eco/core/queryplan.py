@@ -0,0 +1,75 @@
+# core/queryplan.py
+"""
+Small helpers to inspect SQLite query plans for the hot ORM queries.
+
+Used by the query-plan regression tests in core/tests.py:
+  - explain_sql(sql, params) runs EXPLAIN QUERY PLAN and returns the detail lines,
+  - plan_problems(lines) returns the lines that look like a full table scan
+    or a temporary B-tree sort,
+  - explain_captured(queries) does both for the queries captured by
+    django.test.utils.CaptureQueriesContext.
+"""
+import re
+
+from django.db import connection
+
+# "SCAN core_article" (a full table walk). Index-only walks such as
+# "SCAN core_article USING COVERING INDEX ..." read the index, not the table.
+_SCAN_RE = re.compile(r'^SCAN (?P<table>\w+)(?P<rest>.*)$')
+# subqueries/CTEs are walked as co-routines or materialized views, not tables
+_SUBQUERY_RE = re.compile(r'^(CO-ROUTINE|MATERIALIZE) (?P<name>\w+)')
+_TEMP_BTREE_RE = re.compile(r'USE TEMP B-TREE FOR (ORDER BY|GROUP BY|DISTINCT|RIGHT PART OF ORDER BY|LAST TERM OF ORDER BY)')
+# a rowid lookup (pk IN (...) / pk = ?) is bounded by the number of ids,
+# so sorting its result in a temp B-tree is fine
+_ROWID_LOOKUP_RE = re.compile(r'^SEARCH \w+ USING INTEGER PRIMARY KEY')
+
+
+def explain_sql(sql, params=None):
+    """Return the detail column of EXPLAIN QUERY PLAN for a single statement."""
+    with connection.cursor() as cursor:
+        # captured SQL is already interpolated: pass params=None so the
+        # backend does not try to rewrite "%" placeholders inside literals
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        rows = cursor.fetchall()
+    # rows are (id, parent, notused, detail)
+    return [row[-1] for row in rows]
+
+
+def explain_queryset(queryset):
+    """EXPLAIN QUERY PLAN for a queryset without evaluating it."""
+    sql, params = queryset.query.sql_with_params()
+    return explain_sql(sql, params)
+
+
+def plan_problems(lines, ignore_tables=()):
+    """
+    Return the plan lines that would not scale:
+      - full table scans (SCAN <table> without an index),
+      - temp B-tree sorts, unless the query only touches rows fetched by rowid.
+    """
+    problems = []
+    subqueries = {m.group('name') for m in map(_SUBQUERY_RE.match, lines) if m}
+    bounded = any(_ROWID_LOOKUP_RE.match(line) for line in lines)
+    for line in lines:
+        m = _SCAN_RE.match(line)
+        if m and m.group('table') not in subqueries and m.group('table') not in ignore_tables \
+                and 'INDEX' not in m.group('rest'):
+            problems.append(line)
+        elif _TEMP_BTREE_RE.search(line) and not bounded:
+            problems.append(line)
+    return problems
+
+
+def explain_captured(queries, ignore_tables=()):
+    """
+    Explain every SELECT captured by CaptureQueriesContext.
+    Returns a list of (sql, plan_lines, problems).
+    """
+    results = []
+    for q in queries:
+        sql = q['sql']
+        if not sql.lstrip().upper().startswith('SELECT'):
+            continue
+        lines = explain_sql(sql)
+        results.append((sql, lines, plan_problems(lines, ignore_tables=ignore_tables)))
+    return results
@@ -0,0 +1,223 @@
+# core/ratelimit.py
+"""
+Token-bucket rate limiting for endpoints that cost database work per call
+(track_visit writes, search scans).
+
+    @ratelimit('search')
+    def search_view(request): ...
+
+Each rule in settings.RATELIMITS is a list of buckets; a bucket refills at
+`rate` tokens per second up to `burst`, keyed per client by `key`:
+  - 'ip': the client address (see RATELIMIT_TRUSTED_PROXIES),
+  - 'session': the session key, or the address for clients without one,
+  - 'user': the user id, or the address for anonymous clients.
+A request takes one token from every bucket of its rule; if one is empty
+the view is not called and the client gets 429 with Retry-After. While the
+site is shedding load (core/loadshed.py) the buckets of '<rule>:shedding'
+apply as well.
+
+Buckets live in this process (RATELIMIT_BACKEND = 'memory'), or in a Django
+cache shared by all workers ('cache', alias RATELIMIT_CACHE). The cache
+backend reads and writes without a lock, so concurrent requests from one
+client can occasionally both get the last token.
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, JsonResponse
+
+from . import loadshed, metrics
+
+
+class MemoryBackend:
+    """Buckets in a dict; the least recently used are dropped beyond max_keys."""
+
+    def __init__(self, max_keys=100_000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def take(self, key, rate, burst, now):
+        """(allowed, seconds until a token is available)."""
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+    async def atake(self, key, rate, burst, now):
+        return self.take(key, rate, burst, now)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheBackend:
+    """Buckets in a Django cache, so every worker process shares them."""
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+
+    @staticmethod
+    def _cache_key(key):
+        return 'rl:' + hashlib.md5(key.encode()).hexdigest()
+
+    @staticmethod
+    def _refill(state, rate, burst, now):
+        tokens, updated = state if state else (burst, now)
+        tokens = min(burst, tokens + (now - updated) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        # a bucket left alone this long is full again: let it expire
+        timeout = math.ceil(burst / rate) + 1
+        return allowed, (tokens, now), timeout, 0.0 if allowed else (1 - tokens) / rate
+
+    def take(self, key, rate, burst, now):
+        cache = caches[self.alias]
+        cache_key = self._cache_key(key)
+        allowed, state, timeout, wait = self._refill(cache.get(cache_key), rate, burst, now)
+        cache.set(cache_key, state, timeout)
+        return allowed, wait
+
+    async def atake(self, key, rate, burst, now):
+        cache = caches[self.alias]
+        cache_key = self._cache_key(key)
+        allowed, state, timeout, wait = self._refill(await cache.aget(cache_key), rate, burst, now)
+        await cache.aset(cache_key, state, timeout)
+        return allowed, wait
+
+    def clear(self):
+        pass
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        if getattr(settings, 'RATELIMIT_BACKEND', 'memory') == 'cache':
+            _backend = CacheBackend(getattr(settings, 'RATELIMIT_CACHE', 'default'))
+        else:
+            _backend = MemoryBackend(getattr(settings, 'RATELIMIT_MAX_KEYS', 100_000))
+    return _backend
+
+
+def reset():
+    """Forget all in-process buckets and re-read the backend settings."""
+    global _backend
+    if _backend is not None:
+        _backend.clear()
+    _backend = None
+
+
+def client_ip(request):
+    """REMOTE_ADDR, or the address RATELIMIT_TRUSTED_PROXIES hops back in X-Forwarded-For."""
+    proxies = getattr(settings, 'RATELIMIT_TRUSTED_PROXIES', 0)
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if proxies and forwarded:
+        hops = [h.strip() for h in forwarded.split(',') if h.strip()]
+        if len(hops) >= proxies:
+            return hops[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _client(request, kind, user=None):
+    if kind == 'session':
+        session = getattr(request, 'session', None)
+        session_key = session.session_key if session is not None else None
+        if session_key:
+            return 's:' + session_key
+    elif kind == 'user' and user is not None and user.is_authenticated:
+        return f'u:{user.pk}'
+    return 'ip:' + client_ip(request)
+
+
+def _rules(rule):
+    """[(bucket name, bucket)] that apply to `rule` right now."""
+    if not getattr(settings, 'RATELIMIT_ENABLED', True):
+        return []
+    rules = getattr(settings, 'RATELIMITS', {})
+    names = [rule]
+    if f'{rule}:shedding' in rules and loadshed.shedding():
+        names.append(f'{rule}:shedding')
+    return [(name, bucket) for name in names for bucket in rules.get(name, [])]
+
+
+def _denied(rule, wait, as_json):
+    metrics.RATELIMIT_DENIED.inc(rule=rule)
+    retry_after = str(max(1, math.ceil(wait)))
+    if as_json:
+        response = JsonResponse({'error': 'rate limited', 'retry_after': int(retry_after)}, status=429)
+    else:
+        response = HttpResponse('Too many requests — please slow down.\n', status=429,
+                                content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = retry_after
+    return response
+
+
+def check(request, rule, user=None):
+    """(allowed, seconds to wait) for one request under `rule`."""
+    now = time.time()
+    backend = get_backend()
+    for name, bucket in _rules(rule):
+        kind = bucket.get('key', 'ip')
+        key = f"{name}:{kind}:{_client(request, kind, user)}"
+        allowed, wait = backend.take(key, float(bucket['rate']), float(bucket['burst']), now)
+        if not allowed:
+            return False, wait
+    return True, 0.0
+
+
+async def acheck(request, rule):
+    now = time.time()
+    backend = get_backend()
+    buckets = _rules(rule)
+    user = await request.auser() if any(b.get('key') == 'user' for _, b in buckets) else None
+    for name, bucket in buckets:
+        kind = bucket.get('key', 'ip')
+        key = f"{name}:{kind}:{_client(request, kind, user)}"
+        allowed, wait = await backend.atake(key, float(bucket['rate']), float(bucket['burst']), now)
+        if not allowed:
+            return False, wait
+    return True, 0.0
+
+
+def ratelimit(rule, json=False):
+    """View decorator (sync or async views) applying settings.RATELIMITS[rule]."""
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                metrics.RATELIMIT_CHECKED.inc(rule=rule)
+                allowed, wait = await acheck(request, rule)
+                if not allowed:
+                    return _denied(rule, wait, json)
+                return await view(request, *args, **kwargs)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            metrics.RATELIMIT_CHECKED.inc(rule=rule)
+            allowed, wait = check(request, rule, getattr(request, 'user', None))
+            if not allowed:
+                return _denied(rule, wait, json)
+            return view(request, *args, **kwargs)
+        return wrapper
+
+    return decorator
@@ -0,0 +1,171 @@
+# core/revisions.py
+"""
+Article revision history with compressed delta storage.
+
+Every save that changes an article's title or content adds an
+ArticleRevision. Most revisions store only a line delta against the previous
+version:
+
+    [[i1, i2], "inserted text", [j1, j2], ...]
+
+where [i1, i2] copies lines i1..i2 of the previous version and a string is
+new text. Deltas are JSON, zlib-compressed. Every SNAPSHOT_INTERVAL-th
+revision (and any revision whose delta would not be smaller) stores the full
+content instead, so rebuilding a version reads one snapshot plus fewer than
+SNAPSHOT_INTERVAL deltas, in one query.
+
+prune() applies the retention policy (`manage.py prune_revisions`).
+"""
+import difflib
+import json
+import zlib
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from .models import Article, ArticleRevision
+
+COMPRESS_LEVEL = 9
+
+
+def snapshot_interval():
+    return max(1, getattr(settings, 'ARTICLE_REVISION_SNAPSHOT_INTERVAL', 20))
+
+
+def _pack(obj):
+    return zlib.compress(json.dumps(obj, separators=(',', ':')).encode('utf-8'), COMPRESS_LEVEL)
+
+
+def _unpack(data):
+    return json.loads(zlib.decompress(bytes(data)).decode('utf-8'))
+
+
+def make_delta(old, new):
+    """Line delta turning `old` into `new`."""
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif j2 > j1:
+            # replace / insert: the new lines; deleted lines simply aren't copied
+            ops.append(''.join(new_lines[j1:j2]))
+    return ops
+
+
+def apply_delta(old, ops):
+    old_lines = old.splitlines(keepends=True)
+    parts = []
+    for op in ops:
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            parts.append(''.join(old_lines[op[0]:op[1]]))
+    return ''.join(parts)
+
+
+def _chain(article_id, number):
+    """Revisions from the nearest snapshot at or before `number` up to `number`, oldest first (one query)."""
+    nearest_snapshot = (ArticleRevision.objects
+                        .filter(article_id=OuterRef('article_id'), number__lte=number, is_snapshot=True)
+                        .order_by('-number').values('number')[:1])
+    return list(ArticleRevision.objects
+                .filter(article_id=article_id, number__lte=number, number__gte=Subquery(nearest_snapshot))
+                .order_by('number').only('number', 'is_snapshot', 'data'))
+
+
+def rebuild(article_id, number):
+    """Content of revision `number` of the article."""
+    chain = _chain(article_id, number)
+    if not chain or not chain[0].is_snapshot or chain[-1].number != number:
+        raise ArticleRevision.DoesNotExist(f'revision {number} of article {article_id} cannot be rebuilt')
+    text = ''
+    for revision in chain:
+        payload = _unpack(revision.data)
+        text = payload if revision.is_snapshot else apply_delta(text, payload)
+    return text
+
+
+def _last_snapshot_number(article_id):
+    return (ArticleRevision.objects.filter(article_id=article_id, is_snapshot=True)
+            .order_by('-number').values_list('number', flat=True).first())
+
+
+def record_revision(article, editor=None):
+    """
+    Store the article's current title/content as a new revision if they
+    changed since the last one. Returns the revision, or None if unchanged.
+    """
+    with transaction.atomic():
+        latest = (ArticleRevision.objects.filter(article_id=article.pk)
+                  .order_by('-number').only('number', 'title').first())
+        content = article.content or ''
+        number = 1
+        data, is_snapshot = _pack(content), True
+        if latest is not None:
+            previous = rebuild(article.pk, latest.number)
+            if previous == content and latest.title == article.title:
+                return None
+            number = latest.number + 1
+            last_snapshot = _last_snapshot_number(article.pk) or 0
+            if number - last_snapshot < snapshot_interval():
+                delta = _pack(make_delta(previous, content))
+                if len(delta) < len(data):
+                    data, is_snapshot = delta, False
+        return ArticleRevision.objects.create(
+            article_id=article.pk, number=number, is_snapshot=is_snapshot, data=data,
+            title=article.title, content_length=len(content), editor=editor,
+        )
+
+
+def ensure_baseline(article_id):
+    """
+    Articles saved before revisions existed (or bulk-imported) get their
+    stored version recorded as revision 1 before the first edit replaces it.
+    """
+    if ArticleRevision.objects.filter(article_id=article_id).exists():
+        return
+    current = Article.objects.filter(pk=article_id).only('title', 'content').first()
+    if current is not None:
+        record_revision(current, editor=None)
+
+
+def diff_lines(article_id, old_number, new_number):
+    """Unified diff between two revisions (list of lines)."""
+    old = rebuild(article_id, old_number) if old_number else ''
+    new = rebuild(article_id, new_number)
+    return list(difflib.unified_diff(
+        old.splitlines(), new.splitlines(),
+        fromfile=f'r{old_number}' if old_number else 'empty', tofile=f'r{new_number}', lineterm='',
+    ))
+
+
+def prune(article_id, keep=None, before=None):
+    """
+    Retention policy: keep the newest `keep` revisions and drop revisions
+    created before `before` (the newest revision is always kept). The oldest
+    surviving revision is rewritten as a snapshot so it can still be rebuilt.
+    Returns the number of revisions deleted.
+    """
+    revisions = ArticleRevision.objects.filter(article_id=article_id)
+    numbers = list(revisions.order_by('-number').values_list('number', 'created_at'))
+    if not numbers:
+        return 0
+    survivors = numbers[:keep] if keep else list(numbers)
+    if before is not None:
+        survivors = [numbers[0]] + [n for n in survivors[1:] if n[1] >= before]
+    oldest_kept = survivors[-1][0]
+    if oldest_kept == numbers[-1][0]:
+        return 0
+
+    with transaction.atomic():
+        first = revisions.get(number=oldest_kept)
+        if not first.is_snapshot:
+            first.data = _pack(rebuild(article_id, oldest_kept))
+            first.is_snapshot = True
+            first.save(update_fields=['data', 'is_snapshot'])
+        deleted, _ = revisions.filter(number__lt=oldest_kept).delete()
+    return deleted
@@ -0,0 +1,43 @@
+# core/rollups.py
+"""
+Daily Visit rollups (VisitDailyRollup) for the admin and reports.
+
+rollup_visits() aggregates the Visit rows of a date range with one GROUP BY
+on the date index and upserts the totals, so re-running it for "today" every
+few minutes is cheap and idempotent.
+"""
+from datetime import timedelta
+
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .models import Visit, VisitDailyRollup
+
+
+def rollup_visits(since=None, until=None):
+    """
+    Recompute rollups for days in [since, until] (dates, inclusive; both
+    default to today). since=None with until=None only refreshes today;
+    pass since=date.min for everything. Returns the number of days written.
+    """
+    today = timezone.now().date()
+    since = since or today
+    until = until or today
+    totals = (Visit.objects.filter(date__gte=since, date__lte=until).order_by()
+              .values('date').annotate(visits=Sum('count'), visitors=Count('id'), users=Count('user')))
+    rows = [VisitDailyRollup(date=t['date'], visits=t['visits'] or 0, visitors=t['visitors'], users=t['users'])
+            for t in totals]
+    VisitDailyRollup.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=['date'],
+        update_fields=['visits', 'visitors', 'users', 'updated_at'],
+    )
+    # days whose visits were all deleted
+    seen = {row.date for row in rows}
+    stale = VisitDailyRollup.objects.filter(date__gte=since, date__lte=until).exclude(date__in=seen)
+    stale.delete()
+    return len(rows)
+
+
+def rollup_recent(days=2):
+    today = timezone.now().date()
+    return rollup_visits(today - timedelta(days=days - 1), today)
@@ -0,0 +1,452 @@
+# core/search.py
+"""
+Full-text search (SQLite FTS5) and the unified Article + ResearchPaper search.
+
+ARTICLE_INDEX is an external-content FTS5 table over core_article, kept in
+sync by triggers (see create_article_index); `manage.py rebuild_search_index`
+recreates it if a table rebuild dropped the triggers.
+
+PAPER_INDEX covers research papers: title, abstract and the text extracted
+from the PDF. It is a contentless FTS5 table (content=''), so the extracted
+text is only kept once, compressed, in PaperText; to remove a row FTS5 needs
+the values that were indexed, which PaperText also keeps.
+
+unified_search() merges the ranked article and paper streams (k-way merge on
+score, then date) and only reads as many rows from each as the requested
+page needs. bm25 values from different tables are not comparable, so each
+stream's scores are divided by its best one before merging.
+
+On other database backends (or SQLite builds without FTS5) the indexes are
+not used and the streams fall back to icontains lookups ordered by date.
+"""
+import datetime
+import heapq
+import itertools
+import re
+import zlib
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+
+# Simple search parser supporting AND / OR / phrase queries
+def parse_search_query(q):
+    tokens = re.findall(r'"([^"]+)"|(\S+)', q)
+    cleaned = []
+    for t1, t2 in tokens:
+        token = t1 if t1 else t2
+        cleaned.append(token)
+    return cleaned
+
+
+_available = {}
+
+
+class FtsIndex:
+    def __init__(self, table, columns, content='', options="tokenize='porter unicode61'"):
+        self.table = table
+        self.columns = tuple(columns)
+        # '' = contentless; otherwise the table whose `id` rows are indexed
+        self.content = content
+        self.options = options
+
+    def create_sql(self):
+        cols = ', '.join(self.columns)
+        content = f"content='{self.content}', content_rowid='id'" if self.content else "content=''"
+        return f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5({cols}, {content}, {self.options})"
+
+    def trigger_sql(self):
+        """Triggers that keep an external-content index in sync with its table."""
+        cols = ', '.join(self.columns)
+        new = ', '.join(f'new.{c}' for c in self.columns)
+        old = ', '.join(f'old.{c}' for c in self.columns)
+        t = self.table
+        delete = f"INSERT INTO {t} ({t}, rowid, {cols}) VALUES ('delete', old.id, {old});"
+        insert = f"INSERT INTO {t} (rowid, {cols}) VALUES (new.id, {new});"
+        return [
+            f"CREATE TRIGGER IF NOT EXISTS {t}_ai AFTER INSERT ON {self.content} BEGIN {insert} END",
+            f"CREATE TRIGGER IF NOT EXISTS {t}_ad AFTER DELETE ON {self.content} BEGIN {delete} END",
+            f"CREATE TRIGGER IF NOT EXISTS {t}_au AFTER UPDATE OF {cols} ON {self.content} "
+            f"BEGIN {delete} {insert} END",
+        ]
+
+    def rebuild_sql(self):
+        return f"INSERT INTO {self.table} ({self.table}) VALUES ('rebuild')"
+
+    def drop_sql(self):
+        return [f"DROP TRIGGER IF EXISTS {self.table}_{suffix}" for suffix in ('ai', 'ad', 'au')] + \
+            [f"DROP TABLE IF EXISTS {self.table}"]
+
+    def available(self):
+        if connection.vendor != 'sqlite':
+            return False
+        # looked up once per database, not per query
+        key = (self.table, connection.settings_dict['NAME'])
+        if key not in _available:
+            _available[key] = self.table in connection.introspection.table_names()
+        return _available[key]
+
+    def add(self, rowid, values):
+        cols = ', '.join(self.columns)
+        marks = ', '.join(['%s'] * len(self.columns))
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.table} (rowid, {cols}) VALUES (%s, {marks})",
+                           [rowid] + [values.get(c) or '' for c in self.columns])
+
+    def remove(self, rowid, values):
+        """`values` must be exactly what was indexed for this rowid."""
+        cols = ', '.join(self.columns)
+        marks = ', '.join(['%s'] * len(self.columns))
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}, rowid, {cols}) VALUES ('delete', %s, {marks})",
+                           [rowid] + [values.get(c) or '' for c in self.columns])
+
+    def search(self, query, limit=50, offset=0):
+        """[(rowid, score)] best first; score is -bm25 (higher is better)."""
+        match = match_expression(query)
+        if not match:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, -bm25({self.table}) AS score FROM {self.table} "
+                f"WHERE {self.table} MATCH %s ORDER BY score DESC LIMIT %s OFFSET %s",
+                [match, limit, offset],
+            )
+            return cursor.fetchall()
+
+
+def match_expression(query):
+    """
+    Turn the site search syntax (words, "phrases", OR) into an FTS5 MATCH
+    expression: every token becomes a quoted prefix phrase, joined with AND
+    unless separated by OR.
+    """
+    parts = []
+    pending_or = False
+    for token in parse_search_query(query or ''):
+        if token.upper() == 'OR':
+            pending_or = bool(parts)
+            continue
+        # prefix match, closest to the old icontains behaviour
+        phrase = '"' + token.replace('"', '""') + '"*'
+        if parts:
+            parts.append('OR' if pending_or else 'AND')
+        parts.append(phrase)
+        pending_or = False
+    return ' '.join(parts)
+
+
+ARTICLE_INDEX = FtsIndex('core_article_fts', ('title', 'summary', 'content', 'tags'), content='core_article')
+PAPER_INDEX = FtsIndex('core_paper_fts', ('title', 'abstract', 'body'))
+
+
+def create_article_index(schema_editor=None):
+    """Create (or repair) the article FTS table and its triggers, then rebuild it."""
+    conn = schema_editor.connection if schema_editor else connection
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        cursor.execute(ARTICLE_INDEX.create_sql())
+        for sql in ARTICLE_INDEX.trigger_sql():
+            cursor.execute(sql)
+        cursor.execute(ARTICLE_INDEX.rebuild_sql())
+
+
+def paper_document(paper, body):
+    return {'title': paper.title, 'abstract': paper.abstract, 'body': body}
+
+
+def store_paper_text(paper, file_hash, text, error=''):
+    """
+    Save extracted text (zlib-compressed) for a paper and refresh its FTS row.
+    Called by the extraction command, never on the upload request path.
+    """
+    from .models import PaperText
+
+    with transaction.atomic():
+        previous = PaperText.objects.filter(paper=paper).first()
+        if previous is not None:
+            unindex_paper(previous)
+        indexed = PAPER_INDEX.available()
+        if indexed:
+            PAPER_INDEX.add(paper.pk, paper_document(paper, text))
+        PaperText.objects.update_or_create(paper=paper, defaults={
+            'file_hash': file_hash or '',
+            'compressed': zlib.compress(text.encode('utf-8'), 6),
+            'text_length': len(text),
+            'indexed': indexed,
+            'indexed_title': paper.title if indexed else '',
+            'indexed_abstract': paper.abstract if indexed else '',
+            'extracted_at': timezone.now(),
+            'error': error,
+        })
+
+
+def unindex_paper(paper_text):
+    """Remove a paper's FTS row using the values stored when it was indexed."""
+    if paper_text.indexed and PAPER_INDEX.available():
+        PAPER_INDEX.remove(paper_text.paper_id, {'title': paper_text.indexed_title,
+                                                 'abstract': paper_text.indexed_abstract,
+                                                 'body': paper_text.text})
+
+
+def index_paper_metadata(paper):
+    """
+    Keep title/abstract searchable right after a save. Reuses the stored text
+    (no PDF extraction); new papers get an empty body until extract_paper_text runs.
+    """
+    from .models import PaperText
+
+    paper_text = PaperText.objects.filter(paper=paper).first()
+    if paper_text is None:
+        store_paper_text(paper, '', '')
+    elif (paper_text.indexed_title, paper_text.indexed_abstract) != (paper.title, paper.abstract):
+        store_paper_text(paper, paper_text.file_hash, paper_text.text, paper_text.error)
+
+
+def reindex_paper_metadata(paper_text):
+    """Title/abstract changed since indexing: rewrite the FTS row from the stored text."""
+    store_paper_text(paper_text.paper, paper_text.file_hash, paper_text.text, paper_text.error)
+
+
+def search_papers(query, limit=50, offset=0):
+    """[(paper_id, score)] of published papers for a site search query, best first."""
+    from .models import ResearchPaper
+    papers = ResearchPaper.objects.filter(published=True)
+    if PAPER_INDEX.available():
+        match = match_expression(query)
+        if not match:
+            return []
+        base_sql, base_params = papers.order_by().values('id', 'created_at').query.sql_with_params()
+        rows = _fts_rows(PAPER_INDEX, match, base_sql, base_params, 'created_at', limit, offset)
+        return [(pk, score) for pk, score, _ in rows]
+    q_obj = Q()
+    for token in parse_search_query(query or ''):
+        if token.upper() != 'OR':
+            q_obj &= Q(title__icontains=token) | Q(abstract__icontains=token)
+    ids = papers.filter(q_obj).values_list('pk', flat=True)[offset:offset + limit]
+    return [(pk, 0.0) for pk in ids]
+
+
+# ---------------------------------------------------------------------------
+# Unified Article + ResearchPaper search
+
+STREAM_BATCH = 50
+
+
+class SearchHit:
+    """One merged result: kind is 'article' or 'paper', obj is filled for the current page only."""
+    __slots__ = ('kind', 'pk', 'score', 'date', 'obj')
+
+    def __init__(self, kind, pk, score, date):
+        self.kind = kind
+        self.pk = pk
+        self.score = score
+        self.date = date
+        self.obj = None
+
+    def sort_key(self):
+        # best score first, then newest first; kind/pk make the order total
+        return (-self.score, -self.date.timestamp(), self.kind, -self.pk)
+
+
+def _fts_rows(index, match, base_sql, base_params, date_column, limit, offset):
+    """Ranked (rowid, score, date) for FTS matches restricted to the ids selected by base_sql."""
+    t = index.table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {t}.rowid, -bm25({t}) AS score, base.{date_column} "
+            f"FROM {t} JOIN ({base_sql}) AS base ON base.id = {t}.rowid "
+            # rowid last: a total order, so OFFSET batches never repeat or skip rows
+            f"WHERE {t} MATCH %s ORDER BY score DESC, base.{date_column} DESC, {t}.rowid DESC LIMIT %s OFFSET %s",
+            list(base_params) + [match, limit, offset],
+        )
+        return cursor.fetchall()
+
+
+def _fts_count(index, match, base_sql, base_params):
+    t = index.table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT COUNT(*) FROM {t} JOIN ({base_sql}) AS base ON base.id = {t}.rowid WHERE {t} MATCH %s",
+            list(base_params) + [match],
+        )
+        return cursor.fetchone()[0]
+
+
+class SearchSource:
+    """
+    One ranked stream (articles or papers). With a text query and an FTS index
+    rows come from the index by bm25 score; otherwise newest first using
+    keyset pagination on (date, id), so deep pages never use OFFSET scans.
+    """
+
+    def __init__(self, kind, queryset, date_field, index, text_fields, query=''):
+        self.kind = kind
+        self.date_field = date_field
+        self.index = index
+        self.match = match_expression(query) if query else ''
+        self.use_index = bool(self.match) and index.available()
+        if self.match and not self.use_index:
+            queryset = queryset.filter(_icontains_q(query, text_fields))
+        self.queryset = queryset.order_by()
+
+    def _base(self):
+        base = self.queryset.values('id', self.date_field)
+        sql, params = base.query.sql_with_params()
+        return sql, params
+
+    def count(self):
+        if self.use_index:
+            return _fts_count(self.index, self.match, *self._base())
+        return self.queryset.count()
+
+    def __iter__(self):
+        if self.use_index:
+            base_sql, base_params = self._base()
+            offset = 0
+            top = None
+            while True:
+                rows = _fts_rows(self.index, self.match, base_sql, base_params, self.date_field,
+                                 STREAM_BATCH, offset)
+                if top is None:
+                    # bm25 of two FTS tables can't be compared: scale each
+                    # stream so its best match scores 1
+                    top = rows[0][1] if rows and rows[0][1] > 0 else 1.0
+                for pk, score, date in rows:
+                    yield SearchHit(self.kind, pk, score / top, _as_datetime(date))
+                if len(rows) < STREAM_BATCH:
+                    return
+                offset += STREAM_BATCH
+        else:
+            qs = self.queryset.order_by('-' + self.date_field, '-pk').values_list('pk', self.date_field)
+            last = None
+            while True:
+                batch = qs
+                if last is not None:
+                    date, pk = last
+                    batch = qs.filter(Q(**{self.date_field + '__lt': date}) |
+                                      Q(**{self.date_field: date, 'pk__lt': pk}))
+                rows = list(batch[:STREAM_BATCH])
+                for pk, date in rows:
+                    yield SearchHit(self.kind, pk, 0.0, date)
+                if len(rows) < STREAM_BATCH:
+                    return
+                last = (rows[-1][1], rows[-1][0])
+
+
+def _as_datetime(value):
+    # raw SQL on SQLite returns datetimes as strings
+    if isinstance(value, str):
+        from django.utils.dateparse import parse_datetime
+        value = parse_datetime(value)
+        if value is not None and timezone.is_naive(value):
+            value = timezone.make_aware(value, datetime.timezone.utc)
+    return value
+
+
+def _icontains_q(query, fields):
+    """Fallback text filter (old search behaviour): tokens AND-ed unless joined by OR."""
+    q_obj = None
+    current_op = 'AND'
+    for token in parse_search_query(query):
+        if token.upper() == 'OR':
+            current_op = 'OR'
+            continue
+        token_q = Q()
+        for field in fields:
+            token_q |= Q(**{field + '__icontains': token})
+        if q_obj is None:
+            q_obj = token_q
+        elif current_op == 'AND':
+            q_obj &= token_q
+        else:
+            q_obj |= token_q
+        current_op = 'AND'
+    return q_obj if q_obj is not None else Q()
+
+
+class MergedResults:
+    """
+    Paginator-compatible view over several SearchSources.
+    Slicing runs a lazy k-way merge (heapq.merge) and stops after the last
+    row of the page, so page N reads at most N * page_size rows per source and
+    never loads model instances for rows outside the page.
+    """
+
+    def __init__(self, sources):
+        self.sources = sources
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = sum(source.count() for source in self.sources)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        hits = self.hits(item.start or 0, item.stop)
+        self._attach_objects(hits)
+        return [hit for hit in hits if hit.obj is not None]
+
+    def hits(self, start, stop):
+        """Merged hits [start:stop] without model instances (kind, pk, score, date only)."""
+        merged = heapq.merge(*self.sources, key=SearchHit.sort_key)
+        return list(itertools.islice(merged, start, stop))
+
+    def _attach_objects(self, hits):
+        from .models import Article, ResearchPaper
+        loaders = {
+            'article': Article.objects.select_related('author').defer('content'),
+            'paper': ResearchPaper.objects.defer('content'),
+        }
+        for kind, qs in loaders.items():
+            ids = [hit.pk for hit in hits if hit.kind == kind]
+            if not ids:
+                continue
+            objects = qs.in_bulk(ids)
+            for hit in hits:
+                if hit.kind == kind:
+                    hit.obj = objects.get(hit.pk)
+
+
+def unified_search(query='', author=None, tag='', category='', kinds=('article', 'paper')):
+    """
+    Build the merged search over published articles and papers.
+    `author` is a user id or username; tag/category only apply to articles
+    (papers have neither, so they are left out when those filters are set).
+    """
+    from django.contrib.auth import get_user_model
+    from .models import Article, ResearchPaper
+
+    author_ids = None
+    if author:
+        User = get_user_model()
+        try:
+            author_ids = [int(author)]
+        except (TypeError, ValueError):
+            author_ids = list(User.objects.filter(username__iexact=author).values_list('pk', flat=True))
+
+    sources = []
+    if 'article' in kinds:
+        articles = Article.objects.filter(published=True)
+        if author_ids is not None:
+            articles = articles.filter(author__in=author_ids)
+        if tag:
+            articles = articles.filter(tags__icontains=tag)
+        if category and hasattr(Article, 'category'):
+            articles = articles.filter(category__iexact=category)
+        sources.append(SearchSource('article', articles, 'publish_date', ARTICLE_INDEX,
+                                    ('title', 'content', 'summary', 'tags'), query))
+    if 'paper' in kinds and not tag and not category:
+        papers = ResearchPaper.objects.filter(published=True)
+        if author_ids is not None:
+            papers = papers.filter(uploaded_by__in=author_ids)
+        sources.append(SearchSource('paper', papers, 'created_at', PAPER_INDEX,
+                                    ('title', 'abstract', 'authors'), query))
+    return MergedResults(sources)
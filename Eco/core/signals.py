@@ -0,0 +1,219 @@
+# core/signals.py
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Article, PaperText, ResearchPaper
+
+logger = logging.getLogger(__name__)
+
+# file fields backed by the reference-counted storage (core/storage.py)
+FILE_FIELDS = {
+    Article: ('cover_image', 'attachment'),
+    ResearchPaper: ('pdf',),
+}
+
+REVISION_FIELDS = ('title', 'content')
+
+# what the pre_save handlers below compare against: read once per save
+PREVIOUS_FIELDS = {
+    Article: FILE_FIELDS[Article] + ('published', 'tags', 'author_id') + REVISION_FIELDS,
+    ResearchPaper: FILE_FIELDS[ResearchPaper],
+}
+
+
+@receiver(pre_save, sender=Article)
+@receiver(pre_save, sender=ResearchPaper)
+def remember_previous_row(sender, instance, raw=False, **kwargs):
+    # connected first, so it runs before every other pre_save handler here
+    instance._previous_row = None
+    if not raw and instance.pk:
+        instance._previous_row = sender.objects.filter(pk=instance.pk).values(*PREVIOUS_FIELDS[sender]).first()
+
+
+@receiver(post_save, sender=Article)
+def article_cover_variants(sender, instance, raw=False, **kwargs):
+    # resized cover images are built in the background (see core/images.py)
+    if raw:
+        return
+    try:
+        from .images import schedule_variants
+        schedule_variants(instance)
+    except Exception:
+        # thumbnails must never break saving an article
+        logger.exception('Could not schedule cover variants for article %s', instance.pk)
+
+
+def _release_files(storage_names):
+    # drop references only once the row change is committed
+    for storage, name in storage_names:
+        transaction.on_commit(lambda storage=storage, name=name: storage.delete(name))
+
+
+@receiver(pre_save, sender=Article)
+@receiver(pre_save, sender=ResearchPaper)
+def release_replaced_files(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old = instance._previous_row or {}
+    released, uploading = [], []
+    for field in FILE_FIELDS[sender]:
+        fieldfile = getattr(instance, field)
+        storage, new_name, old_name = fieldfile.storage, fieldfile.name, old.get(field)
+        if not fieldfile._committed:
+            # the upload happens during the save; settled in post_save
+            uploading.append((field, old_name))
+            continue
+        counted = bool(new_name) and hasattr(storage, 'claim') and storage.claim(new_name)
+        if new_name == old_name:
+            if counted:
+                # the same content uploaded again: keep a single reference
+                released.append((storage, new_name))
+            continue
+        if new_name and not counted and hasattr(storage, 'retain'):
+            # an existing blob's name was assigned: inside the save's
+            # transaction, so a rollback undoes this too
+            storage.retain(new_name)
+        if old_name:
+            released.append((storage, old_name))
+    instance._uploading_files = uploading
+    _release_files(released)
+
+
+@receiver(post_save, sender=Article)
+@receiver(post_save, sender=ResearchPaper)
+def settle_uploaded_files(sender, instance, raw=False, **kwargs):
+    released = []
+    for field, old_name in instance.__dict__.pop('_uploading_files', ()):
+        fieldfile = getattr(instance, field)
+        if fieldfile.name and hasattr(fieldfile.storage, 'claim'):
+            fieldfile.storage.claim(fieldfile.name)
+        if old_name:
+            # replaced, or the same content uploaded again (now counted twice)
+            released.append((fieldfile.storage, old_name))
+    _release_files(released)
+
+
+@receiver(post_delete, sender=Article)
+@receiver(post_delete, sender=ResearchPaper)
+def release_deleted_files(sender, instance, **kwargs):
+    released = []
+    for field in FILE_FIELDS[sender]:
+        fieldfile = getattr(instance, field)
+        if fieldfile:
+            released.append((fieldfile.storage, fieldfile.name))
+    _release_files(released)
+
+
+@receiver(post_save, sender=ResearchPaper)
+def index_saved_paper(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .search import index_paper_metadata
+    index_paper_metadata(instance)
+
+
+@receiver(pre_delete, sender=ResearchPaper)
+def unindex_deleted_paper(sender, instance, **kwargs):
+    # the FTS row is contentless: drop it while the indexed values still exist
+    from .search import unindex_paper
+    paper_text = PaperText.objects.filter(paper=instance).first()
+    if paper_text is not None:
+        unindex_paper(paper_text)
+
+
+def _refresh_feeds(articles):
+    tags, authors = set(), set()
+    for published, tag_string, author_id in articles:
+        if published:
+            tags.update((tag_string or '').split(','))
+            authors.add(author_id)
+    if tags or authors:
+        from .feeds import invalidate_article_feeds
+        invalidate_article_feeds(tags, authors)
+
+
+@receiver(post_save, sender=Article)
+def refresh_article_feeds(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    states = [(instance.published, instance.tags, instance.author_id)]
+    # what the article looked like before, so feeds it leaves are refreshed too
+    previous = getattr(instance, '_previous_row', None)
+    if previous:
+        states.append((previous['published'], previous['tags'], previous['author_id']))
+    # only rebuild once the change is visible to the next request
+    transaction.on_commit(lambda: _refresh_feeds(states))
+
+
+@receiver(post_delete, sender=Article)
+def refresh_deleted_article_feeds(sender, instance, **kwargs):
+    states = [(instance.published, instance.tags, instance.author_id)]
+    transaction.on_commit(lambda: _refresh_feeds(states))
+
+
+@receiver(pre_save, sender=Article)
+def record_revision_baseline(sender, instance, raw=False, update_fields=None, **kwargs):
+    # runs inside Article.save()'s transaction, as does record_article_revision
+    instance._revision_changed = False
+    if raw or (update_fields is not None and not set(REVISION_FIELDS) & set(update_fields)):
+        return
+    previous = instance._previous_row
+    if previous and (previous['title'], previous['content']) == (instance.title, instance.content):
+        # publish toggles, tag edits...: no new revision
+        return
+    instance._revision_changed = True
+    if instance.pk:
+        from .revisions import ensure_baseline
+        ensure_baseline(instance.pk)
+
+
+@receiver(post_save, sender=Article)
+def record_article_revision(sender, instance, raw=False, **kwargs):
+    if raw or not instance.__dict__.pop('_revision_changed', False):
+        return
+    from .revisions import record_revision
+    record_revision(instance, editor=getattr(instance, '_revision_editor', None))
+
+
+@receiver(post_save, sender=Article)
+def schedule_related_update(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_row', None) or {}
+    if instance.published or previous.get('published'):
+        from .related import schedule_updates
+        schedule_updates([instance.pk])
+
+
+@receiver(pre_delete, sender=Article)
+def forget_related_terms(sender, instance, **kwargs):
+    from .related import forget
+    forget(instance.pk)
+
+
+def _suggest_changed(pk):
+    def bump():
+        try:
+            from .suggest import content_changed
+            content_changed(pk)
+        except Exception:
+            # typeahead indexes rebuild on their own schedule anyway
+            logger.exception('Could not record a typeahead change for article %s', pk)
+    transaction.on_commit(bump)
+
+
+@receiver(post_save, sender=Article)
+def refresh_suggest_index(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_row', None) or {}
+    if instance.published or previous.get('published'):
+        _suggest_changed(instance.pk)
+
+
+@receiver(post_delete, sender=Article)
+def refresh_deleted_suggest_index(sender, instance, **kwargs):
+    _suggest_changed(instance.pk)
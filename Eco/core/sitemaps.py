@@ -0,0 +1,93 @@
+# core/sitemaps.py
+"""
+Sitemap index (/sitemap.xml) and its shards.
+
+Shards cover fixed primary-key ranges (SHARD_SIZE ids each), so the index
+needs only MAX(id) and each shard is an index range scan, never an OFFSET.
+Shards are streamed: rows come from .iterator(chunk_size=...) and are written
+out WRITE_ROWS at a time, so memory stays flat however many articles exist.
+A shard can hold fewer than SHARD_SIZE urls (deleted/unpublished ids) but
+never more than the protocol limit of 50,000.
+"""
+from xml.sax.saxutils import escape
+
+from django.db.models import Max
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.http import require_GET
+
+from .models import Article, ResearchPaper
+
+SHARD_SIZE = 50_000
+CHUNK_SIZE = 2_000
+WRITE_ROWS = 500
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+STATIC_PAGES = ('index', 'paper_list', 'about', 'team', 'contact')
+
+# section -> (model, date column for <lastmod>, detail url name)
+SECTIONS = {
+    'articles': (Article, 'updated_at', 'article_detail'),
+    'papers': (ResearchPaper, 'created_at', 'paper_detail'),
+}
+
+
+def shard_count(model):
+    max_id = model.objects.aggregate(m=Max('pk'))['m'] or 0
+    return max_id // SHARD_SIZE + 1
+
+
+@require_GET
+def sitemap_index(request):
+    lines = [XML_HEADER, f'<sitemapindex xmlns="{SITEMAP_NS}">\n']
+    locations = [reverse('sitemap_pages')]
+    for section, (model, _, _) in SECTIONS.items():
+        locations += [reverse('sitemap_shard', args=[section, n]) for n in range(1, shard_count(model) + 1)]
+    for location in locations:
+        lines.append(f'<sitemap><loc>{escape(request.build_absolute_uri(location))}</loc></sitemap>\n')
+    lines.append('</sitemapindex>\n')
+    return HttpResponse(''.join(lines), content_type='application/xml')
+
+
+@require_GET
+def sitemap_pages(request):
+    lines = [XML_HEADER, f'<urlset xmlns="{SITEMAP_NS}">\n']
+    for name in STATIC_PAGES:
+        lines.append(f'<url><loc>{escape(request.build_absolute_uri(reverse(name)))}</loc></url>\n')
+    lines.append('</urlset>\n')
+    return HttpResponse(''.join(lines), content_type='application/xml')
+
+
+def shard_rows(model, date_field, shard):
+    """(slug, date) of published rows with ids in the shard's range, streamed."""
+    first = (shard - 1) * SHARD_SIZE + 1
+    return (model.objects.filter(published=True, pk__gte=first, pk__lt=first + SHARD_SIZE)
+            .order_by('pk').values_list('slug', date_field).iterator(chunk_size=CHUNK_SIZE))
+
+
+def render_urlset(rows, url_prefix, url_suffix):
+    """Yield the <urlset> document in pieces of WRITE_ROWS urls."""
+    yield XML_HEADER + f'<urlset xmlns="{SITEMAP_NS}">\n'
+    buffer = []
+    for slug, date in rows:
+        lastmod = f'<lastmod>{date.date().isoformat()}</lastmod>' if date else ''
+        buffer.append(f'<url><loc>{escape(url_prefix + slug + url_suffix)}</loc>{lastmod}</url>\n')
+        if len(buffer) >= WRITE_ROWS:
+            yield ''.join(buffer)
+            buffer = []
+    buffer.append('</urlset>\n')
+    yield ''.join(buffer)
+
+
+@require_GET
+def sitemap_shard(request, section, shard):
+    if section not in SECTIONS or shard < 1:
+        raise Http404
+    model, date_field, url_name = SECTIONS[section]
+    # build the url around a placeholder once instead of reversing per row
+    template = request.build_absolute_uri(reverse(url_name, args=['__slug__']))
+    prefix, suffix = template.split('__slug__')
+    rows = shard_rows(model, date_field, shard)
+    return StreamingHttpResponse(render_urlset(rows, prefix, suffix), content_type='application/xml')
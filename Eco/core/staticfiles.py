@@ -0,0 +1,66 @@
+# core/staticfiles.py
+"""
+collectstatic storage that fingerprints and precompresses static files.
+
+CompressedManifestStaticFilesStorage builds on Django's
+ManifestStaticFilesStorage (content-hashed names such as
+core/css/style.3f1a9c0b2d4e.css, rewritten url() references) and then writes
+.gz and .br siblings for every text-like hashed file, so no compression
+happens at request time. PrecompressedStaticMiddleware (core/middleware.py)
+serves them.
+
+Brotli output needs the optional `brotli` package; without it only .gz files
+are written.
+"""
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = {
+    '.css', '.js', '.mjs', '.map', '.json', '.svg', '.txt', '.xml', '.html', '.ico', '.ttf', '.otf', '.eot',
+}
+# below this the compressed file plus headers is rarely worth it
+MIN_SIZE = 256
+
+
+def compress_file(path, min_size=MIN_SIZE):
+    """Write path.gz (and path.br) if they are smaller than the original. Returns the encodings written."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < min_size:
+        return []
+    written = []
+    variants = [('gzip', '.gz', lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('br', '.br', lambda d: brotli.compress(d, quality=11)))
+    for encoding, suffix, compress in variants:
+        compressed = compress(data)
+        if len(compressed) >= len(data):
+            continue
+        tmp = path + suffix + '.tmp'
+        with open(tmp, 'wb') as out:
+            out.write(compressed)
+        os.replace(tmp, path + suffix)
+        written.append(encoding)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+
+    def post_process(self, paths, dry_run=False, **options):
+        hashed = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed.add(hashed_name)
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for hashed_name in sorted(hashed):
+            if os.path.splitext(hashed_name)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+                compress_file(self.path(hashed_name))
@@ -0,0 +1,211 @@
+# core/storage.py
+"""
+Content-addressed, deduplicated storage for uploaded media.
+
+Files are stored once under their SHA-256:
+    blobs/ab/cd/abcd1234...<ext>
+Uploading the same cover image or PDF again only bumps a reference count
+(StoredBlob.refs); delete() decrements it and removes the file when the
+last reference is gone. Because a blob name never changes content, these
+files can be served with long-lived immutable cache headers.
+
+The hash is computed while the upload streams in (HashingUploadHandler) or,
+for other content, while it is copied to a temp file — the bytes are never
+read twice.
+
+Reference counts follow model saves and deletes (core/signals.py):
+  - uploading a file takes a reference (_save),
+  - assigning the name of a blob that is already stored, e.g.
+    `b.cover_image = a.cover_image.name`, takes one in pre_save (retain);
+    uploads are told apart from such names by claim(),
+  - replacing or deleting a file drops one once the transaction commits.
+A rolled back save leaves the counts as they were. queryset.update() and
+bulk_create() of existing names skip the signals: call retain() / delete()
+for those names yourself, or run `manage.py recount_blobs` afterwards.
+Resized cover variants (core/images.py) go with their blob.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from collections import Counter
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import models, transaction
+
+BLOB_PREFIX = 'blobs'
+HASH_NAME = 'sha256'
+
+# references this thread took by uploading, not yet attached to a saved row
+_local = threading.local()
+
+
+def _unattached():
+    if not hasattr(_local, 'names'):
+        _local.names = Counter()
+    return _local.names
+
+
+def blob_name(digest, original_name):
+    ext = os.path.splitext(original_name)[1].lower()
+    return f'{BLOB_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{ext}'
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """
+    Temporary-file upload handler that also hashes each chunk as it arrives,
+    so the storage can move the temp file into place without re-reading it.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.new(HASH_NAME)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        uploaded.content_hash = self.hasher.hexdigest()
+        return uploaded
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def is_content_addressed(self, name):
+        return bool(name) and name.startswith(BLOB_PREFIX + '/')
+
+    def get_available_name(self, name, max_length=None):
+        # the final name is chosen by _save() from the content hash
+        return name
+
+    def _spool(self, content):
+        """Copy content to a temp file next to the blobs while hashing it."""
+        tmp_dir = self.path(os.path.join(BLOB_PREFIX, 'tmp'))
+        os.makedirs(tmp_dir, exist_ok=True)
+        hasher = hashlib.new(HASH_NAME)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    hasher.update(chunk)
+                    out.write(chunk)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return hasher.hexdigest(), tmp_path
+
+    def _save(self, name, content):
+        from .models import StoredBlob
+
+        digest = getattr(content, 'content_hash', None)
+        if digest and hasattr(content, 'temporary_file_path'):
+            tmp_path = content.temporary_file_path()
+        else:
+            digest, tmp_path = self._spool(content)
+
+        final_name = blob_name(digest, name)
+        full_path = self.path(final_name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        size = os.path.getsize(tmp_path)
+
+        # take the row lock first so a concurrent delete() of the same blob
+        # cannot remove the file between our existence check and the commit
+        with transaction.atomic():
+            if not StoredBlob.objects.filter(name=final_name).update(refs=models.F('refs') + 1):
+                StoredBlob.objects.create(name=final_name, size=size, refs=1)
+            if os.path.exists(full_path):
+                # duplicate upload: keep the existing blob, drop the new bytes
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+            else:
+                file_move_safe(tmp_path, full_path, allow_overwrite=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(full_path, self.file_permissions_mode)
+        _unattached()[final_name] += 1
+        return final_name
+
+    def claim(self, name):
+        """True if this thread's upload already took the reference for `name` (and it is now used)."""
+        names = _unattached()
+        if names[name] <= 0:
+            return False
+        names[name] -= 1
+        if not names[name]:
+            del names[name]
+        return True
+
+    def retain(self, name):
+        """Take one more reference to an already stored blob."""
+        if not self.is_content_addressed(name):
+            return
+        from .models import StoredBlob
+
+        with transaction.atomic():
+            if not StoredBlob.objects.filter(name=name).update(refs=models.F('refs') + 1):
+                size = self.size(name) if self.exists(name) else 0
+                StoredBlob.objects.create(name=name, size=size, refs=1)
+
+    def delete(self, name):
+        """Drop one reference; the file goes away with the last one."""
+        if not self.is_content_addressed(name):
+            # legacy upload (before content addressing): may be shared, keep it
+            return
+        from .models import StoredBlob
+
+        with transaction.atomic():
+            StoredBlob.objects.filter(name=name, refs__gt=0).update(refs=models.F('refs') - 1)
+            if StoredBlob.objects.filter(name=name, refs__lte=0).delete()[0]:
+                super().delete(name)
+                self._delete_variants(name)
+
+    def _delete_variants(self, name):
+        from .images import variant_prefix
+
+        folder, prefix = variant_prefix(name)
+        if not self.exists(folder):
+            return
+        for filename in self.listdir(folder)[1]:
+            if filename.startswith(prefix):
+                super().delete(os.path.join(folder, filename))
+
+
+content_addressed_storage = ContentAddressedStorage()
+
+
+def recount():
+    """
+    Set StoredBlob.refs to the number of file fields naming each blob.
+    Blobs nothing points at are left alone (an upload may be in flight).
+    Returns the number of counts corrected.
+    """
+    from .models import StoredBlob
+    from .signals import FILE_FIELDS
+
+    actual = Counter()
+    for model, fields in FILE_FIELDS.items():
+        for field in fields:
+            names = model.objects.filter(**{field + '__startswith': BLOB_PREFIX + '/'}).values_list(field, flat=True)
+            actual.update(names.iterator())
+    fixed = 0
+    with transaction.atomic():
+        stored = dict(StoredBlob.objects.filter(name__in=list(actual)).values_list('name', 'refs'))
+        for name, refs in actual.items():
+            if name not in stored:
+                size = content_addressed_storage.size(name) if content_addressed_storage.exists(name) else 0
+                StoredBlob.objects.create(name=name, size=size, refs=refs)
+                fixed += 1
+            elif stored[name] != refs:
+                StoredBlob.objects.filter(name=name).update(refs=refs)
+                fixed += 1
+    return fixed
+
+
+def media_storage():
+    # callable so migrations reference the function, not a storage instance
+    return content_addressed_storage
@@ -0,0 +1,229 @@
+# core/tasks.py
+"""
+Database task queue: request handlers enqueue work, `manage.py run_tasks`
+does it.
+
+    from core import tasks
+
+    @tasks.task(lane='high')
+    def send_email(subject, body, to, ...): ...
+
+    send_email.delay(subject='Hi', body='...', to=['a@example.com'])
+
+Each job is a Task row holding the task name and its keyword arguments as
+JSON. A worker claims up to `batch` due jobs at a time, going through its
+lanes in TASK_LANES order, so a pile of 'low' work never holds up 'high'
+mail. Claiming is:
+  - SELECT ... FOR UPDATE SKIP LOCKED where the database has it (PostgreSQL),
+  - on SQLite: read the candidate ids, then UPDATE the rows that are still
+    claimable, stamping them with a fresh claim token. Rows another worker
+    took in between no longer match and are skipped, as SKIP LOCKED would.
+A claim is a lease of TASK_LEASE_SECONDS; jobs of a worker that died are
+claimed again when it runs out, so tasks must be safe to run twice.
+
+A job that raises runs again after TASK_RETRY_BASE * 2**(attempts - 1)
+seconds (at most TASK_RETRY_MAX, with jitter). After its max_attempts it is
+moved to DeadTask, where the admin can requeue it.
+
+With TASKS_EAGER enqueue() runs the job right away instead (tests, or
+development without a worker).
+"""
+import logging
+import random
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import metrics
+from .models import DeadTask, Task
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LANES = ('high', 'default', 'low')
+# stored with the job; long tracebacks are cut to this many characters
+MAX_ERROR_LENGTH = 4000
+
+_registry = {}
+
+
+def lanes():
+    return tuple(getattr(settings, 'TASK_LANES', DEFAULT_LANES))
+
+
+class TaskFunction:
+    """A registered task: call it to run it here, .delay() to enqueue it."""
+
+    def __init__(self, func, name, lane, max_attempts):
+        self.func = func
+        self.name = name
+        self.lane = lane
+        self.max_attempts = max_attempts
+        self.__doc__ = func.__doc__
+
+    def __call__(self, **kwargs):
+        return self.func(**kwargs)
+
+    def delay(self, **kwargs):
+        return enqueue(self.name, kwargs)
+
+
+def task(name=None, lane='default', max_attempts=None):
+    """Register a function as a task. Its arguments must be keyword arguments that JSON can hold."""
+
+    def decorator(func):
+        task_name = name or f'{func.__module__}.{func.__name__}'
+        entry = TaskFunction(func, task_name, lane, max_attempts)
+        _registry[task_name] = entry
+        return entry
+
+    return decorator
+
+
+def enqueue(name, payload=None, lane=None, delay=0, max_attempts=None):
+    """Add a job for the task called `name`; returns the Task (None when run eagerly)."""
+    entry = _registry.get(name)
+    if entry is None:
+        raise LookupError(f'unknown task {name!r}')
+    payload = payload or {}
+    lane = lane or entry.lane
+    if lane not in lanes():
+        raise ValueError(f'unknown lane {lane!r}, expected one of {lanes()}')
+    metrics.TASKS_ENQUEUED.inc(lane=lane)
+    if getattr(settings, 'TASKS_EAGER', False):
+        entry.func(**payload)
+        metrics.TASKS_RUN.inc(task=name, result='done')
+        return None
+    return Task.objects.create(
+        name=name, payload=payload, lane=lane,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or entry.max_attempts or getattr(settings, 'TASK_MAX_ATTEMPTS', 5),
+    )
+
+
+# ---------------------------------------------------------------------------
+# Worker side
+# ---------------------------------------------------------------------------
+
+def _claimable(now):
+    # due jobs, and jobs whose worker let the lease run out
+    return Q(status=Task.QUEUED, run_at__lte=now) | Q(status=Task.RUNNING, locked_until__lt=now)
+
+
+def claim(worker, lane_names=None, batch=10, now=None):
+    """Claim up to `batch` due jobs for `worker`, from `lane_names` in order."""
+    now = now or timezone.now()
+    until = now + timedelta(seconds=getattr(settings, 'TASK_LEASE_SECONDS', 300))
+    claimed = []
+    for lane in lane_names or lanes():
+        if len(claimed) >= batch:
+            break
+        claimed += _claim_lane(worker, lane, batch - len(claimed), now, until)
+    return claimed
+
+
+def _claim_lane(worker, lane, limit, now, until):
+    token = f'{worker}:{uuid.uuid4().hex[:8]}'[-64:]
+    due = Task.objects.filter(_claimable(now), lane=lane).order_by('run_at', 'pk')
+    claim_update = {'status': Task.RUNNING, 'claimed_by': token, 'locked_until': until,
+                    'attempts': F('attempts') + 1}
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(due.select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit])
+            Task.objects.filter(pk__in=ids).update(**claim_update)
+    else:
+        ids = list(due.values_list('pk', flat=True)[:limit])
+        if not ids:
+            return []
+        Task.objects.filter(_claimable(now), pk__in=ids).update(**claim_update)
+    return list(Task.objects.filter(pk__in=ids, claimed_by=token).order_by('run_at', 'pk'))
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying a job that has failed `attempts` times."""
+    base = getattr(settings, 'TASK_RETRY_BASE', 10)
+    delay = min(getattr(settings, 'TASK_RETRY_MAX', 3600), base * 2 ** max(0, attempts - 1))
+    # jitter, so jobs that failed together don't all come back together
+    return delay * random.uniform(0.5, 1.0)
+
+
+def run(job):
+    """Run a claimed job and record the outcome. True if it succeeded."""
+    entry = _registry.get(job.name)
+    try:
+        if entry is None:
+            raise LookupError(f'unknown task {job.name!r}')
+        entry.func(**job.payload)
+    except Exception:
+        _failed(job, traceback.format_exc()[-MAX_ERROR_LENGTH:])
+        return False
+    Task.objects.filter(pk=job.pk, claimed_by=job.claimed_by).delete()
+    metrics.TASKS_RUN.inc(task=job.name, result='done')
+    return True
+
+
+def _failed(job, error):
+    mine = Task.objects.filter(pk=job.pk, claimed_by=job.claimed_by)
+    if job.attempts >= job.max_attempts:
+        with transaction.atomic():
+            if mine.delete()[0]:
+                DeadTask.objects.create(name=job.name, payload=job.payload, lane=job.lane,
+                                        attempts=job.attempts, last_error=error, created_at=job.created_at)
+        metrics.TASKS_RUN.inc(task=job.name, result='dead')
+        logger.error('task %s (%s) failed %d times, moved to the dead letters', job.pk, job.name, job.attempts)
+        return
+    retry_at = timezone.now() + timedelta(seconds=backoff(job.attempts))
+    mine.update(status=Task.QUEUED, run_at=retry_at, claimed_by='', locked_until=None, last_error=error)
+    metrics.TASKS_RUN.inc(task=job.name, result='retry')
+    logger.warning('task %s (%s) failed, attempt %d of %d; retrying at %s',
+                   job.pk, job.name, job.attempts, job.max_attempts, retry_at.isoformat())
+
+
+def run_batch(worker, lane_names=None, batch=10):
+    """Claim and run one batch; returns (succeeded, failed)."""
+    done = failed = 0
+    for job in claim(worker, lane_names, batch):
+        if run(job):
+            done += 1
+        else:
+            failed += 1
+    return done, failed
+
+
+def requeue(dead_tasks):
+    """Put dead jobs back on the queue with fresh attempts; returns how many."""
+    count = 0
+    for dead in dead_tasks:
+        with transaction.atomic():
+            Task.objects.create(name=dead.name, payload=dead.payload, lane=dead.lane,
+                                max_attempts=max(dead.attempts, 1), last_error=dead.last_error)
+            dead.delete()
+        count += 1
+    return count
+
+
+# ---------------------------------------------------------------------------
+# Tasks
+# ---------------------------------------------------------------------------
+
+@task(name='core.send_email', lane='high')
+def send_email(subject, body, to, from_email=None, html_body=None, reply_to=None):
+    """Send one email through the configured backend (errors go back to the queue)."""
+    message = EmailMultiAlternatives(subject=subject, body=body, from_email=from_email,
+                                     to=to, reply_to=reply_to)
+    if html_body:
+        message.attach_alternative(html_body, 'text/html')
+    message.send(fail_silently=False)
+
+
+@task(name='core.update_related', lane='low')
+def update_related(article_id=None, article_ids=()):
+    """Refresh the related-reading vectors and neighbours of some articles (core/related.py)."""
+    from .related import update_article
+    for pk in [article_id] if article_id is not None else article_ids:
+        update_article(pk)
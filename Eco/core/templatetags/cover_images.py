@@ -0,0 +1,38 @@
+# core/templatetags/cover_images.py
+from django import template
+from django.utils.html import format_html
+
+from ..images import srcset
+
+register = template.Library()
+
+# card grid: ~1 column on phones, 3 columns on desktop
+DEFAULT_SIZES = '(max-width: 700px) 100vw, 33vw'
+
+
+@register.simple_tag
+def cover_picture(article, css_class='thumb', sizes=DEFAULT_SIZES, alt=''):
+    """
+    <picture> for an article cover with WebP + fallback srcsets.
+    Falls back to the original upload until the variants have been built.
+    Usage: {% cover_picture article "thumb" %}
+    """
+    if not article.cover_image:
+        return ''
+    variants = article.cover_variants or {}
+    original = article.cover_image.url
+    if variants.get('source') != article.cover_image.name or not variants.get('widths'):
+        return format_html('<img src="{}" class="{}" alt="{}" loading="lazy">', original, css_class, alt)
+
+    storage = article.cover_image.storage
+    widths = variants['widths']
+    smallest = widths[min(widths, key=int)]
+    fallback_src = storage.url(smallest['fallback'])
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" class="{}" alt="{}" loading="lazy">'
+        '</picture>',
+        srcset(variants, 'webp', storage), sizes,
+        fallback_src, srcset(variants, 'fallback', storage), sizes, css_class, alt,
+    )
@@ -1,3 +1,2070 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import random
+import resource
+import sys
+import time
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, transaction
+from django.urls import include, path, reverse
+from django.utils import timezone
+from django.utils.http import urlencode
+
+from . import (async_views, bench, compression, loadshed, metrics, pdftext, profiling, ratelimit, related, suggest,
+               tasks, trending)
+from .admin import ArticleAdmin
+from .middleware import CompressionMiddleware
+from .models import User, Article, ResearchPaper, Visit
+from . import sitemaps
+from .exports import EXPORTS, filter_dates, stream_export
+from .imports import clean_record, import_batch
+from . import revisions
+from .models import (ArticleRevision, ArticleStats, ArticleTerm, ArticleVector, ChunkedUpload, DeadTask, PaperText,
+                     RelatedArticle, StoredBlob, Task, TermDocFreq, TrendingArticle, VisitDailyRollup)
+from .rollups import rollup_visits
+from .queryplan import explain_captured
+from .search import unified_search
+
+
+class QueryPlanTests(TestCase):
+    """
+    Regression harness for the hot ORM queries.
+    Renders the pages that run them (views + context processors) on a seeded
+    database, then EXPLAINs every captured SELECT and fails on full table
+    scans or temp B-tree sorts.
+    """
+
+    # the tag filter is LIKE '%...%' by design and cannot use an index;
+    # that path is not covered here.
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.editor = User.objects.create_user('editor', password='pw', role='editor')
+        cls.reader = User.objects.create_user('reader', password='pw')
+        now = timezone.now()
+        Article.objects.bulk_create([
+            Article(
+                title=f'Article {i}', slug=f'article-{i}', content='Body text',
+                summary='Summary', author=cls.editor if i % 2 else cls.reader,
+                published=i % 3 != 0, publish_date=now - timedelta(hours=i),
+                tags='solar, wind' if i % 2 else 'ocean',
+            )
+            for i in range(200)
+        ])
+        today = now.date()
+        Visit.objects.bulk_create(
+            [Visit(session_key=f'sess{i}', date=today - timedelta(days=i % 10), count=i) for i in range(300)]
+            + [Visit(user=cls.reader, date=today - timedelta(days=i), count=1) for i in range(30)]
+        )
+
+    def assertPlansClean(self, url, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+        self.assertIn(response.status_code, (200, 302))
+        report = []
+        for sql, lines, problems in explain_captured(ctx.captured_queries):
+            if problems:
+                report.append(f'{sql}\n    ' + '\n    '.join(lines))
+        self.assertFalse(report, 'Queries with scans or temp B-tree sorts:\n' + '\n'.join(report))
+
+    def test_index(self):
+        self.assertPlansClean(reverse('index'))
+        self.assertPlansClean(reverse('index'), page=3)
+
+    def test_index_logged_in(self):
+        self.client.force_login(self.reader)
+        self.client.get(reverse('article_detail', args=['article-1']))
+        self.assertPlansClean(reverse('index'))
+
+    def test_article_detail(self):
+        self.assertPlansClean(reverse('article_detail', args=['article-4']))
+
+    def test_search_without_text(self):
+        self.assertPlansClean(reverse('search'))
+        self.assertPlansClean(reverse('search'), author=self.editor.pk)
+
+    def test_search_with_text(self):
+        ResearchPaper.objects.create(title='Solar paper', slug='solar-paper', content='x', published=True)
+        unified_search('warm up').count()  # one-time FTS table lookup
+        self.assertPlansClean(reverse('search'), q='solar OR ocean')
+        self.assertPlansClean(reverse('paper_list'))
+
+    def test_dashboard(self):
+        self.client.force_login(self.reader)
+        self.client.get(reverse('article_detail', args=['article-1']))
+        self.assertPlansClean(reverse('dashboard'))
+
+    def test_track_visit(self):
+        self.client.force_login(self.reader)
+        self.assertPlansClean(reverse('track_visit'))
+
+
+class UnifiedSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        author = User.objects.create_user('author')
+        for i in range(15):
+            Article.objects.create(title=f'Wind farms {i}', slug=f'a{i}', content='turbines ' * (i % 4 + 1),
+                                   published=True, publish_date=now - timedelta(days=i), author=author)
+            ResearchPaper.objects.create(title=f'Turbine study {i}', slug=f'p{i}', content='x',
+                                         abstract='offshore wind', published=True)
+        Article.objects.create(title='Draft wind', slug='draft', content='x', published=False)
+
+    def test_merges_both_kinds(self):
+        results = unified_search('wind')
+        self.assertEqual(results.count(), 30)
+        kinds = {hit.kind for hit in results[0:30]}
+        self.assertEqual(kinds, {'article', 'paper'})
+
+    def test_pages_match_full_ordering(self):
+        for query in ('turbine', ''):
+            full = [(h.kind, h.pk) for h in unified_search(query)[0:30]]
+            paged = [(h.kind, h.pk) for page in range(3) for h in unified_search(query)[page * 10:page * 10 + 10]]
+            self.assertEqual(full, paged)
+            self.assertEqual(len(set(full)), 30)
+
+    def test_index_follows_edits(self):
+        article = Article.objects.get(slug='a0')
+        article.title = 'Geothermal'
+        article.save()
+        self.assertEqual([h.pk for h in unified_search('geothermal', kinds=('article',))[0:5]], [article.pk])
+        article.delete()
+        self.assertEqual(unified_search('geothermal').count(), 0)
+
+    def test_search_page_badges(self):
+        response = self.client.get(reverse('search'), {'q': 'offshore'})
+        self.assertContains(response, '<span class="tag">Research paper</span>', count=8)
+
+    def test_scores_are_scaled_per_source(self):
+        from .search import PAPER_INDEX
+        if not PAPER_INDEX.available():
+            self.skipTest('no FTS5')
+        hits = unified_search('wind')[0:30]
+        for kind in ('article', 'paper'):
+            scores = [hit.score for hit in hits if hit.kind == kind]
+            self.assertAlmostEqual(max(scores), 1.0)
+            self.assertTrue(all(0 < score <= 1 for score in scores))
+
+    def test_equal_scores_page_across_batches(self):
+        from . import search
+        same = timezone.now() - timedelta(days=30)
+        author = User.objects.first()
+        for i in range(search.STREAM_BATCH + 10):
+            Article.objects.create(title='Identical heatpump', slug=f'same{i}', content='same',
+                                   published=True, publish_date=same, author=author)
+        hits = [(h.kind, h.pk) for h in unified_search('heatpump', kinds=('article',)).hits(0, 100)]
+        self.assertEqual(len(hits), search.STREAM_BATCH + 10)
+        self.assertEqual(len(set(hits)), len(hits))
+
+    def test_search_papers_skips_unpublished(self):
+        from .search import PAPER_INDEX, search_papers
+        draft = ResearchPaper.objects.create(title='Turbine draft', slug='pdraft', content='x',
+                                             abstract='offshore wind', published=False)
+        for available in (PAPER_INDEX.available(), False):
+            with mock.patch.object(PAPER_INDEX, 'available', return_value=available):
+                ids = [pk for pk, _ in search_papers('offshore', limit=100)]
+            self.assertEqual(len(ids), 15)
+            self.assertNotIn(draft.pk, ids)
+
+    def test_raw_sqlite_dates_become_aware(self):
+        from .search import _as_datetime
+        value = _as_datetime('2026-01-02 03:04:05')
+        self.assertEqual(value.utcoffset(), timedelta(0))
+
+
+class DownloadTests(TestCase):
+    """Range / conditional requests on the attachment and PDF download views."""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+
+        self.editor = User.objects.create_user('editor', password='pw', role='editor')
+        self.data = bytes(range(256)) * 40  # 10240 bytes
+        self.paper = ResearchPaper(title='Paper', slug='paper', content='x', published=True)
+        self.paper.pdf.save('paper.pdf', ContentFile(self.data))
+        self.url = reverse('paper_pdf', args=['paper'])
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_full_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(self.body(response), self.data)
+
+    def test_partial_content(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.data)}')
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(self.body(response), self.data[100:200])
+
+    def test_open_ended_and_suffix_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10000-')
+        self.assertEqual(self.body(response), self.data[10000:])
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-40')
+        self.assertEqual(response['Content-Range'], f'bytes 10200-10239/{len(self.data)}')
+        self.assertEqual(self.body(response), self.data[-40:])
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=20000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.data)}')
+
+    def test_suffix_range_of_empty_file(self):
+        paper = ResearchPaper(title='Empty', slug='empty', content='x', published=True)
+        paper.pdf.save('empty.pdf', ContentFile(b''))
+        response = self.client.get(reverse('paper_pdf', args=['empty']), HTTP_RANGE='bytes=-10')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */0')
+
+    def test_if_range(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        # stale validator: the whole (new) file is sent instead of a range
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.data)
+
+    def test_etag_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_unpublished_requires_editor(self):
+        ResearchPaper.objects.filter(pk=self.paper.pk).update(published=False)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.client.force_login(self.editor)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    @override_settings(SENDFILE_BACKEND='x-accel-redirect', SENDFILE_URL_PREFIX='/protected/')
+    def test_accel_redirect(self):
+        article = Article(title='A', slug='a', content='x', published=True)
+        article.attachment.save('notes.txt', ContentFile(b'hello'))
+        response = self.client.get(reverse('article_attachment', args=['a']))
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/' + article.attachment.name)
+        self.assertIn('attachment;', response['Content-Disposition'])
+        self.assertEqual(response.content, b'')
+
+
+class PrecompressedStaticTests(TestCase):
+    """collectstatic with the compressed manifest storage, served by PrecompressedStaticMiddleware."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        override = override_settings(
+            STATIC_ROOT=self.root,
+            SERVE_PRECOMPRESSED_STATIC=True,
+            STORAGES={
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'core.staticfiles.CompressedManifestStaticFilesStorage'},
+            },
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.name = staticfiles_storage.stored_name('core/css/style.css')
+        self.url = staticfiles_storage.url('core/css/style.css')
+
+    def test_collectstatic_writes_hashed_gzip_sibling(self):
+        self.assertRegex(self.name, r'^core/css/style\.[0-9a-f]{12}\.css$')
+        path = os.path.join(self.root, self.name)
+        with open(path, 'rb') as f, gzip.open(path + '.gz') as gz:
+            self.assertEqual(gz.read(), f.read())
+        # images are not worth compressing
+        self.assertFalse(os.path.exists(os.path.join(
+            self.root, staticfiles_storage.stored_name('core/img/placeholder.jpg') + '.gz')))
+
+    def test_serves_gzip_when_accepted(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertIn('immutable', response['Cache-Control'])
+        body = gzip.decompress(b''.join(response.streaming_content))
+        with open(os.path.join(self.root, self.name), 'rb') as f:
+            self.assertEqual(body, f.read())
+
+    def test_identity_and_etags(self):
+        plain = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        compressed = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotEqual(plain['ETag'], compressed['ETag'])
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=compressed['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_unhashed_name_gets_short_cache(self):
+        response = self.client.get('/static/core/css/style.css')
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertEqual(self.client.get('/static/../settings.py').status_code, 404)
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+
+    def setUp(self):
+        compression.reset_stats()
+        self.factory = RequestFactory()
+
+    def run_middleware(self, response, **headers):
+        request = self.factory.get('/x/', HTTP_ACCEPT_ENCODING='gzip', **headers)
+        return CompressionMiddleware(lambda r: response)(request)
+
+    def test_streaming_body_is_compressed_incrementally(self):
+        chunks = [('line %d\n' % i).encode() * 50 for i in range(20)]
+        seen = []
+
+        def body():
+            for chunk in chunks:
+                seen.append(chunk)
+                yield chunk
+
+        response = self.run_middleware(StreamingHttpResponse(body(), content_type='text/plain'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        stream = iter(response.streaming_content)
+        first = next(stream)
+        # only the first chunk has been pulled from the view so far
+        self.assertEqual(len(seen), 1)
+        out = first + b''.join(stream)
+        self.assertEqual(gzip.decompress(out), b''.join(chunks))
+
+        stats = compression.compression_stats()
+        self.assertEqual(stats[0]['encoding'], 'gzip')
+        self.assertEqual(stats[0]['bytes_in'], sum(map(len, chunks)))
+        self.assertLess(stats[0]['ratio'], 0.5)
+
+    def test_gzip_length_is_padded_against_breach(self):
+        body = b'<p>csrf and reflected query</p>' * 100
+        sizes = set()
+        for _ in range(20):
+            response = self.run_middleware(HttpResponse(body, content_type='text/html'))
+            self.assertEqual(gzip.decompress(response.content), body)
+            sizes.add(len(response.content))
+        self.assertGreater(len(sizes), 1)
+
+    def test_pages_with_a_csrf_token_are_not_sent_as_brotli(self):
+        request = self.factory.get('/x/', HTTP_ACCEPT_ENCODING='br, gzip')
+        request.META['CSRF_COOKIE_USED'] = True
+        body = b'<input name="csrfmiddlewaretoken">' * 100
+        with mock.patch.object(compression, 'supported_encodings', return_value=('br', 'gzip')):
+            response = CompressionMiddleware(lambda r: HttpResponse(body, content_type='text/html'))(request)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_skips_small_and_binary_bodies(self):
+        small = self.run_middleware(HttpResponse(b'tiny', content_type='text/html'))
+        self.assertFalse(small.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', small['Vary'])
+        image = self.run_middleware(HttpResponse(b'x' * 5000, content_type='image/jpeg'))
+        self.assertFalse(image.has_header('Content-Encoding'))
+
+    def test_compressed_variant_has_its_own_etag(self):
+        response = HttpResponse(b'<p>hello</p>' * 200, content_type='text/html')
+        response['ETag'] = '"v1"'
+        response = self.run_middleware(response)
+        self.assertEqual(response['ETag'], 'W/"v1-gzip"')
+        self.assertEqual(gzip.decompress(response.content), b'<p>hello</p>' * 200)
+
+        def view(request):
+            # the view sees its own validator
+            self.assertEqual(request.META['HTTP_IF_NONE_MATCH'], '"v1"')
+            not_modified = HttpResponse(status=304)
+            not_modified['ETag'] = '"v1"'
+            return not_modified
+
+        for sent in ('W/"v1-gzip"', '"v1-gzip"'):
+            request = self.factory.get('/x/', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=sent)
+            response = CompressionMiddleware(view)(request)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], 'W/"v1-gzip"')
+
+
+class ApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.editor = User.objects.create_user('editor', password='pw', role='editor')
+        now = timezone.now()
+        # identical dates on pairs exercise the (date, id) tie-break in the cursor
+        Article.objects.bulk_create([
+            Article(title=f'Solar {i}', slug=f'solar-{i}', content='Long body ' * 50, summary='S',
+                    author=cls.editor, published=i != 7, publish_date=now - timedelta(minutes=i // 2),
+                    tags='solar, wind')
+            for i in range(25)
+        ])
+        ResearchPaper.objects.create(title='Solar paper', slug='solar-paper', content='x',
+                                     abstract='About solar', published=True)
+
+    def test_cursor_walks_every_published_article_once(self):
+        seen = []
+        url = reverse('api_article_list') + '?limit=5'
+        while url:
+            data = self.client.get(url).json()
+            seen += [row['slug'] for row in data['results']]
+            url = data['next']
+        self.assertEqual(len(seen), 24)
+        self.assertEqual(len(set(seen)), 24)
+        self.assertNotIn('solar-7', seen)
+
+    def test_sparse_fields_do_not_select_content(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get(reverse('api_article_list'), {'fields': 'slug,title'}).json()
+        self.assertEqual(set(data['results'][0]), {'slug', 'title'})
+        self.assertFalse(any('"content"' in q['sql'] for q in ctx.captured_queries))
+
+        data = self.client.get(reverse('api_article_list'), {'fields': 'slug,content', 'limit': 1}).json()
+        self.assertIn('Long body', data['results'][0]['content'])
+        self.assertEqual(self.client.get(reverse('api_article_list'), {'fields': 'nope'}).status_code, 400)
+
+    def test_batch_fetch_by_ids_keeps_order(self):
+        ids = list(Article.objects.filter(slug__in=['solar-3', 'solar-1', 'solar-7'])
+                   .values_list('slug', 'pk'))
+        by_slug = dict(ids)
+        wanted = [by_slug['solar-3'], by_slug['solar-7'], by_slug['solar-1']]
+        data = self.client.get(reverse('api_article_list'), {'ids': ','.join(map(str, wanted))}).json()
+        # solar-7 is unpublished
+        self.assertEqual([row['slug'] for row in data['results']], ['solar-3', 'solar-1'])
+
+    def test_etag_and_not_modified(self):
+        url = reverse('api_article_detail', args=['solar-2'])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['author'], 'editor')
+        self.assertIn('content', response.json())
+        again = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(self.client.get(reverse('api_article_detail', args=['solar-7'])).status_code, 404)
+
+    def test_search_merges_kinds(self):
+        data = self.client.get(reverse('api_search'), {'q': 'solar', 'limit': 30}).json()
+        kinds = {row['kind'] for row in data['results']}
+        self.assertEqual(kinds, {'article', 'paper'})
+        self.assertIsNone(data['next'])
+        page = self.client.get(reverse('api_search'), {'q': 'solar', 'limit': 10}).json()
+        rest = self.client.get(page['next']).json()
+        self.assertFalse({r['slug'] for r in page['results']} & {r['slug'] for r in rest['results']})
+        self.assertEqual(self.client.get(reverse('api_search'), {'cursor': '!!'}).status_code, 400)
+
+    def test_cursor_with_an_impossible_date_is_a_client_error(self):
+        from .api import encode_cursor
+        response = self.client.get(reverse('api_article_list'), {'cursor': encode_cursor(['2026-13-45T10:00:00', 1])})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'invalid cursor'})
+
+
+class FeedAndSitemapTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.editor = User.objects.create_user('editor', password='pw', role='editor')
+        cls.other = User.objects.create_user('other', password='pw', role='editor')
+        now = timezone.now()
+        Article.objects.bulk_create([
+            Article(title=f'Post {i}', slug=f'post-{i}', content='x', summary=f'Summary {i}',
+                    author=cls.editor if i % 2 else cls.other, published=True,
+                    publish_date=now - timedelta(hours=i), tags='solar' if i % 2 else 'ocean')
+            for i in range(10)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_feeds_render(self):
+        rss = self.client.get(reverse('feed_rss'))
+        self.assertEqual(rss.status_code, 200)
+        self.assertContains(rss, 'Post 0')
+        atom = self.client.get(reverse('tag_feed_atom', args=['solar']))
+        self.assertIn('application/atom+xml', atom['Content-Type'])
+        self.assertContains(atom, 'Post 1')
+        self.assertNotContains(atom, 'Post 2<')
+        self.assertEqual(self.client.get(reverse('author_feed_rss', args=['nobody'])).status_code, 404)
+
+    def feed_queries(self, url):
+        # visit tracking still runs; only count queries that build a feed
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        return response, [q for q in ctx.captured_queries if 'core_article' in q['sql']]
+
+    def test_publish_rebuilds_only_affected_feeds(self):
+        urls = [reverse('feed_rss'), reverse('tag_feed_rss', args=['solar']),
+                reverse('tag_feed_rss', args=['ocean']), reverse('author_feed_rss', args=['other'])]
+        for url in urls:
+            self.client.get(url)
+        # everything is served from cache now
+        for url in urls:
+            self.assertEqual(self.feed_queries(url)[1], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Article.objects.create(title='Fresh solar', slug='fresh', content='x', author=self.editor,
+                                   published=True, tags='solar')
+
+        self.assertContains(self.client.get(urls[0]), 'Fresh solar')
+        self.assertContains(self.client.get(urls[1]), 'Fresh solar')
+        # the ocean feed and the other author's feed were not touched
+        for url in urls[2:]:
+            response, queries = self.feed_queries(url)
+            self.assertEqual(queries, [])
+            self.assertNotContains(response, 'Fresh solar')
+
+    def test_tag_spellings_share_one_scope(self):
+        Article.objects.create(title='Punk post', slug='punk', content='x', author=self.editor,
+                               published=True, tags='solarpunk')
+        url = reverse('tag_feed_rss', args=[' Solar '])
+        response, queries = self.feed_queries(url)
+        self.assertContains(response, 'articles tagged "solar"')
+        self.assertNotContains(response, 'Punk post')
+        # the whole-tag regex only runs on rows the LIKE pre-filter kept
+        sql = next(q['sql'] for q in queries if 'REGEXP' in q['sql'])
+        self.assertLess(sql.index('LIKE'), sql.index('REGEXP'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Article.objects.create(title='Fresh solar', slug='fresh', content='x', author=self.editor,
+                                   published=True, tags='solar')
+        self.assertContains(self.client.get(url), 'Fresh solar')
+        self.assertContains(self.client.get(reverse('tag_feed_rss', args=['SOLAR'])), 'Fresh solar')
+
+    def test_sitemap_index_and_streamed_shard(self):
+        index = self.client.get(reverse('sitemap_index'))
+        self.assertContains(index, '/sitemap-articles-1.xml')
+        self.assertContains(index, '/sitemap-papers-1.xml')
+
+        Article.objects.filter(slug='post-3').update(published=False)
+        original = sitemaps.WRITE_ROWS
+        sitemaps.WRITE_ROWS = 3
+        self.addCleanup(setattr, sitemaps, 'WRITE_ROWS', original)
+        response = self.client.get(reverse('sitemap_shard', args=['articles', 1]))
+        self.assertTrue(response.streaming)
+        parts = list(response.streaming_content)
+        body = b''.join(parts).decode()
+        self.assertGreater(len(parts), 3)
+        self.assertEqual(body.count('<url>'), 9)
+        self.assertIn('http://testserver/article/post-0/', body)
+        self.assertNotIn('/article/post-3/', body)
+        self.assertEqual(self.client.get('/sitemap-nope-1.xml').status_code, 404)
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('boss', 'boss@example.com', 'pw')
+        start = timezone.now().date() - timedelta(days=9)
+        Visit.objects.bulk_create([
+            Visit(session_key=f's{i}', date=start + timedelta(days=i), count=i) for i in range(10)
+        ])
+        self.start = start
+
+    def test_csv_and_ndjson_with_date_range(self):
+        export = EXPORTS['visits']
+        qs = filter_dates(export, export.queryset(), self.start + timedelta(days=2), self.start + timedelta(days=4))
+        rows = list(csv.reader(io.StringIO(''.join(stream_export(export, qs, 'csv')))))
+        self.assertEqual(rows[0], ['date', 'user', 'session_key', 'count', 'last_seen'])
+        self.assertEqual([r[2] for r in rows[1:]], ['s2', 's3', 's4'])
+
+        lines = ''.join(stream_export(export, qs, 'ndjson')).splitlines()
+        self.assertEqual([json.loads(line)['count'] for line in lines], [2, 3, 4])
+
+    def test_command_writes_to_its_stdout(self):
+        out = io.StringIO()
+        call_command('export_data', 'visits', '--format', 'ndjson', '--since', self.start.isoformat(), stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([json.loads(line)['count'] for line in lines], list(range(10)))
+
+    def test_admin_action_streams(self):
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse('admin:core_visit_changelist'), {
+            'action': 'export_visits_ndjson',
+            '_selected_action': list(Visit.objects.values_list('pk', flat=True)[:3]),
+        })
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment;', response['Content-Disposition'])
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 3)
+
+    def test_million_rows_flat_memory(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 1000000) "
+                "INSERT INTO core_visit (session_key, date, count, last_seen) "
+                "SELECT 'bulk' || i, date('2020-01-01', '+' || (i % 1000) || ' days'), i % 50, "
+                "'2020-01-01 00:00:00' FROM n"
+            )
+        export = EXPORTS['visits']
+        rows = 0
+        for n, chunk in enumerate(stream_export(export, export.queryset(), 'csv'), 1):
+            rows += chunk.count('\n')
+            if n == 50:
+                # peak RSS (KiB on Linux) once the pipeline is warmed up
+                warm = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        grown = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - warm
+        self.assertEqual(rows, 1_000_010 + 1)
+        # materializing the rows would take hundreds of MB
+        self.assertLess(grown, 32 * 1024)
+
+
+class ImportArticlesTests(TestCase):
+
+    def setUp(self):
+        self.editor = User.objects.create_user('editor', password='pw', role='editor')
+        Article.objects.create(title='Hello', slug='hello', content='x')
+        Article.objects.create(title='Hello', slug='hello-2', content='x')
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+
+    def write(self, name, records):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+        return path
+
+    def test_slug_collisions_resolved_per_batch(self):
+        path = self.write('in.jsonl', [
+            {'title': 'Hello', 'author': 'editor', 'published': True, 'tags': ['solar', 'wind']},
+            {'title': 'Hello'},
+            {'title': 'Other', 'slug': 'other', 'publish_date': '2024-05-01'},
+            {'summary': 'no title'},
+            {'title': 'Bad date', 'publish_date': '2024-02-30'},
+        ])
+        Article.objects.create(title='Hello world', slug='hello-world', content='x')
+        err = io.StringIO()
+        with CaptureQueriesContext(connection) as ctx:
+            call_command('import_articles', path, '--batch-size', '10', stdout=io.StringIO(), stderr=err)
+        self.assertIn("invalid publish_date '2024-02-30'", err.getvalue())
+        # one indexed lookup (equality and ranges on slug) for the whole batch
+        slug_queries = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT "core_article"."slug"')]
+        self.assertEqual(len(slug_queries), 1)
+        self.assertNotIn('REGEXP', slug_queries[0])
+        self.assertEqual(sum('INSERT INTO "core_article"' in q['sql'] for q in ctx.captured_queries), 1)
+
+        imported = Article.objects.filter(slug__in=['hello-3', 'hello-4', 'other'])
+        self.assertEqual(imported.count(), 3)
+        first = Article.objects.get(slug='hello-3')
+        self.assertEqual((first.author, first.tags, first.published), (self.editor, 'solar, wind', True))
+        self.assertEqual(Article.objects.get(slug='other').publish_date.date().isoformat(), '2024-05-01')
+
+    def test_resume_after_failed_batch(self):
+        path = self.write('items.jsonl', [{'title': f'Item {i}'} for i in range(10)])
+        calls = []
+
+        def flaky(cleaned, **kwargs):
+            calls.append(len(cleaned))
+            if len(calls) == 2:
+                raise RuntimeError('disk full')
+            return import_batch(cleaned, **kwargs)
+
+        out = io.StringIO()
+        with mock.patch('core.management.commands.import_articles.import_batch', flaky):
+            with self.assertRaisesMessage(Exception, 'batch starting at record 5 failed'):
+                call_command('import_articles', path, '--batch-size', '4', stdout=out, stderr=out)
+        # the first batch committed, the failed one rolled back entirely
+        self.assertEqual(Article.objects.filter(title__startswith='Item').count(), 4)
+
+        call_command('import_articles', path, '--batch-size', '4', '--resume', stdout=out, stderr=out)
+        titles = sorted(Article.objects.filter(title__startswith='Item').values_list('title', flat=True))
+        self.assertEqual(titles, sorted(f'Item {i}' for i in range(10)))
+
+    def test_keep_going_rejects_each_record_once(self):
+        path = self.write('mixed.jsonl', [{'title': 'Good one'}, {'summary': 'no title'}, {'title': 'Good two'}])
+        rejects = os.path.join(self.dir, 'rejects.jsonl')
+        out = io.StringIO()
+        with mock.patch('core.management.commands.import_articles.import_batch',
+                        side_effect=RuntimeError('disk full')):
+            call_command('import_articles', path, '--keep-going', '--rejects', rejects, stdout=out,
+                         stderr=io.StringIO())
+        self.assertIn('Imported 0 article(s), rejected 3.', out.getvalue())
+        with open(rejects) as f:
+            reasons = [json.loads(line)['error'] for line in f]
+        self.assertEqual(len(reasons), 3)
+        self.assertEqual(sum('disk full' in reason for reason in reasons), 2)
+
+
+@override_settings(ARTICLE_REVISION_SNAPSHOT_INTERVAL=5)
+class RevisionTests(TestCase):
+
+    def setUp(self):
+        self.editor = User.objects.create_user('editor', password='pw', role='editor')
+        self.versions = []
+        lines = [f'Paragraph {i} about solar power and storage.\n' for i in range(40)]
+        self.article = Article.objects.create(title='History', slug='history', content=''.join(lines))
+        self.versions.append(self.article.content)
+        for i in range(11):
+            lines[(i * 7) % len(lines)] = f'Edited paragraph {i}.\n'
+            if i % 3 == 0:
+                lines.insert(i, f'Inserted {i}.\n')
+            self.article.content = ''.join(lines)
+            self.article.save()
+            self.versions.append(self.article.content)
+
+    def test_every_version_rebuilds_from_a_bounded_chain(self):
+        revs = list(ArticleRevision.objects.filter(article=self.article).order_by('number'))
+        self.assertEqual(len(revs), 12)
+        self.assertEqual([r.number for r in revs if r.is_snapshot], [1, 6, 11])
+        for number, expected in enumerate(self.versions, 1):
+            with self.assertNumQueries(1):
+                self.assertEqual(revisions.rebuild(self.article.pk, number), expected)
+        full = sum(len(v.encode()) for v in self.versions)
+        self.assertLess(sum(len(bytes(r.data)) for r in revs), full / 4)
+
+    def test_unchanged_save_adds_nothing(self):
+        self.article.published = True
+        with CaptureQueriesContext(connection) as ctx:
+            self.article.save()
+        self.assertEqual(ArticleRevision.objects.filter(article=self.article).count(), 12)
+        # no rebuild of the delta chain for a publish toggle
+        self.assertFalse(any('core_articlerevision' in q['sql'] for q in ctx.captured_queries))
+        # files, feeds and revisions share one read of the previous row
+        reads = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT')
+                 and 'FROM "core_article" WHERE' in q['sql']]
+        self.assertEqual(len(reads), 1)
+
+    def test_row_and_revision_commit_together(self):
+        self.article.content = 'Not saved'
+        with mock.patch('core.revisions.record_revision', side_effect=RuntimeError('disk full')):
+            with self.assertRaises(RuntimeError):
+                self.article.save()
+        self.assertEqual(Article.objects.get(pk=self.article.pk).content, self.versions[-1])
+
+    def test_diff_defaults_to_the_previous_kept_revision(self):
+        revisions.prune(self.article.pk, keep=4)
+        self.client.force_login(self.editor)
+        response = self.client.get(reverse('article_revision_diff', args=['history', 10]))
+        self.assertEqual(response.context['against'], 9)
+        response = self.client.get(reverse('article_revision_diff', args=['history', 9]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['against'], 0)
+
+    def test_diff_view(self):
+        url = reverse('article_revision_diff', args=['history', 3])
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.editor)
+        response = self.client.get(url)
+        self.assertContains(response, 'diff-add')
+        self.assertContains(response, 'Edited paragraph 1.')
+        self.assertContains(self.client.get(reverse('article_revisions', args=['history'])), 'r12')
+
+    def test_prune_keeps_remaining_versions_rebuildable(self):
+        deleted = revisions.prune(self.article.pk, keep=4)
+        self.assertEqual(deleted, 8)
+        remaining = ArticleRevision.objects.filter(article=self.article).order_by('number')
+        self.assertEqual([r.number for r in remaining], [9, 10, 11, 12])
+        self.assertTrue(remaining[0].is_snapshot)
+        for number in (9, 10, 11, 12):
+            self.assertEqual(revisions.rebuild(self.article.pk, number), self.versions[number - 1])
+
+
+class AdminScalingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('boss', 'boss@example.com', 'pw')
+        cls.editor = User.objects.create_user('editor', password='pw', role='editor')
+        now = timezone.now()
+        Article.objects.bulk_create([
+            Article(title=f'Wind farm {i}' if i % 2 else f'Coral reef {i}', slug=f'a-{i}', content='Body ' * 200,
+                    author=cls.editor, published=False, publish_date=now - timedelta(days=i),
+                    tags='wind' if i % 2 else 'ocean')
+            for i in range(30)
+        ])
+        today = now.date()
+        Visit.objects.bulk_create(
+            [Visit(session_key=f's{i}', date=today - timedelta(days=i % 3), count=2) for i in range(12)] +
+            [Visit(user=cls.editor, date=today, count=5)]
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_changelist_avoids_full_count_and_content(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('admin:core_article_changelist'))
+        self.assertEqual(response.status_code, 200)
+        article_sql = [q['sql'] for q in ctx.captured_queries if 'core_article' in q['sql']]
+        self.assertFalse(any(sql.startswith('SELECT COUNT(*) AS "__count" FROM "core_article"')
+                             for sql in article_sql))
+        self.assertFalse(any('"core_article"."content"' in sql for sql in article_sql))
+        # the change form still loads the full row
+        article = Article.objects.get(slug='a-1')
+        self.assertContains(self.client.get(reverse('admin:core_article_change', args=[article.pk])), 'Body Body')
+
+    def test_search_uses_full_text_index(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('admin:core_article_changelist'), {'q': 'reef'})
+        self.assertContains(response, 'Coral reef 2')
+        self.assertNotContains(response, 'Wind farm 1<')
+        self.assertTrue(any('MATCH' in q['sql'] for q in ctx.captured_queries))
+
+    def test_bulk_publish_single_update_and_one_invalidation(self):
+        ids = list(Article.objects.values_list('pk', flat=True)[:20])
+        with mock.patch('core.feeds.invalidate_article_feeds') as invalidate, \
+                CaptureQueriesContext(connection) as ctx:
+            self.client.post(reverse('admin:core_article_changelist'),
+                             {'action': 'publish_selected', '_selected_action': ids})
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "core_article"')]
+        self.assertEqual(len(updates), 1)
+        invalidate.assert_called_once()
+        self.assertEqual(Article.objects.filter(published=True).count(), 20)
+
+    def test_visit_rollups(self):
+        self.assertEqual(rollup_visits(timezone.now().date() - timedelta(days=5)), 3)
+        today = VisitDailyRollup.objects.get(date=timezone.now().date())
+        self.assertEqual((today.visits, today.visitors, today.users), (4 * 2 + 5, 5, 1))
+        response = self.client.get(reverse('admin:core_visitdailyrollup_changelist'))
+        self.assertContains(response, 'view visits')
+        response = self.client.get(reverse('admin:core_visit_changelist'),
+                                   {'date_day': timezone.now().date().isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['cl'].result_list), 5)
+
+    def test_date_range_filter(self):
+        today = timezone.now().date()
+        url = reverse('admin:core_article_changelist')
+        response = self.client.get(url, {'publish_date_from': (today - timedelta(days=9)).isoformat(),
+                                         'publish_date_to': (today - timedelta(days=5)).isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 5)
+        self.assertContains(response, 'name="publish_date_from"')
+        # open-ended, on a DateField; the form keeps the ordering
+        response = self.client.get(reverse('admin:core_visit_changelist'),
+                                   {'date_from': (today - timedelta(days=1)).isoformat(), 'o': '-1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 9)
+        self.assertContains(response, '<input type="hidden" name="o" value="-1">')
+        # an impossible date is ignored, not a 500
+        response = self.client.get(url, {'publish_date_to': '2024-02-30'})
+        self.assertEqual(response.context['cl'].result_count, 30)
+
+    def test_export_respects_date_range(self):
+        today = timezone.now().date()
+        changelist = reverse('admin:core_article_changelist')
+        query = urlencode({'publish_date_from': (today - timedelta(days=2)).isoformat()})
+        response = self.client.post(f'{changelist}?{query}', {
+            'action': 'export_articles_ndjson', 'select_across': '1', 'index': '0',
+            '_selected_action': list(Article.objects.values_list('pk', flat=True)[:1])})
+        rows = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(rows), 3)
+
+    def test_capped_count_keeps_later_pages(self):
+        url = reverse('admin:core_article_changelist')
+        with mock.patch('core.admin.COUNT_CAP', 5), mock.patch('core.admin.COUNT_PAGES_AHEAD', 1), \
+                mock.patch.object(ArticleAdmin, 'list_per_page', 2):
+            response = self.client.get(url, {'published__exact': '0'})
+            self.assertTrue(response.context['cl'].paginator.capped)
+            self.assertContains(response, '5+ articles')
+            # far past the cap: still served, and the count moves along
+            response = self.client.get(url, {'published__exact': '0', 'p': '9'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.context['cl'].result_list), 2)
+            self.assertContains(response, '20+ articles')
+            response = self.client.get(url, {'published__exact': '0', 'p': '14'})
+            self.assertFalse(response.context['cl'].paginator.capped)
+            self.assertContains(response, '30 articles')
+
+
+class BenchTests(TestCase):
+    """Benchmark tooling: the seeder and the report maths (no server needed)."""
+
+    def test_seed_bench_data_small_volumes(self):
+        out = io.StringIO()
+        call_command('seed_bench_data', articles=30, authors=5, papers=3, visits=200, days=10, stdout=out)
+        self.assertEqual(User.objects.filter(username__startswith='bench_user_').count(), 5)
+        self.assertEqual(Article.objects.filter(slug__startswith='bench-').count(), 30)
+        self.assertEqual(ResearchPaper.objects.filter(slug__startswith='bench-').count(), 3)
+        # 40 user rows (5 users x 8 days) plus 160 anonymous sessions
+        self.assertEqual(Visit.objects.count(), 200)
+        self.assertEqual(Visit.objects.filter(user__isnull=False).count(), 40)
+        # rerunning tops up instead of duplicating; --clear removes everything
+        call_command('seed_bench_data', articles=40, authors=5, papers=3, visits=0, stdout=out)
+        self.assertEqual(Article.objects.filter(slug__startswith='bench-').count(), 40)
+        call_command('seed_bench_data', articles=0, authors=0, papers=0, visits=0, clear=True, stdout=out)
+        self.assertFalse(Article.objects.filter(slug__startswith='bench-').exists())
+        self.assertFalse(Visit.objects.exists())
+
+    def test_seed_visits_uses_the_given_user_ids(self):
+        # ids with gaps, as after earlier runs deleted some users
+        users = [User.objects.create_user(f'gap{i}') for i in range(5)]
+        author_ids = [users[0].pk, users[2].pk, users[4].pk]
+        bench.seed_visits(60, author_ids, random.Random(1), days=10)
+        self.assertEqual(set(Visit.objects.filter(user__isnull=False).values_list('user_id', flat=True)),
+                         set(author_ids))
+        self.assertEqual(Visit.objects.filter(user__isnull=False).count(), 12)
+
+    def test_percentiles_and_regression_check(self):
+        values = [i / 1000 for i in range(1, 101)]
+        self.assertEqual(bench.percentile(values, 50), 0.05)
+        self.assertEqual(bench.percentile(values, 99), 0.099)
+        self.assertIsNone(bench.percentile([], 95))
+        summary = bench.summarize(values, errors=2, elapsed=2.0)
+        self.assertEqual((summary['requests'], summary['p95_ms'], summary['throughput_rps']), (102, 95.0, 50.0))
+        baseline = {'scenarios': {'index': dict(summary)}}
+        slower = {'scenarios': {'index': dict(summary, p95_ms=120.0)}}
+        self.assertEqual(bench.compare(slower, baseline, 10.0)[0].split(':')[0], 'index')
+        self.assertEqual(bench.compare(baseline, baseline, 10.0), [])
+        ratios = bench.compare_servers({'wsgi': baseline, 'asgi': {'scenarios': {
+            'index': dict(summary, throughput_rps=100.0, p95_ms=47.5)}}})
+        self.assertEqual(ratios['index'], {'throughput_ratio': 2.0, 'p95_ratio': 0.5})
+
+
+@override_settings(PROFILER_ENABLED=True, PROFILER_SAMPLE_RATE=0.0, PROFILER_INTERVAL=0.001)
+class ProfilingTests(TestCase):
+    def setUp(self):
+        profiling.reset()
+        self.staff = User.objects.create_user('prof', password='pw', is_staff=True)
+        self.reader = User.objects.create_user('plain', password='pw')
+
+    def test_sampler_records_stacks_below_entry_frame(self):
+        def busy_view():
+            deadline = time.monotonic() + 0.05
+            while time.monotonic() < deadline:
+                pass
+
+        profiling.start(sys._getframe())
+        busy_view()
+        samples = profiling.stop('busy')
+        self.assertGreater(samples, 0)
+        folded = profiling.collapsed('busy')
+        self.assertIn('busy_view_(core/tests.py:', folded)
+        self.assertNotIn('test_sampler_records_stacks', folded)
+        data = json.loads(profiling.speedscope('busy'))
+        self.assertEqual(data['profiles'][0]['type'], 'sampled')
+        self.assertEqual(len(data['profiles'][0]['samples']), len(data['profiles'][0]['weights']))
+
+    def test_header_only_honoured_for_staff(self):
+        self.client.login(username='plain', password='pw')
+        self.assertNotIn('X-Profile-Samples', self.client.get('/', HTTP_X_PROFILE='1'))
+        self.client.login(username='prof', password='pw')
+        self.assertIn('X-Profile-Samples', self.client.get('/', HTTP_X_PROFILE='1'))
+        self.assertEqual(profiling.profile_summary()[0]['view'], 'index')
+
+    def test_profiling_page_is_staff_only_and_downloads(self):
+        self.client.login(username='plain', password='pw')
+        self.assertEqual(self.client.get(reverse('profiling')).status_code, 403)
+        self.client.login(username='prof', password='pw')
+        self.client.get('/', HTTP_X_PROFILE='1')
+        self.assertContains(self.client.get(reverse('profiling')), 'index')
+        response = self.client.get(reverse('profiling'), {'format': 'speedscope', 'view': 'index'})
+        self.assertIn('profile-index.speedscope.json', response['Content-Disposition'])
+        response = self.client.get(reverse('profiling'), {'format': 'collapsed'})
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        self.client.post(reverse('profiling'))
+        self.assertEqual(profiling.profile_summary(), [])
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        for metric in metrics.REGISTRY.values():
+            metric.reset()
+
+    def test_histogram_exposition(self):
+        latency = metrics.Histogram('test_latency_seconds', 'Test.', ('route',), buckets=(0.1, 1.0))
+        self.addCleanup(metrics.REGISTRY.pop, 'test_latency_seconds')
+        for value in (0.05, 0.5, 0.5, 3.0):
+            latency.observe(value, route='a"b')
+        text = metrics.render_text()
+        self.assertIn('# TYPE test_latency_seconds histogram', text)
+        self.assertIn('test_latency_seconds_bucket{route="a\\"b",le="0.1"} 1', text)
+        self.assertIn('test_latency_seconds_bucket{route="a\\"b",le="1.0"} 3', text)
+        self.assertIn('test_latency_seconds_bucket{route="a\\"b",le="+Inf"} 4', text)
+        self.assertIn('test_latency_seconds_count{route="a\\"b"} 4', text)
+        with self.assertRaises(ValueError):
+            latency.observe(1.0)
+
+    def test_endpoint_reports_requests_and_visit_writes(self):
+        self.client.get('/')
+        self.client.get(reverse('track_visit'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        text = response.content.decode()
+        self.assertIn('http_requests_total{route="index",method="GET",status="200"} 1', text)
+        self.assertIn('visit_writes_total{source="track_visit"} 1', text)
+        self.assertIn('visit_writes_total{source="middleware"} 1', text)
+        # the page view stored last_visit_time; the poll left the session alone
+        self.assertIn('session_writes_total 1', text)
+        self.assertIn('http_request_db_seconds_count{route="index"} 1', text)
+        # from elsewhere it needs a staff login
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.9').status_code, 403)
+
+    def test_cache_lookups_are_counted(self):
+        cache.clear()
+        trending.top()
+        trending.top()
+        self.assertEqual(metrics.CACHE_REQUESTS.value(cache='trending', result='miss'), 1)
+        self.assertEqual(metrics.CACHE_REQUESTS.value(cache='trending', result='hit'), 1)
+
+        with mock.patch.object(loadshed, 'shedding', return_value=True):
+            loadshed.stale('counted', lambda: 1, 'test')
+        self.assertEqual(metrics.CACHE_REQUESTS.value(cache='loadshed', result='miss'), 1)
+
+        suggest.reset()
+        self.addCleanup(suggest.reset)
+        suggest.content_changed(1)
+        suggest.get_index()
+        self.assertTrue(metrics.CACHE_REQUESTS.value(cache='suggest_version', result='hit'))
+        self.assertIsNone(metrics.CACHE_REQUESTS.value(cache='suggest_changes', result='hit'))
+        suggest.content_changed(2)
+        suggest.get_index()
+        self.assertEqual(metrics.CACHE_REQUESTS.value(cache='suggest_changes', result='hit'), 1)
+
+    def test_processes_aggregate_through_files(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        # a worker that has exited: its counters survive, its gauges do not
+        dead = os.fork()
+        if dead == 0:
+            os._exit(0)
+        os.waitpid(dead, 0)
+        with open(os.path.join(directory, f'metrics-{dead}-abc.json'), 'w') as f:
+            json.dump({'visit_writes_total': [[['middleware'], 5]],
+                       'http_requests_in_progress': [[[], 3]]}, f)
+        with override_settings(METRICS_DIR=directory):
+            metrics.VISIT_WRITES.inc(2, source='middleware')
+            metrics.IN_FLIGHT.set(1)
+            values = metrics.collect()
+            self.assertEqual(values['visit_writes_total'][('middleware',)], 7)
+            self.assertEqual(values['http_requests_in_progress'][()], 1)
+            self.assertFalse(os.path.exists(os.path.join(directory, f'metrics-{dead}-abc.json')))
+            # the archive keeps counting after compaction
+            self.assertEqual(metrics.collect()['visit_writes_total'][('middleware',)], 7)
+
+
+class AsyncUrls:
+    """ASYNC_VIEWS=True routing, without reloading core.urls."""
+    urlpatterns = [
+        path('', async_views.IndexView.as_view(), name='index'),
+        path('article/<slug:slug>/', async_views.ArticleDetailView.as_view(), name='article_detail'),
+        path('search/', async_views.search_view, name='search'),
+        path('track-visit/', async_views.track_visit, name='track_visit'),
+        path('', include('Eco.urls')),
+    ]
+
+
+@override_settings(ROOT_URLCONF=AsyncUrls)
+class AsyncViewTests(TestCase):
+    """The async views run through the async middleware chain (AsyncClient)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('writer', password='pw')
+        now = timezone.now()
+        for i in range(8):
+            Article.objects.create(title=f'Tidal power {i}', slug=f'tidal-{i}', content='waves',
+                                   summary='Energy from tides', published=True, tags='ocean, energy',
+                                   publish_date=now - timedelta(hours=i), author=cls.author)
+
+    def setUp(self):
+        self.client = AsyncClient()
+
+    async def test_index_paginates_and_counts_the_visit(self):
+        response = await self.client.get('/')
+        self.assertContains(response, 'Tidal power 0')
+        self.assertContains(response, 'writer')
+        self.assertEqual(response.context['paginator'].num_pages, 2)
+        # filled in by aprepare() for the sync context processors
+        self.assertIn('ocean', response.context['filter_tags'])
+        self.assertEqual((await self.client.get('/', {'page': 'last'})).context['page_obj'].number, 2)
+        self.assertEqual((await self.client.get('/', {'page': 9})).status_code, 404)
+        self.assertEqual(await Visit.objects.acount(), 1)
+
+    async def test_detail_tracks_recent_articles(self):
+        await self.client.aforce_login(self.author)
+        response = await self.client.get('/article/tidal-3/')
+        self.assertContains(response, 'Tidal power 3')
+        await self.client.get('/article/tidal-5/')
+        session = await self.client.asession()
+        self.assertEqual(len(await session.aget('recent_articles')), 2)
+        self.assertEqual((await self.client.get('/article/missing/')).status_code, 404)
+
+    async def test_track_visit_and_search(self):
+        first = json.loads((await self.client.get('/track-visit/')).content)
+        second = json.loads((await self.client.get('/track-visit/')).content)
+        self.assertEqual(second['user_today'], first['user_today'] + 1)
+        response = await self.client.get('/search/', {'q': 'tidal'})
+        self.assertContains(response, 'Tidal power 7')
+
+
+@override_settings(RATELIMITS={'search': [{'key': 'ip', 'rate': 1, 'burst': 3}],
+                               'track_visit': [{'key': 'session', 'rate': 1, 'burst': 2},
+                                               {'key': 'ip', 'rate': 1, 'burst': 3}]})
+class RateLimitTests(TestCase):
+
+    def setUp(self):
+        ratelimit.reset()
+        self.addCleanup(ratelimit.reset)
+        metrics.RATELIMIT_DENIED.reset()
+
+    def test_search_gets_429_after_burst_and_refills(self):
+        with mock.patch('core.ratelimit.time.time', return_value=1000.0):
+            statuses = [self.client.get(reverse('search'), {'q': 'x'}).status_code for _ in range(4)]
+            self.assertEqual(statuses, [200, 200, 200, 429])
+            response = self.client.get(reverse('api_search'), {'q': 'x'})
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response['Retry-After'], '1')
+            self.assertEqual(response.json()['error'], 'rate limited')
+            # other clients have their own bucket
+            self.assertEqual(self.client.get(reverse('search'), REMOTE_ADDR='10.1.1.1').status_code, 200)
+        with mock.patch('core.ratelimit.time.time', return_value=1001.5):
+            self.assertEqual(self.client.get(reverse('search')).status_code, 200)
+        self.assertEqual(metrics.RATELIMIT_DENIED.value(rule='search'), 2)
+
+    def test_new_sessions_share_the_address_bucket(self):
+        with mock.patch('core.ratelimit.time.time', return_value=1000.0):
+            statuses = [self.client.get(reverse('track_visit')).status_code for _ in range(4)]
+            # the first poll has no session yet; the next two use the new session's bucket
+            self.assertEqual(statuses, [200, 200, 200, 429])
+            # dropping the cookie gets a fresh session bucket, not a fresh address bucket
+            self.client.cookies.clear()
+            self.assertEqual(self.client.get(reverse('track_visit')).status_code, 429)
+
+    @override_settings(RATELIMIT_BACKEND='cache')
+    def test_cache_backend(self):
+        ratelimit.reset()
+        cache.clear()
+        statuses = [self.client.get(reverse('search')).status_code for _ in range(4)]
+        self.assertEqual(statuses[-1], 429)
+
+    @override_settings(RATELIMIT_TRUSTED_PROXIES=1)
+    def test_forwarded_address_behind_proxy(self):
+        request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='1.2.3.4, 5.6.7.8', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(ratelimit.client_ip(request), '5.6.7.8')
+
+
+class LoadShedTests(TestCase):
+
+    def setUp(self):
+        loadshed.reset()
+        self.addCleanup(loadshed.reset)
+        cache.clear()
+        ratelimit.reset()
+        metrics.LOADSHED_TRANSITIONS.reset()
+        metrics.LOADSHED_SKIPPED.reset()
+
+    def feed(self, controller, latency, start, count, step=0.1):
+        for i in range(count):
+            controller.started()
+            controller.finished(latency, now=start + i * step)
+
+    def test_sheds_on_slow_requests_and_recovers_after_calm_period(self):
+        controller = loadshed.controller
+        with self.assertLogs('core.loadshed', 'WARNING') as logs:
+            self.feed(controller, 2.0, start=0.0, count=40)
+        self.assertTrue(loadshed.shedding())
+        self.assertIn('load shedding started', logs.output[0])
+        self.assertEqual(metrics.LOADSHED_ACTIVE.value(), 1)
+
+        # fast again, but not yet for LOADSHED_RECOVERY_SECONDS
+        self.feed(controller, 0.01, start=100.0, count=50, step=0.5)
+        self.assertTrue(loadshed.shedding())
+        with self.assertLogs('core.loadshed', 'INFO') as logs:
+            self.feed(controller, 0.01, start=130.0, count=10, step=0.5)
+        self.assertFalse(loadshed.shedding())
+        self.assertIn('load shedding stopped', logs.output[0])
+        self.assertEqual(metrics.LOADSHED_ACTIVE.value(), 0)
+        self.assertEqual(metrics.LOADSHED_TRANSITIONS.value(state='shedding'), 1)
+        self.assertEqual(metrics.LOADSHED_TRANSITIONS.value(state='normal'), 1)
+
+    def test_sheds_on_queue_depth(self):
+        controller = loadshed.controller
+        for _ in range(40):
+            controller.started()
+        with self.assertLogs('core.loadshed', 'WARNING'):
+            controller.finished(0.01, now=5.0)
+        self.assertTrue(loadshed.shedding())
+
+    @override_settings(LOADSHED_ENABLED=False)
+    def test_disabled(self):
+        self.feed(loadshed.controller, 2.0, start=0.0, count=40)
+        self.assertFalse(loadshed.shedding())
+
+    def test_skips_visits_and_serves_stale_counters(self):
+        Visit.objects.create(session_key='a', date=timezone.now().date(), count=5)
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['total_visits_today'], 5)
+        filters = response.context['filter_tags']
+        with override_settings(LOADSHED_FORCE=True):
+            Visit.objects.create(session_key='b', date=timezone.now().date(), count=7)
+            Article.objects.create(title='New', slug='new', content='x', tags='fresh',
+                                   author=User.objects.create_user('w', password='pw'), published=True)
+            self.client.cookies.clear()
+            response = self.client.get(reverse('index'))
+        # the stale total, no visit counted for the new client, the old tag list
+        self.assertEqual(response.context['total_visits_today'], 5)
+        self.assertEqual(Visit.objects.count(), 3)
+        self.assertEqual(response.context['filter_tags'], filters)
+        self.assertEqual(metrics.LOADSHED_SKIPPED.value(feature='visit_tracking'), 1)
+
+        cache.clear()
+        with override_settings(LOADSHED_FORCE=True):
+            response = self.client.get(reverse('index'))
+        self.assertIsNone(response.context['total_visits_today'])
+        self.assertContains(response, '<div class="stat-value" id="total-visits">—</div>', html=True)
+        self.assertEqual(response.context['filter_authors'], [])
+
+    @override_settings(LOADSHED_STALE_TIMEOUT=100)
+    def test_stale_value_is_rewritten_only_when_old(self):
+        counter = iter(range(100))
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set, \
+                mock.patch.object(loadshed, 'time') as clock:
+            clock.time.return_value = 1000.0
+            for _ in range(3):
+                loadshed.stale('counter', lambda: next(counter), 'test')
+            self.assertEqual(cache_set.call_count, 1)
+            clock.time.return_value = 1011.0
+            self.assertEqual(loadshed.stale('counter', lambda: next(counter), 'test'), 3)
+            self.assertEqual(cache_set.call_count, 2)
+        with override_settings(LOADSHED_FORCE=True):
+            self.assertEqual(loadshed.stale('counter', lambda: next(counter), 'test'), 3)
+
+    @override_settings(RATELIMITS={'track_visit': [{'key': 'session', 'rate': 10, 'burst': 10}],
+                                   'track_visit:shedding': [{'key': 'session', 'rate': 0.1, 'burst': 1}]})
+    def test_track_visit_is_throttled_harder_while_shedding(self):
+        statuses = [self.client.get(reverse('track_visit')).status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 200])
+        with override_settings(LOADSHED_FORCE=True):
+            statuses = [self.client.get(reverse('track_visit')).status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 429, 429])
+
+
+RAN = []
+
+
+@tasks.task(name='tests.record', lane='low')
+def record_task(value):
+    RAN.append(value)
+
+
+@tasks.task(name='tests.explode', max_attempts=2)
+def explode_task():
+    raise RuntimeError('boom')
+
+
+class TaskQueueTests(TestCase):
+
+    def setUp(self):
+        RAN.clear()
+
+    def test_contact_form_only_queues_the_email(self):
+        response = self.client.post(reverse('contact'), {
+            'name': 'Ann', 'email': 'ann@example.com', 'subject': 'Hello', 'message': 'Hi there'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(mail.outbox), 0)
+        job = Task.objects.get()
+        self.assertEqual((job.name, job.lane), ('core.send_email', 'high'))
+
+        self.assertEqual(tasks.run_batch('w1'), (1, 0))
+        self.assertEqual(mail.outbox[0].subject, '[Contact] Hello')
+        self.assertEqual(mail.outbox[0].reply_to, ['ann@example.com'])
+        self.assertFalse(Task.objects.exists())
+
+    def test_password_reset_email_is_queued(self):
+        User.objects.create_user('reader', email='reader@example.com', password='pw')
+        self.client.post(reverse('password_reset'), {'email': 'reader@example.com'})
+        self.assertEqual(len(mail.outbox), 0)
+        call_command('run_tasks', '--once', stdout=io.StringIO())
+        self.assertEqual(mail.outbox[0].to, ['reader@example.com'])
+        self.assertIn('/reset/', mail.outbox[0].body)
+
+    def test_lanes_in_priority_order(self):
+        record_task.delay(value='low')
+        tasks.enqueue('tests.record', {'value': 'default'}, lane='default')
+        tasks.enqueue('tests.record', {'value': 'high'}, lane='high')
+        tasks.enqueue('tests.record', {'value': 'later'}, lane='high', delay=60)
+        self.assertEqual(tasks.run_batch('w1', batch=2), (2, 0))
+        self.assertEqual(RAN, ['high', 'default'])
+        self.assertEqual(tasks.run_batch('w1', lane_names=['high']), (0, 0))
+        self.assertEqual(tasks.run_batch('w1'), (1, 0))
+        self.assertEqual(RAN, ['high', 'default', 'low'])
+
+    def test_claims_skip_taken_jobs_and_expired_leases_return(self):
+        for i in range(5):
+            record_task.delay(value=i)
+        first = tasks.claim('w1', batch=3)
+        second = tasks.claim('w2', batch=3)
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 2)
+        self.assertFalse({j.pk for j in first} & {j.pk for j in second})
+        self.assertEqual(tasks.claim('w3'), [])
+
+        # w1 died: its jobs come back once the lease is over
+        later = timezone.now() + timedelta(seconds=301)
+        reclaimed = tasks.claim('w3', batch=10, now=later)
+        self.assertEqual({j.pk for j in reclaimed}, {j.pk for j in first + second})
+        self.assertTrue(all(j.attempts == 2 for j in reclaimed))
+
+        # a worker that read the ids just before another claimed them gets nothing
+        job = Task.objects.create(name='tests.record', payload={'value': 9}, lane='low')
+        real_claimable = tasks._claimable
+        calls = []
+
+        def claimable(now):
+            calls.append(now)
+            if len(calls) == 2:  # between reading the ids and the UPDATE
+                Task.objects.filter(pk=job.pk).update(status=Task.RUNNING, claimed_by='other', locked_until=later)
+            return real_claimable(now)
+
+        with mock.patch.object(tasks, '_claimable', claimable):
+            self.assertEqual(tasks.claim('w4', lane_names=['low']), [])
+        self.assertEqual(Task.objects.get(pk=job.pk).claimed_by, 'other')
+
+    def test_retries_with_backoff_then_dead_letters(self):
+        tasks.enqueue('tests.explode')
+        with self.assertLogs('core.tasks', 'WARNING'):
+            self.assertEqual(tasks.run_batch('w1'), (0, 1))
+        job = Task.objects.get()
+        self.assertEqual((job.status, job.attempts), (Task.QUEUED, 1))
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=4))
+        self.assertIn('RuntimeError: boom', job.last_error)
+        self.assertEqual(tasks.run_batch('w1'), (0, 0))
+
+        Task.objects.update(run_at=timezone.now())
+        with self.assertLogs('core.tasks', 'ERROR'):
+            tasks.run_batch('w1')
+        self.assertFalse(Task.objects.exists())
+        dead = DeadTask.objects.get()
+        self.assertEqual((dead.name, dead.attempts), ('tests.explode', 2))
+
+        self.assertEqual(tasks.requeue(DeadTask.objects.all()), 1)
+        self.assertEqual(Task.objects.get().name, 'tests.explode')
+        self.assertFalse(DeadTask.objects.exists())
+
+    def test_backoff_grows_and_is_capped(self):
+        with override_settings(TASK_RETRY_BASE=10, TASK_RETRY_MAX=60):
+            self.assertTrue(5 <= tasks.backoff(1) <= 10)
+            self.assertTrue(20 <= tasks.backoff(3) <= 40)
+            self.assertTrue(30 <= tasks.backoff(10) <= 60)
+
+    @override_settings(TASKS_EAGER=True)
+    def test_eager_mode_runs_at_once(self):
+        self.assertIsNone(record_task.delay(value='now'))
+        self.assertEqual(RAN, ['now'])
+        self.assertFalse(Task.objects.exists())
+
+
+class TrendingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('writer', password='pw')
+        cls.old, cls.new, cls.draft = [
+            Article.objects.create(title=title, slug=title.lower(), content='x', author=author, published=published)
+            for title, published in (('Old', True), ('New', True), ('Draft', False))]
+
+    def setUp(self):
+        trending.reset()
+        self.addCleanup(trending.reset)
+        cache.clear()
+
+    @override_settings(TRENDING_HALF_LIFE=3600)
+    def test_scores_decay_incrementally(self):
+        start = 1_800_000_000.0
+        trending.add_views({self.old.pk: 8, self.draft.pk: 50}, now=start)
+        trending.add_views({self.new.pk: 3}, now=start + 3600)
+        trending.add_views({self.old.pk: 1}, now=start + 7200)
+        stats = ArticleStats.objects.get(pk=self.old.pk)
+        # 8 views two half-lives ago count as 2, plus the new one
+        self.assertEqual(stats.views, 9)
+        self.assertAlmostEqual(stats.score, 3.0)
+        self.assertAlmostEqual(trending.current_score(stats.rank, now=start + 10800), 1.5)
+        new = ArticleStats.objects.get(pk=self.new.pk)
+        self.assertAlmostEqual(trending.current_score(new.rank, now=start + 10800), 0.75)
+
+        trending.refresh_top()
+        self.assertEqual(list(TrendingArticle.objects.values_list('article_id', flat=True)),
+                         [self.old.pk, self.new.pk])
+
+    def test_detail_views_are_buffered_then_flushed(self):
+        self.client.get(reverse('article_detail', args=['new']))
+        self.client.get(reverse('article_detail', args=['new']))
+        self.client.get(reverse('article_detail', args=['old']))
+        self.assertFalse(ArticleStats.objects.exists())
+        self.assertEqual(trending.top(), [])
+
+        self.assertEqual(trending.flush(), 3)
+        self.assertEqual(ArticleStats.objects.get(pk=self.new.pk).views, 2)
+        response = self.client.get(reverse('index'))
+        self.assertEqual([row['slug'] for row in response.context['trending']], ['new', 'old'])
+        self.assertContains(response, '<h3>Trending</h3>', html=True)
+        with self.assertNumQueries(0):
+            trending.top()
+
+        data = self.client.get(reverse('api_trending')).json()['results']
+        self.assertEqual(data[0]['url'], reverse('article_detail', args=['new']))
+        self.assertEqual(data[0]['views'], 2)
+
+    def test_exit_flush_only_into_the_counting_database(self):
+        trending.record_view(self.old.pk)
+        with mock.patch.dict(connection.settings_dict, {'NAME': 'db.sqlite3'}):
+            # the test database is gone: the views are dropped, not written elsewhere
+            trending._flush_at_exit()
+        self.assertFalse(ArticleStats.objects.exists())
+        trending._flush_at_exit()
+        self.assertEqual(ArticleStats.objects.get(pk=self.old.pk).views, 1)
+
+    @override_settings(TRENDING_FLUSH_INTERVAL=0, ROOT_URLCONF=AsyncUrls)
+    async def test_async_detail_counts_views(self):
+        await AsyncClient().get('/article/old/')
+        stats = await ArticleStats.objects.aget(pk=self.old.pk)
+        self.assertEqual(stats.views, 1)
+        self.assertEqual([row['slug'] for row in await trending.atop()], ['old'])
+
+
+class RelatedArticleTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('writer', password='pw')
+        texts = {
+            'solar-roofs': ('Solar roofs', 'solar, energy', 'Rooftop solar panels cut household bills.'),
+            'solar-farms': ('Solar farms', 'solar', 'Utility solar panels cover old farmland.'),
+            'solar-storage': ('Storing solar power', 'solar, batteries', 'Batteries keep solar panels useful at night.'),
+            'wind-offshore': ('Offshore wind', 'wind', 'Offshore wind turbines grow taller every year.'),
+            'wind-repowering': ('Repowering wind farms', 'wind', 'Old wind turbines get new blades.'),
+            'draft': ('Solar draft', 'solar', 'Unpublished solar panels.'),
+        }
+        cls.articles = {}
+        for slug, (title, tags, content) in texts.items():
+            cls.articles[slug] = Article.objects.create(
+                title=title, slug=slug, tags=tags, content=content, author=cls.author, published=slug != 'draft')
+
+    def neighbours(self, slug):
+        return list(RelatedArticle.objects.filter(article__slug=slug)
+                    .order_by('position').values_list('related__slug', flat=True))
+
+    def test_build_and_detail_page(self):
+        self.assertEqual(related.build(), 5)
+        self.assertEqual(set(self.neighbours('solar-roofs')[:2]), {'solar-farms', 'solar-storage'})
+        self.assertEqual(self.neighbours('wind-offshore')[0], 'wind-repowering')
+        self.assertNotIn('draft', RelatedArticle.objects.values_list('related__slug', flat=True))
+        self.assertEqual(TermDocFreq.objects.get(term='solar').docs, 3)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('article_detail', args=['wind-offshore']))
+        self.assertContains(response, 'Related reading')
+        self.assertEqual(response.context['related_articles'][0].slug, 'wind-repowering')
+        self.assertEqual(sum('core_relatedarticle' in q['sql'] for q in queries.captured_queries), 1)
+
+    @override_settings(TASKS_EAGER=True)
+    def test_incremental_updates_match_a_rebuild(self):
+        related.build()
+        with self.captureOnCommitCallbacks(execute=True):
+            Article.objects.create(title='Solar balconies', slug='solar-balconies', tags='solar',
+                                   content='Plug-in solar panels for flats.', author=self.author, published=True)
+        self.assertIn('solar-balconies', self.neighbours('solar-farms')[:3])
+        self.assertIn(self.neighbours('solar-balconies')[0], ('solar-farms', 'solar-roofs', 'solar-storage'))
+
+        # edited into a wind piece: moves from the solar lists to the wind ones
+        article = Article.objects.get(slug='solar-balconies')
+        article.title, article.tags, article.content = 'Small wind', 'wind', 'Wind turbines for rooftops.'
+        with self.captureOnCommitCallbacks(execute=True):
+            article.save()
+        self.assertEqual(self.neighbours('solar-balconies')[0][:4], 'wind')
+        self.assertNotIn('solar-balconies', self.neighbours('solar-farms')[:2])
+        self.assertEqual(self.neighbours('wind-offshore')[:2].count('solar-balconies'), 1)
+        incremental = dict(TermDocFreq.objects.values_list('term', 'docs'))
+        vector = ArticleVector.objects.get(pk=article.pk).counts
+        related.build()
+        self.assertEqual(dict(TermDocFreq.objects.values_list('term', 'docs')), incremental)
+        self.assertEqual(ArticleVector.objects.get(pk=article.pk).counts, vector)
+
+        # unpublished, then deleted: gone from every list and from the counts
+        article.published = False
+        with self.captureOnCommitCallbacks(execute=True):
+            article.save()
+        self.assertFalse(RelatedArticle.objects.filter(related=article).exists())
+        self.assertFalse(ArticleVector.objects.filter(pk=article.pk).exists())
+        self.assertEqual(TermDocFreq.objects.get(term='wind').docs, 2)
+        self.articles['wind-offshore'].delete()
+        self.assertEqual(TermDocFreq.objects.get(term='wind').docs, 1)
+
+    @override_settings(RELATED_MAX_DOCS=2)
+    def test_terms_in_too_many_articles_are_left_out(self):
+        related.build()
+        # 'solar' is in three articles: counted, but in no vector or posting
+        self.assertEqual(TermDocFreq.objects.get(term='solar').docs, 3)
+        self.assertFalse(ArticleTerm.objects.filter(term='solar').exists())
+        self.assertTrue(ArticleTerm.objects.filter(term='wind').exists())
+        self.assertEqual(self.neighbours('wind-offshore')[0], 'wind-repowering')
+
+    def test_update_reads_only_articles_sharing_a_term(self):
+        related.build()
+        article = self.articles['wind-offshore']
+        article.content = 'Offshore wind turbines and their blades.'
+        article.save()
+        with CaptureQueriesContext(connection) as queries:
+            related.update_article(article.pk)
+        vector_reads = [q['sql'] for q in queries.captured_queries
+                        if q['sql'].startswith('SELECT') and '"core_articlevector"."vector"' in q['sql']]
+        self.assertTrue(all('WHERE' in sql for sql in vector_reads))
+        self.assertEqual(dict(ArticleTerm.objects.filter(vector_id=article.pk).values_list('term', 'weight')),
+                         ArticleVector.objects.get(pk=article.pk).vector)
+        self.assertEqual(self.neighbours('wind-offshore')[0], 'wind-repowering')
+
+    @override_settings(TASKS_EAGER=True)
+    def test_bulk_publishing_queues_updates(self):
+        related.build()
+        admin_user = User.objects.create_superuser('boss', 'boss@example.com', 'pw')
+        self.client.force_login(admin_user)
+        draft = self.articles['draft']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('admin:core_article_changelist'),
+                             {'action': 'publish_selected', '_selected_action': [draft.pk]})
+        self.assertIn('draft', self.neighbours('solar-farms'))
+
+        record = clean_record({'title': 'Offshore wind turbines', 'tags': 'wind', 'published': True,
+                               'content': 'Wind turbines offshore.'})
+        with self.captureOnCommitCallbacks(execute=True):
+            import_batch([record], default_author=self.author)
+        self.assertEqual(self.neighbours('offshore-wind-turbines')[0], 'wind-offshore')
+
+    def test_tokenize_folds_plurals_and_drops_stop_words(self):
+        self.assertEqual(list(related.tokenize('The turbines and a Turbine, with glass')),
+                         ['turbine', 'turbine', 'glass'])
+
+
+class SuggestTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.writer = User.objects.create_user('writer', password='pw')
+        cls.solaris = User.objects.create_user('solaris', password='pw')
+        cls.roofs = Article.objects.create(title='Solar roofs', slug='solar-roofs', tags='Solar, energy',
+                                           content='x', author=cls.writer, published=True)
+        cls.storage = Article.objects.create(title='Storing solar power', slug='solar-storage', tags='solar',
+                                             content='x', author=cls.solaris, published=True)
+        Article.objects.create(title='Solar draft', slug='solar-draft', tags='solar', content='x',
+                               author=cls.writer, published=False)
+        ArticleStats.objects.create(article=cls.roofs, views=5, score=5, decayed_at=0, rank=0)
+        ArticleStats.objects.create(article=cls.storage, views=40, score=40, decayed_at=0, rank=0)
+
+    def setUp(self):
+        suggest.reset()
+        self.addCleanup(suggest.reset)
+        ratelimit.reset()
+        self.addCleanup(ratelimit.reset)
+        cache.clear()
+
+    def labels(self, q):
+        return [(s['kind'], s['label']) for s in suggest.suggest(q)]
+
+    def test_prefixes_of_titles_tags_and_authors_ranked_by_views(self):
+        self.assertEqual(self.labels('sol'), [
+            # the tag and the author add up their articles' views (+1 per article)
+            ('tag', 'Solar'), ('author', 'solaris'), ('article', 'Storing solar power'), ('article', 'Solar roofs'),
+        ])
+        # words inside a title match, unpublished articles don't
+        self.assertEqual(self.labels('solar p'), [('article', 'Storing solar power')])
+        self.assertEqual(self.labels('ENERGY'), [('tag', 'energy')])
+        self.assertEqual(self.labels('wri'), [('author', 'writer')])
+        self.assertEqual(self.labels('zzz'), [])
+        self.assertEqual(suggest.suggest('sol', limit=1)[0]['url'], reverse('search') + '?tag=Solar')
+
+    def test_endpoint(self):
+        response = self.client.get(reverse('search_suggest'), {'q': 'stor'})
+        self.assertEqual(response.json(), {'query': 'stor', 'suggestions': [
+            {'kind': 'article', 'label': 'Storing solar power', 'url': reverse('article_detail', args=['solar-storage'])},
+        ]})
+        self.assertEqual(self.client.get(reverse('search_suggest')).json()['suggestions'], [])
+
+    def test_lookups_do_not_query_and_follow_content_changes(self):
+        self.labels('sol')
+        with self.assertNumQueries(0):
+            self.labels('solar r')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Article.objects.create(title='Solar balconies', slug='solar-balconies', tags='balcony',
+                                   content='x', author=self.writer, published=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.roofs.title = 'Green roofs'
+            self.roofs.save()
+        # only the changed articles are read again
+        with self.assertNumQueries(1):
+            self.assertIn(('article', 'Solar balconies'), self.labels('so'))
+        self.assertNotIn(('article', 'Solar roofs'), self.labels('sol'))
+        self.assertEqual(self.labels('roo'), [('article', 'Green roofs')])
+        self.assertEqual(self.labels('bal'), [('tag', 'balcony'), ('article', 'Solar balconies')])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.storage.delete()
+        self.assertEqual(self.labels('solari'), [])
+        self.assertEqual(self.labels('stor'), [])
+
+    def test_incremental_updates_match_a_rebuild(self):
+        self.labels('a')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.storage.tags = 'batteries'
+            self.storage.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            Article.objects.filter(slug='solar-draft').get().save()
+        index = suggest.get_index()
+        incremental = (list(index.keys), dict(index.entries))
+        suggest.reset()
+        index = suggest.get_index()
+        self.assertEqual((index.keys, index.entries), incremental)
+
+    def test_catching_up_reads_outside_the_lock(self):
+        self.labels('sol')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.roofs.title = 'Green roofs'
+            self.roofs.save()
+        held = []
+        original = suggest._rows
+
+        def rows(ids=None):
+            held.append(suggest._lock.locked())
+            return original(ids)
+
+        with mock.patch.object(suggest, '_rows', rows):
+            self.assertEqual(self.labels('gree'), [('article', 'Green roofs')])
+        self.assertEqual(held, [False])
+
+    def test_lookup_is_well_under_a_millisecond(self):
+        rows = [(pk, f'article-{pk}', f'Article number {pk} about solar {pk % 97}', f'tag{pk % 50}',
+                 f'user{pk % 30}', pk % 1000) for pk in range(1, 5001)]
+        index = suggest.PrefixIndex()
+        index.build(rows, 0)
+        # distinct prefixes, so none is answered from the memo
+        queries = [f'{word[:n]}' for word in ('solar', 'article', 'number', 'about', 'tag', 'user')
+                   for n in range(1, len(word) + 1)] + [f'solar {n}' for n in range(97)]
+        started = time.perf_counter()
+        for q in queries:
+            self.assertTrue(index.search(q, 8))
+        self.assertLess((time.perf_counter() - started) / len(queries), 0.001)
+        # the broad prefixes were ranked at build time
+        self.assertIn('solar', index.top)
+        self.assertNotIn('solar 96', index.top)
+
+    def test_short_prefixes_rank_every_match(self):
+        rows = [(pk, f'a-{pk}', f'Aardvark {pk:04d}', '', '', 1) for pk in range(1, suggest.RANGE_LIMIT * 2)]
+        rows.append((9999, 'azure', 'Azure skies', '', '', 1000))
+        index = suggest.PrefixIndex()
+        index.build(rows, 0)
+        # the popular match sorts after a thousand others
+        self.assertEqual(index.search('a', 8)[0]['label'], 'Azure skies')
+        # changes drop the lists they affect
+        index.apply({7777: (7777, 'abyss', 'Abyss', '', '', 5000)}, {7777}, 1)
+        self.assertEqual([r['label'] for r in index.search('a', 2)], ['Abyss', 'Azure skies'])
+        index.apply({}, {9999}, 2)
+        self.assertEqual([r['label'] for r in index.search('a', 2)], ['Abyss', 'Aardvark 0001'])
+        rebuilt = suggest.PrefixIndex()
+        rebuilt.build(list(index.articles.values()), 2)
+        self.assertEqual(index.search('aa', 8), rebuilt.search('aa', 8))
+
+    def test_rebuilds_happen_off_the_request(self):
+        self.labels('sol')
+        Article.objects.create(title='Solar kites', slug='solar-kites', tags='', content='x',
+                               author=self.writer, published=True)
+        with mock.patch('core.suggest.threading.Thread') as thread, override_settings(SUGGEST_MAX_AGE=0):
+            with self.assertNumQueries(0):
+                # the old index answers while a new one is built
+                self.assertEqual(self.labels('solar k'), [])
+                self.labels('solar k')
+        thread.assert_called_once_with(target=suggest._rebuild_in_thread, name='suggest-rebuild', daemon=True)
+        thread.return_value.start.assert_called_once_with()
+        suggest._rebuild()
+        self.assertEqual(self.labels('solar k'), [('article', 'Solar kites')])
+
+
+def image_bytes(fmt, size=(800, 400), mode='RGB'):
+    from PIL import Image
+    out = io.BytesIO()
+    Image.new(mode, size, (30, 120, 60, 128)[:len(mode)]).save(out, fmt)
+    return out.getvalue()
+
+
+@override_settings(IMAGE_VARIANTS_ASYNC=False, COVER_IMAGE_WIDTHS=(320, 640, 1280))
+class CoverVariantTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+
+    def article(self, name, data, slug='a'):
+        article = Article(title='A', slug=slug, content='x', published=True)
+        article.cover_image.save(name, ContentFile(data))
+        article.refresh_from_db()
+        return article
+
+    def test_variants_are_built_on_save(self):
+        article = self.article('cover.jpg', image_bytes('JPEG'))
+        variants = article.cover_variants
+        self.assertEqual(variants['source'], article.cover_image.name)
+        # never upscaled: the 800px original gives 320, 640 and itself
+        self.assertEqual(sorted(variants['widths'], key=int), ['320', '640', '800'])
+        for width in variants['widths'].values():
+            self.assertTrue(width['webp'].endswith('.webp'))
+            self.assertTrue(width['fallback'].endswith('.jpg'))
+            self.assertTrue(os.path.exists(os.path.join(self.media, width['fallback'])))
+
+    def test_transparent_images_fall_back_to_png(self):
+        article = self.article('logo.png', image_bytes('PNG', mode='RGBA'))
+        self.assertTrue(all(w['fallback'].endswith('.png') for w in article.cover_variants['widths'].values()))
+
+    def test_sources_differing_in_extension_get_their_own_variants(self):
+        from .images import build_variants
+        os.makedirs(os.path.join(self.media, 'legacy'))
+        for name, fmt in (('x.jpeg', 'JPEG'), ('x.png', 'PNG')):
+            with open(os.path.join(self.media, 'legacy', name), 'wb') as f:
+                f.write(image_bytes(fmt))
+        jpeg = build_variants(self.media, 'legacy/x.jpeg', (320,))
+        png = build_variants(self.media, 'legacy/x.png', (320,))
+        self.assertNotEqual(jpeg['widths']['320']['webp'], png['widths']['320']['webp'])
+
+    def test_cover_picture_tag(self):
+        from django.template import Context, Template
+        template = Template('{% load cover_images %}{% cover_picture article "thumb" %}')
+        article = self.article('cover.jpg', image_bytes('JPEG'))
+        html = template.render(Context({'article': article}))
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn(' 640w', html)
+        # until the variants exist the original is shown
+        article.cover_variants = {}
+        html = template.render(Context({'article': article}))
+        self.assertEqual(html, f'<img src="{article.cover_image.url}" class="thumb" alt="" loading="lazy">')
+
+    def test_backfill_command(self):
+        article = self.article('cover.jpg', image_bytes('JPEG'))
+        Article.objects.filter(pk=article.pk).update(cover_variants={})
+        out = io.StringIO()
+        call_command('generate_cover_variants', workers=1, stdout=out)
+        self.assertIn('Built variants for 1 article(s), 0 failed.', out.getvalue())
+        article.refresh_from_db()
+        self.assertEqual(article.cover_variants['source'], article.cover_image.name)
+
+    def test_migrations_match_the_models(self):
+        from django.db.migrations.loader import MigrationLoader
+        state = MigrationLoader(None, ignore_no_migrations=True).project_state(('core', '0006_article_cover_variants'))
+        field = state.models['core', 'article'].fields['cover_variants']
+        self.assertEqual((field.default, field.blank, field.editable), (dict, True, False))
+        # and no model change is missing a migration
+        call_command('makemigrations', 'core', check=True, dry_run=True, stdout=io.StringIO())
+
+
+class ContentAddressedStorageTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        override = override_settings(MEDIA_ROOT=self.media, IMAGE_VARIANTS_ASYNC=False)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+
+    def refs(self, name):
+        return StoredBlob.objects.filter(name=name).values_list('refs', flat=True).first()
+
+    def paper(self, slug, data=None, name=None):
+        paper = ResearchPaper(title=slug, slug=slug, content='x', published=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            if data is not None:
+                paper.pdf.save('paper.pdf', ContentFile(data))
+            else:
+                paper.pdf = name
+                paper.save()
+        return paper
+
+    def test_identical_uploads_share_one_blob(self):
+        a = self.paper('a', b'%PDF same bytes')
+        b = self.paper('b', b'%PDF same bytes')
+        self.assertEqual(a.pdf.name, b.pdf.name)
+        self.assertTrue(a.pdf.name.startswith('blobs/'))
+        self.assertEqual(self.refs(a.pdf.name), 2)
+        self.assertEqual(StoredBlob.objects.count(), 1)
+
+    def test_replace_and_delete_release_references(self):
+        a = self.paper('a', b'%PDF one')
+        b = self.paper('b', b'%PDF one')
+        shared = a.pdf.name
+        with self.captureOnCommitCallbacks(execute=True):
+            a.pdf.save('new.pdf', ContentFile(b'%PDF two'))
+        self.assertEqual(self.refs(shared), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            a.delete()
+            b.delete()
+        self.assertIsNone(self.refs(shared))
+        self.assertFalse(StoredBlob.objects.exists())
+        self.assertFalse(os.path.exists(os.path.join(self.media, shared)))
+
+    def test_uploading_the_same_content_again_keeps_one_reference(self):
+        a = self.paper('a', b'%PDF one')
+        with self.captureOnCommitCallbacks(execute=True):
+            a.pdf.save('again.pdf', ContentFile(b'%PDF one'))
+        self.assertEqual(self.refs(a.pdf.name), 1)
+
+    def test_assigning_an_existing_name_takes_a_reference(self):
+        a = self.paper('a', b'%PDF one')
+        b = self.paper('b', name=a.pdf.name)
+        self.assertEqual(self.refs(a.pdf.name), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            a.delete()
+        # still there for b
+        self.assertTrue(os.path.exists(b.pdf.path))
+
+    def test_rollback_keeps_counts(self):
+        a = self.paper('a', b'%PDF one')
+        b = self.paper('b', b'%PDF other')
+        try:
+            with transaction.atomic():
+                with self.captureOnCommitCallbacks(execute=True):
+                    a.pdf = b.pdf.name
+                    a.save()
+                    raise RuntimeError
+        except RuntimeError:
+            pass
+        a.refresh_from_db()
+        self.assertEqual((self.refs(a.pdf.name), self.refs(b.pdf.name)), (1, 1))
+
+    def test_recount_repairs_update_and_bulk_create(self):
+        a = self.paper('a', b'%PDF one')
+        ResearchPaper.objects.bulk_create([ResearchPaper(title='c', slug='c', content='x', pdf=a.pdf.name)])
+        self.assertEqual(self.refs(a.pdf.name), 1)
+        out = io.StringIO()
+        call_command('recount_blobs', stdout=out)
+        self.assertIn('Corrected 1 reference count(s).', out.getvalue())
+        self.assertEqual(self.refs(a.pdf.name), 2)
+
+    def test_cover_variants_go_with_the_last_reference(self):
+        article = Article(title='A', slug='a', content='x', published=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            article.cover_image.save('cover.jpg', ContentFile(image_bytes('JPEG')))
+        article.refresh_from_db()
+        variant = os.path.join(self.media, article.cover_variants['widths']['320']['webp'])
+        self.assertTrue(os.path.exists(variant))
+        with self.captureOnCommitCallbacks(execute=True):
+            article.delete()
+        self.assertFalse(os.path.exists(variant))
+
+
+class ChunkedUploadTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        override = override_settings(MEDIA_ROOT=self.media, CHUNKED_UPLOAD_DIR=os.path.join(self.media, 'parts'),
+                                     CHUNKED_UPLOAD_MAX_CHUNK=1024)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        self.editor = User.objects.create_user('editor', password='pw', role='editor')
+        self.client.force_login(self.editor)
+        self.data = b'%PDF-1.4 ' + bytes(range(256)) * 8
+
+    def init(self, data=None, **extra):
+        data = self.data if data is None else data
+        fields = {'filename': 'big.pdf', 'size': len(data), 'sha256': hashlib.sha256(data).hexdigest()}
+        fields.update(extra)
+        return self.client.post(reverse('paper_upload_init'), fields)
+
+    def put(self, state, offset, chunk):
+        return self.client.put(state['chunk_url'] + f'?offset={offset}', data=chunk,
+                               content_type='application/octet-stream', CONTENT_LENGTH=str(len(chunk)))
+
+    def send_all(self, state, data=None):
+        data = self.data if data is None else data
+        for offset in range(0, len(data), 1000):
+            response = self.put(state, offset, data[offset:offset + 1000])
+            self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def finalize(self, state, **fields):
+        fields = fields or {'title': 'Big paper', 'slug': 'big-paper', 'content': 'x', 'published': 'on'}
+        return self.client.post(state['finalize_url'], fields)
+
+    def test_init_requires_an_editor_and_valid_fields(self):
+        self.assertEqual(self.init(sha256='nope').status_code, 400)
+        self.assertEqual(self.init(size=0).status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.init().status_code, 403)
+
+    def test_full_upload_and_finalize(self):
+        state = self.init().json()
+        self.assertEqual(state['offset'], 0)
+        self.assertTrue(self.send_all(state).json()['complete'])
+        response = self.finalize(state)
+        self.assertEqual(response.status_code, 201)
+        paper = ResearchPaper.objects.get(slug='big-paper')
+        self.assertEqual(paper.uploaded_by, self.editor)
+        with paper.pdf.open('rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertFalse(ChunkedUpload.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.media, 'parts')), [])
+
+    def test_out_of_order_and_resumed_chunks(self):
+        state = self.init().json()
+        self.put(state, 0, self.data[:1000])
+        response = self.put(state, 2000, self.data[2000:2048])
+        self.assertEqual((response.status_code, response.json()['offset']), (409, 1000))
+        # after a dropped connection the client asks where to go on
+        offset = self.client.get(reverse('paper_upload_status', args=[state['upload_id']])).json()['offset']
+        self.assertEqual(offset, 1000)
+        for start in range(offset, len(self.data), 1000):
+            self.assertEqual(self.put(state, start, self.data[start:start + 1000]).status_code, 200)
+        self.assertEqual(self.finalize(state).status_code, 201)
+
+    def test_bad_chunks(self):
+        state = self.init().json()
+        response = self.put(state, 0, b'')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('empty chunk', response.json()['error'])
+        self.assertEqual(self.put(state, 0, b'x' * 2000).status_code, 413)
+        self.assertEqual(self.put(state, 2000, self.data[2000:]).status_code, 409)
+
+    def test_checksum_mismatch_and_incomplete_upload(self):
+        state = self.init(sha256='0' * 64).json()
+        self.assertEqual(self.finalize(state).status_code, 409)
+        self.send_all(state)
+        response = self.finalize(state)
+        self.assertEqual((response.status_code, response.json()['error']), (422, 'checksum mismatch'))
+        self.assertFalse(ResearchPaper.objects.exists())
+
+    def test_replacing_a_pdf_needs_ownership(self):
+        other = User.objects.create_user('other', password='pw', role='editor')
+        mine = ResearchPaper.objects.create(title='Mine', slug='mine', content='x', uploaded_by=self.editor)
+        ResearchPaper.objects.create(title='Theirs', slug='theirs', content='x', uploaded_by=other)
+        state = self.init().json()
+        self.send_all(state)
+        self.assertEqual(self.finalize(state, paper='theirs').status_code, 403)
+        self.assertEqual(self.finalize(state, paper='mine').status_code, 201)
+        mine.refresh_from_db()
+        self.assertTrue(mine.pdf.name.startswith('blobs/'))
+
+    def test_uploads_belong_to_their_user(self):
+        state = self.init().json()
+        other = User.objects.create_user('other', password='pw', role='editor')
+        self.client.force_login(other)
+        self.assertEqual(self.put(state, 0, self.data[:10]).status_code, 404)
+
+    def test_cleanup_uploads(self):
+        stale = ChunkedUpload.objects.get(pk=self.init().json()['upload_id'])
+        fresh = ChunkedUpload.objects.get(pk=self.init().json()['upload_id'])
+        for upload in (stale, fresh):
+            self.put({'chunk_url': reverse('paper_upload_chunk', args=[upload.pk])}, 0, self.data[:10])
+        ChunkedUpload.objects.filter(pk=stale.pk).update(updated_at=timezone.now() - timedelta(days=2))
+        orphan = os.path.join(self.media, 'parts', 'orphan.part')
+        open(orphan, 'wb').close()
+        out = io.StringIO()
+        call_command('cleanup_uploads', stdout=out)
+        self.assertIn('Removed 1 abandoned upload(s).', out.getvalue())
+        self.assertEqual(list(ChunkedUpload.objects.values_list('pk', flat=True)), [fresh.pk])
+        self.assertEqual(os.listdir(os.path.join(self.media, 'parts')), [f'{fresh.pk}.part'])
+
+
+def make_pdf(*contents, compress=False):
+    """A minimal one-page-per-content PDF with a valid xref table."""
+    import zlib
+    n = len(contents)
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>',
+               b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+                   b' '.join(b'%d 0 R' % (4 + 2 * i) for i in range(n)), n),
+               b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    for i, content in enumerate(contents):
+        objects.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+                       b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>' % (5 + 2 * i))
+        data = zlib.compress(content) if compress else content
+        extra = b' /Filter /FlateDecode' if compress else b''
+        objects.append(b'<< /Length %d%s >>\nstream\n%s\nendstream' % (len(data), extra, data))
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    out += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+@mock.patch.object(pdftext, 'PdfReader', None)
+class PaperTextTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+
+    def write(self, data, name='paper.pdf'):
+        path = os.path.join(self.media, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_uncompressed_text_operators(self):
+        path = self.write(make_pdf(
+            b'BT /F1 12 Tf 72 700 Td (Solar \\(rooftop\\) panels) Tj T* (caf\\351 line) Tj ET',
+            b'BT /F1 12 Tf 72 700 Td (Second page) Tj ET'))
+        self.assertEqual(pdftext.extract_text(path), 'Solar (rooftop) panels\ncafé line\nSecond page')
+
+    def test_compressed_streams_and_kerning(self):
+        path = self.write(make_pdf(b'BT /F1 12 Tf [(Off)20(shore)-400(wind)] TJ ET', compress=True))
+        self.assertEqual(pdftext.extract_text(path), 'Offshore wind')
+        self.assertEqual(pdftext.extract_text(path, max_chars=3), 'Off')
+
+    def test_unreadable_streams_are_skipped(self):
+        data = make_pdf(b'BT (Readable) Tj ET', compress=True).replace(b'/FlateDecode', b'/DCTDecode')
+        self.assertEqual(pdftext.extract_text(self.write(data)), '')
+        broken = make_pdf(b'BT (x) Tj ET').replace(b'/Length', b'/Filter /FlateDecode /Length')
+        self.assertEqual(pdftext.extract_text(self.write(broken, 'broken.pdf')), '')
+
+    def test_worker_hashes_skips_and_reports_errors(self):
+        data = make_pdf(b'BT (Hello) Tj ET')
+        path = self.write(data)
+        digest = hashlib.sha256(data).hexdigest()
+        self.assertEqual(pdftext.extract_worker(path), (digest, 'Hello', ''))
+        self.assertEqual(pdftext.extract_worker(path, known_hash=digest), (digest, None, ''))
+        digest, text, error = pdftext.extract_worker(os.path.join(self.media, 'missing.pdf'))
+        self.assertEqual((digest, text), (None, None))
+        self.assertTrue(error.startswith('FileNotFoundError'))
+
+    def test_extract_command_indexes_and_skips_unchanged(self):
+        from .search import PAPER_INDEX, search_papers
+        paper = ResearchPaper(title='Study', slug='study', content='x', published=True)
+        paper.pdf.save('study.pdf', ContentFile(make_pdf(b'BT (Perovskite cells) Tj ET', compress=True)))
+        gone = ResearchPaper(title='Gone', slug='gone', content='x', published=True)
+        gone.pdf.save('gone.pdf', ContentFile(make_pdf(b'BT (Missing) Tj ET')))
+        os.unlink(gone.pdf.path)
+
+        out, err = io.StringIO(), io.StringIO()
+        call_command('extract_paper_text', workers=1, stdout=out, stderr=err)
+        self.assertIn('Extracted 1, unchanged 0, failed 1', out.getvalue())
+        self.assertIn('gone: FileNotFoundError', err.getvalue())
+        self.assertEqual(PaperText.objects.get(paper=paper).text, 'Perovskite cells')
+        self.assertTrue(PaperText.objects.get(paper=gone).error)
+        if PAPER_INDEX.available():
+            self.assertEqual(search_papers('perovskite'), [(paper.pk, mock.ANY)])
+
+        out = io.StringIO()
+        call_command('extract_paper_text', workers=1, stdout=out, stderr=io.StringIO())
+        self.assertIn('Extracted 0, unchanged 1', out.getvalue())
+
+        # a title edit rewrites the FTS row from the stored text
+        ResearchPaper.objects.filter(pk=paper.pk).update(title='Tandem study')
+        out = io.StringIO()
+        call_command('extract_paper_text', workers=1, stdout=out, stderr=io.StringIO())
+        self.assertIn('re-indexed 1', out.getvalue())
+        if PAPER_INDEX.available():
+            self.assertEqual([pk for pk, _ in search_papers('tandem perovskite')], [paper.pk])
@@ -0,0 +1,246 @@
+# core/trending.py
+"""
+Trending articles: per-article view counts whose weight decays over time.
+
+ArticleDetailView calls record_view(). Views are added up in memory and
+written at most every TRENDING_FLUSH_INTERVAL seconds (and at exit), one
+UPDATE per article viewed since the last flush. A view's weight halves
+every TRENDING_HALF_LIFE seconds; ArticleStats holds each article's score as
+of `decayed_at`, and a flush moves it forward in SQL:
+
+    score = score * exp(-k * (now - decayed_at)) + new views,  k = ln 2 / half-life
+
+so workers flushing at the same time don't lose views and the history is
+never rescanned. Scores decayed to different moments can't be compared, so
+rows also store rank = ln(score) + k * decayed_at: that is ln of the score
+at any common time plus the same constant for every row, so ordering by the
+(indexed) rank is ordering by current score.
+
+After a flush the top TRENDING_SIZE published articles are copied into
+TrendingArticle; the "Trending" block on the index and /api/trending/ read
+that table through the cache (TRENDING_CACHE_TIMEOUT seconds).
+"""
+import atexit
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.db.models.functions import Exp, Ln
+
+from . import metrics
+from .models import Article, ArticleStats, TrendingArticle
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = 'trending:top'
+# flush early when this many different articles are waiting
+MAX_PENDING = 1000
+
+_lock = threading.Lock()
+_pending = Counter()
+# 'database': where the pending views were counted (see _flush_at_exit)
+_state = {'last': time.monotonic(), 'database': None}
+
+
+def half_life():
+    return float(getattr(settings, 'TRENDING_HALF_LIFE', 12 * 3600))
+
+
+def decay_rate():
+    return math.log(2) / half_life()
+
+
+def size():
+    return getattr(settings, 'TRENDING_SIZE', 10)
+
+
+def current_score(rank, now=None):
+    """The score a row with `rank` has at `now` (unix time)."""
+    now = time.time() if now is None else now
+    return math.exp(rank - decay_rate() * now)
+
+
+# ---------------------------------------------------------------------------
+# Counting
+# ---------------------------------------------------------------------------
+
+def _due():
+    interval = getattr(settings, 'TRENDING_FLUSH_INTERVAL', 10.0)
+    with _lock:
+        return _pending and (time.monotonic() - _state['last'] >= interval or len(_pending) >= MAX_PENDING)
+
+
+def _count(article_id):
+    with _lock:
+        if not _pending:
+            _state['database'] = connection.settings_dict['NAME']
+        _pending[article_id] += 1
+
+
+def record_view(article_id):
+    """Count one view of `article_id`; writes the buffered views when they are due."""
+    _count(article_id)
+    if _due():
+        flush()
+
+
+async def arecord_view(article_id):
+    _count(article_id)
+    if _due():
+        await sync_to_async(flush)()
+
+
+def _after_fork():
+    global _lock
+    _lock = threading.Lock()
+    # the parent writes its own views
+    _pending.clear()
+    _state['last'] = time.monotonic()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def flush(now=None):
+    """Write the buffered views and refresh the top table. Returns the number of views written."""
+    with _lock:
+        batch = dict(_pending)
+        _pending.clear()
+        _state['last'] = time.monotonic()
+    if not batch:
+        return 0
+    try:
+        add_views(batch, now)
+        refresh_top()
+    except Exception:
+        # keep the views for the next flush; never break the request
+        logger.exception('could not write %d article view(s)', sum(batch.values()))
+        with _lock:
+            _pending.update(batch)
+        return 0
+    return sum(batch.values())
+
+
+def _flush_at_exit():
+    # only into the database the views were counted in: once a test run
+    # has dropped its database the connection points at the real one again
+    if _pending and _state['database'] == connection.settings_dict['NAME']:
+        flush()
+
+
+atexit.register(_flush_at_exit)
+
+
+def add_views(counts, now=None):
+    """Add {article id: views} at time `now`, decaying the existing scores."""
+    now = time.time() if now is None else now
+    k = decay_rate()
+    decayed = F('score') * Exp((F('decayed_at') - now) * k)
+    with transaction.atomic():
+        for article_id, views in counts.items():
+            updated = ArticleStats.objects.filter(article_id=article_id).update(
+                views=F('views') + views,
+                score=decayed + views,
+                rank=Ln(decayed + views) + k * now,
+                decayed_at=now,
+            )
+            if updated:
+                continue
+            try:
+                with transaction.atomic():
+                    ArticleStats.objects.create(article_id=article_id, views=views, score=views,
+                                                decayed_at=now, rank=math.log(views) + k * now)
+            except IntegrityError:
+                # another worker created the row meanwhile, or the article is gone
+                ArticleStats.objects.filter(article_id=article_id).update(
+                    views=F('views') + views, score=decayed + views,
+                    rank=Ln(decayed + views) + k * now, decayed_at=now)
+
+
+def refresh_top():
+    """Rewrite TrendingArticle from the highest ranks, walking the rank index."""
+    wanted = size()
+    step = wanted * 2
+    top, offset = [], 0
+    # no join here: it would make the planner sort every published article
+    while len(top) < wanted:
+        chunk = list(ArticleStats.objects.order_by('-rank').values_list('article_id', 'rank')[offset:offset + step])
+        if not chunk:
+            break
+        published = set(Article.objects.filter(pk__in=[pk for pk, _ in chunk], published=True)
+                         .values_list('pk', flat=True))
+        top += [(pk, rank) for pk, rank in chunk if pk in published]
+        offset += step
+    top = top[:wanted]
+    with transaction.atomic():
+        TrendingArticle.objects.all().delete()
+        TrendingArticle.objects.bulk_create([
+            TrendingArticle(position=position, article_id=article_id, rank=rank)
+            for position, (article_id, rank) in enumerate(top, start=1)
+        ])
+    cache.delete(CACHE_KEY)
+
+
+# ---------------------------------------------------------------------------
+# Reading
+# ---------------------------------------------------------------------------
+
+FIELDS = ('article_id', 'article__slug', 'article__title', 'article__publish_date',
+          'article__stats__views', 'rank')
+
+
+def _row(values, now):
+    return {
+        'id': values['article_id'],
+        'slug': values['article__slug'],
+        'title': values['article__title'],
+        'publish_date': values['article__publish_date'],
+        'views': values['article__stats__views'] or 0,
+        'score': round(current_score(values['rank'], now), 2),
+    }
+
+
+def _queryset():
+    # unpublished since the last refresh: leave out
+    return TrendingArticle.objects.filter(article__published=True).values(*FIELDS)
+
+
+def _timeout():
+    return getattr(settings, 'TRENDING_CACHE_TIMEOUT', 60)
+
+
+def top():
+    """The trending articles as dicts (id, slug, title, publish_date, views, score), cached."""
+    rows = cache.get(CACHE_KEY)
+    metrics.CACHE_REQUESTS.inc(cache='trending', result='miss' if rows is None else 'hit')
+    if rows is None:
+        now = time.time()
+        rows = [_row(values, now) for values in _queryset()]
+        cache.set(CACHE_KEY, rows, _timeout())
+    return rows
+
+
+async def atop():
+    rows = await cache.aget(CACHE_KEY)
+    metrics.CACHE_REQUESTS.inc(cache='trending', result='miss' if rows is None else 'hit')
+    if rows is None:
+        now = time.time()
+        rows = [_row(values, now) async for values in _queryset()]
+        await cache.aset(CACHE_KEY, rows, _timeout())
+    return rows
+
+
+def reset():
+    """Drop the buffered views (tests)."""
+    with _lock:
+        _pending.clear()
+        _state['last'] = time.monotonic()
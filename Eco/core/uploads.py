@@ -0,0 +1,141 @@
+# core/uploads.py
+"""
+Chunked, resumable uploads for large research-paper PDFs.
+
+Protocol (see the upload views in core/views.py):
+  1. init      POST   /paper/upload/                      filename, size, sha256
+  2. chunk     PUT    /paper/upload/<id>/chunk/?offset=N   raw bytes (repeat)
+     status    GET    /paper/upload/<id>/                  -> current offset, to resume
+  3. finalize  POST   /paper/upload/<id>/finalize/         paper fields (or paper=<slug>)
+
+Chunks are appended to CHUNKED_UPLOAD_DIR/<id>.part straight from the
+request stream, so a chunk is never held in memory. Abandoned uploads are
+removed by `manage.py cleanup_uploads`.
+"""
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+
+from .pdftext import file_sha256
+
+READ_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """Client error in the upload protocol; `status` is the HTTP status to return."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def upload_dir():
+    path = str(getattr(settings, 'CHUNKED_UPLOAD_DIR', os.path.join(settings.MEDIA_ROOT, 'uploads_tmp')))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def part_path(upload):
+    return os.path.join(upload_dir(), f'{upload.pk}.part')
+
+
+def append_chunk(upload, stream, offset, length):
+    """
+    Append `length` bytes read from `stream` at `offset`.
+    The offset must equal the bytes received so far; anything past it (from an
+    interrupted chunk) is truncated first. Returns the new offset.
+    """
+    if offset != upload.offset:
+        raise UploadError(f'expected offset {upload.offset}', status=409)
+    if length is None:
+        raise UploadError('Content-Length required', status=411)
+    if length <= 0:
+        raise UploadError('empty chunk: send at least one byte')
+    if length > getattr(settings, 'CHUNKED_UPLOAD_MAX_CHUNK', 8 * 1024 * 1024):
+        raise UploadError('chunk too large', status=413)
+    if offset + length > upload.size:
+        raise UploadError('chunk goes past the declared size')
+
+    path = part_path(upload)
+    with open(path, 'ab') as out:
+        out.truncate(offset)
+        out.seek(offset)
+        remaining = length
+        while remaining > 0:
+            data = stream.read(min(READ_SIZE, remaining))
+            if not data:
+                break
+            out.write(data)
+            remaining -= len(data)
+    if remaining:
+        # client went away mid-chunk: keep what was acknowledged before
+        with open(path, 'ab') as out:
+            out.truncate(offset)
+        raise UploadError('incomplete chunk')
+    return offset + length
+
+
+class AssembledFile(File):
+    """
+    The finished .part file. Exposes temporary_file_path() and content_hash
+    so the content-addressed storage moves it into place instead of copying.
+    """
+
+    def __init__(self, path, name, content_hash):
+        super().__init__(open(path, 'rb'), name=name)
+        self._path = path
+        self.content_hash = content_hash
+
+    def temporary_file_path(self):
+        return self._path
+
+
+def verify(upload):
+    """Check size and checksum of a fully received upload; returns the AssembledFile."""
+    path = part_path(upload)
+    if upload.offset != upload.size or not os.path.exists(path) or os.path.getsize(path) != upload.size:
+        raise UploadError('upload is not complete', status=409)
+    digest = file_sha256(path)
+    if digest != upload.sha256.lower():
+        raise UploadError('checksum mismatch', status=422)
+    return AssembledFile(path, upload.filename, digest)
+
+
+def discard(upload):
+    try:
+        os.unlink(part_path(upload))
+    except FileNotFoundError:
+        pass
+
+
+def collect_garbage(max_age=None, now=None):
+    """
+    Delete uploads that have not received data for `max_age`
+    (default CHUNKED_UPLOAD_EXPIRY seconds) and .part files with no upload row.
+    Returns the number of uploads removed.
+    """
+    from .models import ChunkedUpload
+
+    now = now or timezone.now()
+    if max_age is None:
+        max_age = timedelta(seconds=getattr(settings, 'CHUNKED_UPLOAD_EXPIRY', 24 * 3600))
+    stale = ChunkedUpload.objects.filter(updated_at__lt=now - max_age)
+    removed = 0
+    for upload in stale.iterator():
+        discard(upload)
+        removed += 1
+    stale.delete()
+
+    # leftovers from crashed processes
+    known = {str(pk) for pk in ChunkedUpload.objects.values_list('pk', flat=True)}
+    folder = upload_dir()
+    for entry in os.listdir(folder):
+        if entry.endswith('.part') and entry[:-len('.part')] not in known:
+            try:
+                os.unlink(os.path.join(folder, entry))
+            except FileNotFoundError:
+                pass
+    return removed
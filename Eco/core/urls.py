@@ -1,24 +1,55 @@
+from django.conf import settings
 from django.urls import path, include
-from . import views
+from . import api, async_views, feeds, sitemaps, views
 from django.contrib.auth import views as auth_views
 from django.contrib import admin
 from .views import DashboardView, AboutView, TeamView, ContactView
-from .views import track_visit
+from .forms import QueuedPasswordResetForm
+
+# the busiest pages as async views when serving through ASGI (core/async_views.py)
+pages = async_views if getattr(settings, 'ASYNC_VIEWS', False) else views
 
 urlpatterns = [
-    path('', views.IndexView.as_view(), name='index'),
+    path('', pages.IndexView.as_view(), name='index'),
     path('article/add/', views.ArticleCreateView.as_view(), name='article_add'),
-    path('article/<slug:slug>/', views.ArticleDetailView.as_view(), name='article_detail'),
+    path('article/<slug:slug>/', pages.ArticleDetailView.as_view(), name='article_detail'),
     path('article/<slug:slug>/edit/', views.ArticleUpdateView.as_view(), name='article_edit'),
+    path('article/<slug:slug>/attachment/', views.article_attachment, name='article_attachment'),
+    path('article/<slug:slug>/revisions/', views.article_revisions, name='article_revisions'),
+    path('article/<slug:slug>/revisions/<int:number>/', views.article_revision_diff, name='article_revision_diff'),
 
+    path('papers/', views.PaperListView.as_view(), name='paper_list'),
     path('paper/add/', views.PaperCreateView.as_view(), name='paper_add'),
+    path('paper/upload/', views.paper_upload_init, name='paper_upload_init'),
+    path('paper/upload/<uuid:upload_id>/', views.paper_upload_status, name='paper_upload_status'),
+    path('paper/upload/<uuid:upload_id>/chunk/', views.paper_upload_chunk, name='paper_upload_chunk'),
+    path('paper/upload/<uuid:upload_id>/finalize/', views.paper_upload_finalize, name='paper_upload_finalize'),
     path('paper/<slug:slug>/', views.PaperDetailView.as_view(), name='paper_detail'),
+    path('paper/<slug:slug>/pdf/', views.paper_pdf, name='paper_pdf'),
+
+    path('api/articles/', api.article_list, name='api_article_list'),
+    path('api/articles/<slug:slug>/', api.article_detail, name='api_article_detail'),
+    path('api/papers/', api.paper_list, name='api_paper_list'),
+    path('api/search/', api.search, name='api_search'),
+    path('api/trending/', api.trending_articles, name='api_trending'),
+
+    path('feeds/rss/', feeds.latest_rss, name='feed_rss'),
+    path('feeds/atom/', feeds.latest_atom, name='feed_atom'),
+    path('feeds/tag/<str:arg>/rss/', feeds.tag_rss, name='tag_feed_rss'),
+    path('feeds/tag/<str:arg>/atom/', feeds.tag_atom, name='tag_feed_atom'),
+    path('feeds/author/<str:arg>/rss/', feeds.author_rss, name='author_feed_rss'),
+    path('feeds/author/<str:arg>/atom/', feeds.author_atom, name='author_feed_atom'),
+    path('sitemap.xml', sitemaps.sitemap_index, name='sitemap_index'),
+    path('sitemap-pages.xml', sitemaps.sitemap_pages, name='sitemap_pages'),
+    path('sitemap-<str:section>-<int:shard>.xml', sitemaps.sitemap_shard, name='sitemap_shard'),
 
     path('signup/', views.signup_view, name='signup'),
-    path('search/', views.search_view, name='search'),
+    path('search/', pages.search_view, name='search'),
+    path('search/suggest/', views.search_suggest, name='search_suggest'),
     # Note: Django's auth urls (login/logout/password reset) added in project urls
     path("password-reset/",
          auth_views.PasswordResetView.as_view(
+             form_class=QueuedPasswordResetForm,
              template_name="core/password_reset/password_reset_form.html",
              email_template_name="core/password_reset/password_reset_email.html",
              subject_template_name="core/password_reset/password_reset_subject.txt",
@@ -45,7 +76,10 @@ urlpatterns = [
          ),
          name="password_reset_complete"),
     path('dashboard/', DashboardView.as_view(), name='dashboard'),
-    path('track-visit/', track_visit, name='track_visit'),
+    path('track-visit/', pages.track_visit, name='track_visit'),
+    path('stats/compression/', views.compression_stats_view, name='compression_stats'),
+    path('profiling/', views.profiling_view, name='profiling'),
+    path('metrics', views.metrics_view, name='metrics'),
     path('about/', AboutView.as_view(), name='about'),
     path('team/', TeamView.as_view(), name='team'),
     path('contact/', ContactView.as_view(), name='contact'),
@@ -2,7 +2,7 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, TemplateView, FormView
 from .models import Article, ResearchPaper, Visit
 from .forms import SignUpForm, ArticleForm, ResearchPaperForm
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.contrib.auth import login
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.db.models import Q, Sum
@@ -13,13 +13,33 @@ from django.shortcuts import redirect, render
 from django.core.exceptions import PermissionDenied
 from datetime import timedelta
 from django.utils import timezone
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.db.models import F
 from django.views.decorators.http import require_GET
 from django.core.paginator import Paginator
-from django.core.mail import EmailMessage
+from .tasks import send_email
 from django.contrib import messages
-from .forms import ContactForm
+from .forms import ContactForm, ChunkedPaperForm
+import os
+from django.http import Http404
+from django.conf import settings
+from django.views.decorators.http import require_http_methods
+from .downloads import serve_file
+from .search import unified_search
+from .compression import compression_stats
+from . import context_processors, loadshed, metrics, profiling, related, suggest, trending
+from .ratelimit import ratelimit
+from . import uploads
+from .models import ArticleRevision, ChunkedUpload
+from . import revisions
+import re
+import time
+
+
+def today_total(today):
+    """Sum of today's visits; while shedding load the last sum computed, or None."""
+    return loadshed.stale(f'visits_today:{today}', lambda: int(
+        Visit.objects.filter(date=today).aggregate(total=Sum('count'))['total'] or 0), 'visit_counters')
 
 
 # Basic index: list of published articles and papers
@@ -38,17 +58,24 @@ class IndexView(ListView):
         # today's date
         today = timezone.now().date()
 
-        # Global: sum of counts for today
-        total = Visit.objects.filter(date=today).aggregate(total=Sum('count'))['total'] or 0
-        ctx['total_visits_today'] = total
+        # Global: sum of counts for today (the last known sum while shedding load)
+        ctx['total_visits_today'] = today_total(today)
 
-        # Per-user: if logged in
+        # Per-user: if logged in (left out while shedding load)
         user_visits = 0
-        if self.request.user.is_authenticated:
+        if loadshed.skip('visit_counters'):
+            user_visits = None
+        elif self.request.user.is_authenticated:
             user_visits = Visit.objects.filter(user=self.request.user, date=today).aggregate(total=Sum('count'))[
                               'total'] or 0
         ctx['user_visits_today'] = user_visits
 
+        # most viewed lately (core/trending.py), cached
+        try:
+            ctx['trending'] = trending.top()
+        except Exception:
+            ctx['trending'] = []
+
         # Optionally expose recently viewed (if you like)
         recent_ids = self.request.session.get('recent_articles', [])[:6]
         if recent_ids:
@@ -63,6 +90,15 @@ class ArticleDetailView(DetailView):
     slug_field = 'slug'
     slug_url_kwarg = 'slug'
 
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        # precomputed neighbours (core/related.py)
+        try:
+            ctx['related_articles'] = list(related.for_article(self.object))
+        except Exception:
+            ctx['related_articles'] = []
+        return ctx
+
     def get(self, request, *args, **kwargs):
         # call the parent to build the response/context first
         response = super().get(request, *args, **kwargs)
@@ -98,6 +134,12 @@ class ArticleDetailView(DetailView):
             # never break the page for analytics bugs
             pass
 
+        # per-article view count for the trending list (buffered, see core/trending.py)
+        try:
+            trending.record_view(self.object.pk)
+        except Exception:
+            pass
+
         return response
 
 # Create / Edit mixins for role-based access
@@ -133,6 +175,7 @@ class ArticleCreateView(LoginRequiredMixin, EditorRequiredMixin, CreateView):
 
     def form_valid(self, form):
         form.instance.author = self.request.user
+        form.instance._revision_editor = self.request.user
         return super().form_valid(form)
 
 class ArticleUpdateView(LoginRequiredMixin, EditorRequiredMixin, UpdateView):
@@ -141,18 +184,221 @@ class ArticleUpdateView(LoginRequiredMixin, EditorRequiredMixin, UpdateView):
     template_name = 'core/article_form.html'
     success_url = reverse_lazy('index')
 
+    def form_valid(self, form):
+        # recorded on the revision saved by core/signals.py
+        form.instance._revision_editor = self.request.user
+        return super().form_valid(form)
+
+
+@require_GET
+def article_revisions(request, slug):
+    """Editors: list of saved versions of an article."""
+    user = request.user
+    if not (user.is_authenticated and (user.is_editor or user.is_admin)):
+        raise PermissionDenied
+    article = get_object_or_404(Article.objects.only('pk', 'slug', 'title'), slug=slug)
+    revisions = (ArticleRevision.objects.filter(article=article).select_related('editor')
+                 .only('number', 'is_snapshot', 'title', 'content_length', 'created_at', 'editor__username'))
+    page_obj = Paginator(revisions, 50).get_page(request.GET.get('page'))
+    return render(request, 'core/article_revisions.html', {'article': article, 'page_obj': page_obj})
+
+
+@require_GET
+def article_revision_diff(request, slug, number):
+    """Editors: unified diff of revision `number` against the previous one (or ?against=N)."""
+    user = request.user
+    if not (user.is_authenticated and (user.is_editor or user.is_admin)):
+        raise PermissionDenied
+    article = get_object_or_404(Article.objects.only('pk', 'slug', 'title'), slug=slug)
+    revision = get_object_or_404(ArticleRevision.objects.select_related('editor'), article=article, number=number)
+    if 'against' in request.GET:
+        try:
+            against = int(request.GET['against'])
+        except ValueError:
+            raise Http404
+    else:
+        # the previous revision still kept (pruning leaves gaps), or empty
+        against = (ArticleRevision.objects.filter(article=article, number__lt=number)
+                   .order_by('-number').values_list('number', flat=True).first() or 0)
+    if against and not ArticleRevision.objects.filter(article=article, number=against).exists():
+        raise Http404
+    lines = []
+    for line in revisions.diff_lines(article.pk, against, number):
+        if line.startswith(('+++', '---')):
+            css = 'diff-file'
+        elif line.startswith('@@'):
+            css = 'diff-hunk'
+        elif line.startswith('+'):
+            css = 'diff-add'
+        elif line.startswith('-'):
+            css = 'diff-del'
+        else:
+            css = ''
+        lines.append((css, line))
+    return render(request, 'core/revision_diff.html', {
+        'article': article, 'revision': revision, 'against': against, 'lines': lines,
+    })
+
 # Research paper views (similar)
 class PaperDetailView(DetailView):
     model = ResearchPaper
     template_name = 'core/article_detail.html'  # reuse detail template
     context_object_name = 'article'
 
+class PaperListView(ListView):
+    # paginated paper index, served by the same engine as search
+    template_name = 'core/paper_list.html'
+    context_object_name = 'hits'
+    paginate_by = 10
+
+    def get_queryset(self):
+        return unified_search(self.request.GET.get('q', '').strip(), kinds=('paper',))
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx['query'] = self.request.GET.get('q', '').strip()
+        return ctx
+
 class PaperCreateView(LoginRequiredMixin, EditorRequiredMixin, CreateView):
     model = ResearchPaper
     form_class = ResearchPaperForm
     template_name = 'core/article_form.html'
     success_url = reverse_lazy('index')
 
+# Chunked / resumable PDF uploads (protocol in core/uploads.py)
+SHA256_RE = re.compile(r'^[0-9a-fA-F]{64}$')
+
+
+def _editor_upload_or_404(request, upload_id):
+    user = request.user
+    if not (user.is_authenticated and (user.is_editor or user.is_admin)):
+        raise PermissionDenied
+    return get_object_or_404(ChunkedUpload, pk=upload_id, user=user)
+
+
+def _upload_state(upload):
+    return {
+        "upload_id": str(upload.pk),
+        "offset": upload.offset,
+        "size": upload.size,
+        "chunk_url": reverse('paper_upload_chunk', args=[upload.pk]),
+        "finalize_url": reverse('paper_upload_finalize', args=[upload.pk]),
+    }
+
+
+@require_http_methods(["POST"])
+def paper_upload_init(request):
+    user = request.user
+    if not (user.is_authenticated and (user.is_editor or user.is_admin)):
+        raise PermissionDenied
+    filename = os.path.basename(request.POST.get('filename', '').strip())
+    sha256 = request.POST.get('sha256', '').strip()
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        size = -1
+    max_size = getattr(settings, 'CHUNKED_UPLOAD_MAX_SIZE', 512 * 1024 * 1024)
+    if not filename or not SHA256_RE.match(sha256) or not 0 < size <= max_size:
+        return JsonResponse({"error": "filename, size and sha256 are required"}, status=400)
+    upload = ChunkedUpload.objects.create(user=user, filename=filename, size=size, sha256=sha256.lower())
+    return JsonResponse(_upload_state(upload), status=201)
+
+
+@require_GET
+def paper_upload_status(request, upload_id):
+    # clients call this after a dropped connection to learn where to resume
+    upload = _editor_upload_or_404(request, upload_id)
+    return JsonResponse(_upload_state(upload))
+
+
+@require_http_methods(["PUT", "POST"])
+def paper_upload_chunk(request, upload_id):
+    upload = _editor_upload_or_404(request, upload_id)
+    try:
+        offset = int(request.GET.get('offset', request.headers.get('Upload-Offset', '')))
+        length = request.headers.get('Content-Length')
+        length = int(length) if length not in (None, '') else None
+    except ValueError:
+        return JsonResponse({"error": "offset required", "offset": upload.offset}, status=400)
+    try:
+        # read straight from the request stream (never touch request.body)
+        new_offset = uploads.append_chunk(upload, request, offset, length)
+    except uploads.UploadError as exc:
+        return JsonResponse({"error": str(exc), "offset": upload.offset}, status=exc.status)
+    # guard against two clients racing on the same upload
+    if not ChunkedUpload.objects.filter(pk=upload.pk, offset=offset).update(offset=new_offset,
+                                                                             updated_at=timezone.now()):
+        upload.refresh_from_db()
+        return JsonResponse({"error": "conflicting chunk", "offset": upload.offset}, status=409)
+    return JsonResponse({"offset": new_offset, "complete": new_offset == upload.size})
+
+
+@require_http_methods(["POST"])
+def paper_upload_finalize(request, upload_id):
+    upload = _editor_upload_or_404(request, upload_id)
+
+    existing_slug = request.POST.get('paper', '').strip()
+    if existing_slug:
+        paper = get_object_or_404(ResearchPaper, slug=existing_slug)
+        # editors replace the PDFs of their own papers only
+        if not (request.user.is_admin or paper.uploaded_by_id == request.user.pk):
+            return JsonResponse({"error": "not your paper"}, status=403)
+        form = None
+    else:
+        form = ChunkedPaperForm(request.POST)
+        if not form.is_valid():
+            return JsonResponse({"errors": form.errors.get_json_data()}, status=400)
+        paper = form.save(commit=False)
+        paper.uploaded_by = request.user
+
+    try:
+        assembled = uploads.verify(upload)
+    except uploads.UploadError as exc:
+        return JsonResponse({"error": str(exc), "offset": upload.offset}, status=exc.status)
+
+    try:
+        # the content-addressed storage moves the .part file into place
+        paper.pdf.save(upload.filename, assembled, save=True)
+    finally:
+        assembled.close()
+    uploads.discard(upload)
+    upload.delete()
+    return JsonResponse({"paper": paper.slug, "url": reverse('paper_detail', args=[paper.slug])}, status=201)
+
+# File downloads (attachments and PDFs) with Range / ETag support
+def _can_view_unpublished(user, owner_id):
+    return user.is_authenticated and (user.is_editor or user.is_admin or user.pk == owner_id)
+
+
+@require_http_methods(["GET", "HEAD"])
+def article_attachment(request, slug):
+    article = get_object_or_404(Article.objects.only('pk', 'slug', 'published', 'author_id', 'attachment'), slug=slug)
+    if not article.published and not _can_view_unpublished(request.user, article.author_id):
+        raise Http404
+    if not article.attachment:
+        raise Http404
+    try:
+        ext = os.path.splitext(article.attachment.name)[1]
+        return serve_file(request, article.attachment, as_attachment=True, public=article.published,
+                          filename=article.slug + ext)
+    except FileNotFoundError:
+        raise Http404
+
+
+@require_http_methods(["GET", "HEAD"])
+def paper_pdf(request, slug):
+    paper = get_object_or_404(ResearchPaper.objects.only('pk', 'slug', 'published', 'uploaded_by_id', 'pdf'), slug=slug)
+    if not paper.published and not _can_view_unpublished(request.user, paper.uploaded_by_id):
+        raise Http404
+    if not paper.pdf:
+        raise Http404
+    try:
+        # inline so browsers open their PDF viewer (which issues Range requests)
+        return serve_file(request, paper.pdf, as_attachment=False, public=paper.published,
+                          filename=paper.slug + '.pdf')
+    except FileNotFoundError:
+        raise Http404
+
 # Signup
 def signup_view(request):
     if request.method == 'POST':
@@ -165,70 +411,28 @@ def signup_view(request):
         form = SignUpForm()
     return render(request, 'core/signup.html', {'form': form})
 
-# Simple search parser supporting AND / OR / phrase queries
-def parse_search_query(q):
-    import re
-    tokens = re.findall(r'"([^"]+)"|(\S+)', q)
-    cleaned = []
-    for t1, t2 in tokens:
-        token = t1 if t1 else t2
-        cleaned.append(token)
-    return cleaned
+def search_page(q, author, tag, category, page):
+    """One page of search results, fetched (also used by core/async_views.py)."""
+    # articles and papers, ranked and merged lazily (core/search.py)
+    results = unified_search(q, author=author, tag=tag, category=category)
+
+    paginator = Paginator(results, 8)
+    started = time.perf_counter()
+    page_obj = paginator.get_page(page)
+    # the results are lazy: time the count and the page actually fetched
+    page_obj.object_list = list(page_obj.object_list)
+    metrics.SEARCH_LATENCY.observe(time.perf_counter() - started)
+    metrics.SEARCH_QUERIES.inc(result='hit' if page_obj.object_list else 'empty')
+    return page_obj
 
+@ratelimit('search')
 def search_view(request):
     q = request.GET.get('q', '').strip()
     selected_author = request.GET.get('author', '').strip()
     selected_tag = request.GET.get('tag', '').strip()
     selected_category = request.GET.get('category', '').strip()
 
-    results = Article.objects.filter(published=True)
-
-    # text query
-    if q:
-        tokens = parse_search_query(q)
-        q_obj = None
-        current_op = 'AND'
-        for token in tokens:
-            if token.upper() == 'OR':
-                current_op = 'OR'
-                continue
-            token_q = (Q(title__icontains=token) |
-                       Q(content__icontains=token) |
-                       Q(summary__icontains=token) |
-                       Q(tags__icontains=token))
-            if q_obj is None:
-                q_obj = token_q
-            else:
-                if current_op == 'AND':
-                    q_obj = q_obj & token_q
-                else:
-                    q_obj = q_obj | token_q
-            current_op = 'AND'
-        if q_obj is not None:
-            results = results.filter(q_obj)
-
-    # author filter (id or username)
-    if selected_author:
-        try:
-            uid = int(selected_author)
-            results = results.filter(author__pk=uid)
-        except Exception:
-            results = results.filter(author__username__iexact=selected_author)
-
-    # tag filter (simple contains)
-    if selected_tag:
-        results = results.filter(tags__icontains=selected_tag)
-
-    # category filter (if Article has category field)
-    if selected_category and hasattr(Article, 'category'):
-        results = results.filter(category__iexact=selected_category)
-
-    results = results.distinct().order_by('-publish_date')
-
-    paginator = Paginator(results, 8)
-    page = request.GET.get('page')
-    page_obj = paginator.get_page(page)
-
+    page_obj = search_page(q, selected_author, selected_tag, selected_category, request.GET.get('page'))
     context = {
         'query': q,
         'page_obj': page_obj,
@@ -238,10 +442,24 @@ def search_view(request):
     }
     return render(request, 'core/search_results.html', context)
 
+
+@require_GET
+@ratelimit('suggest', json=True)
+def search_suggest(request):
+    """Typeahead for the search box: titles, tags and authors starting with ?q= (core/suggest.py)."""
+    q = request.GET.get('q', '').strip()[:100]
+    results = suggest.suggest(q) if q else []
+    return JsonResponse({'query': q, 'suggestions': results})
+
 # Basic context processor for recent articles (based on session)
 def recent_articles_context(request):
+    # async views have loaded these already (core.context_processors.aprepare)
+    ready = context_processors.prepared(request, 'recent_articles_session')
+    if ready is not None:
+        return ready
     recent_ids = request.session.get('recent_articles', [])
-    articles = Article.objects.filter(pk__in=recent_ids)
+    # order is restored below, skip the default -publish_date sort
+    articles = Article.objects.filter(pk__in=recent_ids).order_by()
     # Preserve order:
     ordered = sorted(articles, key=lambda a: recent_ids.index((a.pk)))
     return {'recent_articles_session': ordered}
@@ -267,6 +485,7 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         return ctx
 
 @require_GET
+@ratelimit('track_visit', json=True)
 def track_visit(request):
     """
     Endpoint to be polled by JS (every second). It increments today's Visit
@@ -292,6 +511,7 @@ def track_visit(request):
         sk = None
 
     # increment (atomic) for the relevant Visit row
+    metrics.VISIT_WRITES.inc(source="track_visit")
     if user:
         visit_obj, created = Visit.objects.get_or_create(user=user, date=today, defaults={"count": 0})
         Visit.objects.filter(pk=visit_obj.pk).update(count=F("count") + 1)
@@ -304,13 +524,66 @@ def track_visit(request):
         user_count = visit_obj.count
 
     # global total for today
-    total = Visit.objects.filter(date=today).aggregate(total=Sum("count"))["total"] or 0
+    total = today_total(today)
 
     return JsonResponse({
-        "total_today": int(total),
+        "total_today": total,
         "user_today": int(user_count),
     })
 
+@require_GET
+def compression_stats_view(request):
+    """Staff-only: response compression ratio and CPU time per route (see core/metrics.py)."""
+    _require_staff(request)
+    return JsonResponse({"routes": compression_stats()})
+
+def _require_staff(request):
+    user = request.user
+    if not (user.is_authenticated and (user.is_staff or user.is_admin)):
+        raise PermissionDenied
+
+@require_http_methods(["GET", "POST"])
+def profiling_view(request):
+    """
+    Staff-only: views profiled by ProfilingMiddleware, with downloads of
+    their stacks (?format=collapsed|speedscope[&view=name]); POST clears them.
+    """
+    _require_staff(request)
+    if request.method == "POST":
+        profiling.reset()
+        messages.success(request, "Profiles cleared.")
+        return redirect("profiling")
+
+    fmt = request.GET.get("format")
+    if fmt:
+        view_name = request.GET.get("view") or None
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "-", view_name or "all")
+        if fmt == "collapsed":
+            response = HttpResponse(profiling.collapsed(view_name), content_type="text/plain; charset=utf-8")
+            filename = f"profile-{slug}.folded"
+        elif fmt == "speedscope":
+            response = HttpResponse(profiling.speedscope(view_name), content_type="application/json")
+            filename = f"profile-{slug}.speedscope.json"
+        else:
+            raise Http404("Unknown profile format")
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+    return render(request, "core/profiling.html", {
+        "profiles": profiling.profile_summary(),
+        "enabled": getattr(settings, "PROFILER_ENABLED", False),
+        "sample_rate": getattr(settings, "PROFILER_SAMPLE_RATE", 0.0),
+        "header": getattr(settings, "PROFILER_HEADER", "X-Profile"),
+    })
+
+@require_GET
+def metrics_view(request):
+    """Prometheus text format (core/metrics.py); for METRICS_ALLOWED_IPS or staff."""
+    allowed = getattr(settings, "METRICS_ALLOWED_IPS", ("127.0.0.1", "::1"))
+    if request.META.get("REMOTE_ADDR") not in allowed:
+        _require_staff(request)
+    return HttpResponse(metrics.render_text(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 class AboutView(TemplateView):
     template_name = "core/about.html"
 
@@ -323,7 +596,6 @@ class ContactView(FormView):
     success_url = reverse_lazy('contact')  # or reverse_lazy('contact') to stay on page
 
     def form_valid(self, form):
-        # send email using console email backend in development
         name = form.cleaned_data['name']
         email = form.cleaned_data['email']
         subject = form.cleaned_data['subject']
@@ -331,23 +603,9 @@ class ContactView(FormView):
 
         full_message = f"Contact form submitted\n\nFrom: {name} <{email}>\n\nMessage:\n{message}"
 
-        # Use EmailMessage to send via configured backend (console for dev)
-        try:
-            email_msg = EmailMessage(
-                subject=f"[Contact] {subject}",
-                body=full_message,
-                from_email=None,  # will use DEFAULT_FROM_EMAIL if set in settings
-                to=[self.request.site_admin_email] if hasattr(self.request, 'site_admin_email') else None,
-            )
-            # If no recipient supplied above, fallback to DEFAULT_FROM_EMAIL (console backend just prints)
-            if not email_msg.to or email_msg.to == [None]:
-                # send to DEFAULT_FROM_EMAIL if configured; otherwise console will still print
-                email_msg.to = [None]
-
-            email_msg.send(fail_silently=False)
-        except Exception:
-            # don't break on email errors for demo
-            pass
+        # the worker (manage.py run_tasks) sends it; the request only queues it
+        recipient = getattr(self.request, 'site_admin_email', None) or settings.DEFAULT_FROM_EMAIL
+        send_email.delay(subject=f"[Contact] {subject}", body=full_message, to=[recipient], reply_to=[email])
 
         messages.success(self.request, "Thanks — your message was submitted. We'll get back to you soon.")
         return super().form_valid(form)
\ No newline at end of file